@@ -1,40 +1,40 @@
+import hashlib
 import json
+import time
 from datetime import datetime
 
+import openai
 
-def get_enrichment_prompt(
-    full_csv_data,
-    pre_extracted_products,
-    shipper_list,
-    brand_keywords,
-    category_keywords,
-    current_date_str,
-):
-    """
-    Generates a prompt for the AI to enrich pre-extracted data.
-    The AI's job is to find global info and add semantic tags (brand/category) to products.
-    """
-    # Convert the list of product dicts to a compact JSON string for the prompt
-    products_json_str = json.dumps(pre_extracted_products, ensure_ascii=False, indent=2)
+from call_metrics import payload_size, track_call
+from json_stream import EnrichmentStreamParser
 
-    prompt = f"""
-You are an expert data enrichment AI. I have already processed an Excel file and extracted the core product data. Your task is to analyze this pre-extracted data along with the full context of the original file to add semantic information.
+AI_MODEL = "gpt-4o"
+# Retries are done here (the client is created with max_retries=0) so they can be counted.
+AI_MAX_RETRIES = 2
+# log progress every N products while a streamed answer is coming in
+STREAM_PROGRESS_EVERY = 50
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError,
+)
 
-**CONTEXT: FULL ORIGINAL FILE (in CSV format):**
-```csv
-{full_csv_data}
-```
 
-**PRE-EXTRACTED PRODUCTS:**
-```json
-{products_json_str}
-```
+def get_enrichment_instructions(shipper_list, brand_keywords, category_keywords):
+    """The part of the prompt that is the same for every file of a run.
+
+    It goes first so the provider can serve it from its prompt cache; the matching
+    lists make up most of the prompt and must not be preceded by per-file content.
+    """
+    prompt = """
+You are an expert data enrichment AI. I have already processed an Excel file and extracted the core product data. Your task is to analyze this pre-extracted data along with the full context of the original file (both given at the end of this message) to add semantic information.
 
 **YOUR TASKS:**
 
-1.  **Find Global Information:** From the **FULL ORIGINAL FILE CONTEXT** above, find the following:
+1.  **Find Global Information:** From the **FULL ORIGINAL FILE CONTEXT** below, find the following:
     *   `寄件廠商`: Find a cell that **exactly matches** one of the names in the "Valid Shipper List".
-    *   `結單日期`: Find a cell containing keywords like '結單日', '結單日期', '訂購截止日', '最後回單日'. Extract its corresponding date value. **If the year is not specified, infer it by choosing the closest future date relative to today, {current_date_str}.** Finally, format the result as "YYYY-MM-DD".
+    *   `結單日期`: Find a cell containing keywords like '結單日', '結單日期', '訂購截止日', '最後回單日'. Extract its corresponding date value. **If the year is not specified, infer it by choosing the closest future date relative to today's date (given with the file below).** Finally, format the result as "YYYY-MM-DD".
 
 2.  **Enrich Product Data:** For each product in the **PRE-EXTRACTED PRODUCTS** list, perform the following analysis based on all available information:
     *   `預計發售月份`: Analyze the value of this field. It can be in various formats (e.g., "2026年3月底", "2025-11-01 00:00:00", "2025.11"). Your task is to parse it and **replace its original value** with the standardized `YYYY-MM` format.
@@ -52,8 +52,8 @@ You are an expert data enrichment AI. I have already processed an Excel file and
 **VALID LISTS FOR MATCHING:**
 
 **Valid Shipper List:**
-{shipper_list}
 """
+    prompt += f"{shipper_list}\n"
     if brand_keywords:
         prompt += f"""
 **Valid Brand Keyword List:**
@@ -68,6 +68,94 @@ You are an expert data enrichment AI. I have already processed an Excel file and
     return prompt
 
 
+def get_enrichment_prompt(
+    full_csv_data,
+    pre_extracted_products,
+    shipper_list,
+    brand_keywords,
+    category_keywords,
+    current_date_str,
+    instructions=None,
+):
+    """
+    Generates a prompt for the AI to enrich pre-extracted data.
+    The AI's job is to find global info and add semantic tags (brand/category) to products.
+    Static instructions and lists come first, the file's own data last; pass
+    `instructions` if get_enrichment_instructions was already called for them.
+    """
+    # Convert the list of product dicts to a compact JSON string for the prompt
+    products_json_str = json.dumps(
+        [dict(p.items()) for p in pre_extracted_products], ensure_ascii=False, indent=2
+    )
+
+    if instructions is None:
+        instructions = get_enrichment_instructions(
+            shipper_list, brand_keywords, category_keywords
+        )
+    prompt = (
+        instructions
+        + f"""
+**TODAY'S DATE:** {current_date_str}
+
+**CONTEXT: FULL ORIGINAL FILE (in CSV format):**
+```csv
+{full_csv_data}
+```
+
+**PRE-EXTRACTED PRODUCTS:**
+```json
+{products_json_str}
+```
+"""
+    )
+    return prompt
+
+
+def build_enrichment_request(
+    full_csv_data,
+    pre_extracted_products,
+    shipper_list,
+    brand_keywords,
+    category_keywords,
+    current_date_str=None,
+):
+    """Chat-completions request body for one file; shared by sync and batch mode."""
+    if current_date_str is None:
+        current_date_str = datetime.now().strftime("%Y-%m-%d")
+    instructions = get_enrichment_instructions(
+        shipper_list, brand_keywords, category_keywords
+    )
+    prompt = get_enrichment_prompt(
+        full_csv_data,
+        pre_extracted_products,
+        shipper_list,
+        brand_keywords,
+        category_keywords,
+        current_date_str,
+        instructions=instructions,
+    )
+    return {
+        "model": AI_MODEL,
+        "messages": [
+            {
+                "role": "system",
+                "content": "You are an AI assistant that enriches structured JSON data based on context and rules.",
+            },
+            {"role": "user", "content": prompt},
+        ],
+        "temperature": 0,
+        "response_format": {"type": "json_object"},
+        # routes requests sharing the instruction prefix to the same prompt cache
+        "prompt_cache_key": "enrichment-"
+        + hashlib.sha256(instructions.encode("utf-8")).hexdigest()[:16],
+    }
+
+
+def save_debug_prompt(request, debug, debug_name):
+    """Queue the prompt in the run's debug archive (a debug_capture.DebugCapture)."""
+    debug.add(f"{debug_name}_enrichment_prompt.txt", request["messages"][-1]["content"])
+
+
 def call_ai_for_enrichment(
     client,
     full_csv_data,
@@ -76,9 +164,16 @@ def call_ai_for_enrichment(
     brand_keywords,
     category_keywords,
     logger,
-    debug_path_prefix=None,
+    debug=None,
+    debug_name=None,
+    recorder=None,
+    source=None,
 ):
-    """Calls the AI to enrich pre-extracted product data."""
+    """Calls the AI to enrich pre-extracted product data.
+
+    `recorder` (a call_metrics.CallRecorder) receives latency, bytes, token usage and
+    retries for the call, attributed to `source` (usually the vendor file name).
+    """
     if not client:
         logger("OpenAI client not configured. Please set your OPENAI_API_KEY.")
         return None
@@ -86,42 +181,178 @@ def call_ai_for_enrichment(
         logger("No pre-extracted products to enrich.")
         return None
 
-    current_date_str = datetime.now().strftime("%Y-%m-%d")
-    prompt = get_enrichment_prompt(
+    request = build_enrichment_request(
         full_csv_data,
         pre_extracted_products,
         shipper_list,
         brand_keywords,
         category_keywords,
-        current_date_str,
     )
 
-    if debug_path_prefix:
-        try:
-            prompt_filename = f"{debug_path_prefix}_enrichment_prompt.txt"
-            with open(prompt_filename, "w", encoding="utf-8") as f:
-                f.write(prompt)
-            logger(f"AI enrichment prompt saved to: {prompt_filename}")
-        except Exception as e:
-            logger(f"Error saving AI enrichment prompt: {e}")
+    if debug is not None and debug_name:
+        save_debug_prompt(request, debug, debug_name)
 
     logger("Calling OpenAI API for data enrichment...")
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an AI assistant that enriches structured JSON data based on context and rules.",
-                },
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0,
-            response_format={"type": "json_object"},
+        response = create_chat_completion(
+            client, request, logger, recorder=recorder, source=source
         )
         logger("Successfully received response from AI for enrichment.")
         return response.choices[0].message.content
     except Exception as e:
         logger(f"Error calling OpenAI API for enrichment: {e}")
         return None
+
+
+def record_usage(record, usage):
+    """Copy token counts from an OpenAI `usage` object into a call record."""
+    if usage is None:
+        return
+    record["prompt_tokens"] = getattr(usage, "prompt_tokens", 0) or 0
+    record["completion_tokens"] = getattr(usage, "completion_tokens", 0) or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    record["cached_tokens"] = getattr(details, "cached_tokens", 0) or 0
+
+
+def log_usage(record, logger):
+    if record.get("prompt_tokens"):
+        logger(
+            f"AI 用量: 輸入 {record['prompt_tokens']} tokens"
+            f"（快取命中 {record['cached_tokens']}），輸出 {record['completion_tokens']} tokens。"
+        )
+
+
+def create_chat_completion(client, request, logger, recorder=None, source=None):
+    """Run one chat completion with retries on transient errors, recording the call."""
+    with track_call(
+        recorder,
+        "openai.chat.completions",
+        source=source,
+        request_bytes=payload_size(request),
+    ) as record:
+        for attempt in range(AI_MAX_RETRIES + 1):
+            try:
+                raw = client.chat.completions.with_raw_response.create(**request)
+                break
+            except RETRYABLE_ERRORS as e:
+                if attempt == AI_MAX_RETRIES:
+                    raise
+                record["retries"] += 1
+                delay = 2**attempt
+                logger(f"OpenAI API 暫時性錯誤 ({e})，{delay} 秒後重試...")
+                time.sleep(delay)
+        response = raw.parse()
+        record["response_bytes"] = len(raw.content)
+        record_usage(record, response.usage)
+        log_usage(record, logger)
+        return response
+
+
+def stream_ai_for_enrichment(
+    client,
+    full_csv_data,
+    pre_extracted_products,
+    shipper_list,
+    brand_keywords,
+    category_keywords,
+    logger,
+    on_product,
+    debug=None,
+    debug_name=None,
+    recorder=None,
+    source=None,
+):
+    """Streamed variant of `call_ai_for_enrichment`.
+
+    `on_product(dict)` is called for every product as soon as the model has finished
+    writing it; with no products only the global_info is asked for. Returns the `EnrichmentStreamParser` (global_info, complete, text()),
+    or None if nothing could be requested. If the stream breaks off, the products
+    received so far have already been handed to `on_product` and `complete` is False.
+    """
+    if not client:
+        logger("OpenAI client not configured. Please set your OPENAI_API_KEY.")
+        return None
+
+    # an empty product list still asks for the file's global_info
+    request = build_enrichment_request(
+        full_csv_data,
+        pre_extracted_products,
+        shipper_list,
+        brand_keywords,
+        category_keywords,
+    )
+    if debug is not None and debug_name:
+        save_debug_prompt(request, debug, debug_name)
+
+    logger("Calling OpenAI API for data enrichment (streaming)...")
+    parser = EnrichmentStreamParser()
+    try:
+        stream_chat_completion(
+            client,
+            request,
+            logger,
+            parser,
+            on_product,
+            recorder=recorder,
+            source=source,
+        )
+    except openai.OpenAIError as e:
+        received = parser.products_seen - len(parser.failed)
+        if received:
+            logger(f"AI 串流回應中斷 ({e})，保留已收到的 {received} 個商品。")
+        else:
+            logger(f"Error calling OpenAI API for enrichment: {e}")
+        return parser
+    if parser.complete:
+        logger("Successfully received response from AI for enrichment.")
+    return parser
+
+
+def stream_chat_completion(
+    client, request, logger, parser, on_product, recorder=None, source=None
+):
+    """Stream one chat completion into `parser`, calling on_product per finished product.
+
+    Transient errors are retried only until the first token arrives; after that a
+    retry would repeat products that were already handed out.
+    """
+    with track_call(
+        recorder,
+        "openai.chat.completions.stream",
+        source=source,
+        request_bytes=payload_size(request),
+    ) as record:
+        for attempt in range(AI_MAX_RETRIES + 1):
+            try:
+                stream = client.chat.completions.create(
+                    stream=True, stream_options={"include_usage": True}, **request
+                )
+                break
+            except RETRYABLE_ERRORS as e:
+                if attempt == AI_MAX_RETRIES:
+                    raise
+                record["retries"] += 1
+                delay = 2**attempt
+                logger(f"OpenAI API 暫時性錯誤 ({e})，{delay} 秒後重試...")
+                time.sleep(delay)
+        first_token = True
+        reported = 0
+        for chunk in stream:
+            if chunk.usage is not None:
+                record_usage(record, chunk.usage)
+            if not chunk.choices:
+                continue
+            text = chunk.choices[0].delta.content
+            if not text:
+                continue
+            if first_token:
+                first_token = False
+                record["first_token_s"] = round(time.time() - record["started_at"], 3)
+            record["response_bytes"] += len(text.encode("utf-8"))
+            for product in parser.feed(text):
+                on_product(product)
+            if parser.products_seen - reported >= STREAM_PROGRESS_EVERY:
+                reported = parser.products_seen
+                logger(f"AI 回應中... 已收到 {reported} 個商品。")
+        log_usage(record, logger)
@@ -0,0 +1,322 @@
+"""OpenAI Batch API mode for the enrichment step.
+
+For large, non-urgent runs every file's enrichment request (the same body the
+synchronous path sends, see `ai_api.build_enrichment_request`) is written to one JSONL
+file, submitted as a batch job, polled until it finishes, and the results are mapped
+back to the files by custom_id. Batch requests are billed at a lower rate and are not
+subject to the per-minute limits of synchronous calls.
+
+`LocalBatchClient` is an offline stand-in for the Files + Batches endpoints. It runs
+each request through a chat client (e.g. one pointed at `mock_openai_server`) or, with
+no client, answers with the mock server's canned enrichment directly.
+"""
+
+import io
+import json
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+import openai
+
+from ai_api import record_usage
+from call_metrics import payload_size, record_call, track_call
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+BATCH_POLL_INTERVAL_S = 30
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+def build_batch_jsonl(requests):
+    """JSONL text for {custom_id: chat-completions request body}."""
+    lines = []
+    for custom_id, body in requests.items():
+        lines.append(
+            json.dumps(
+                {
+                    "custom_id": custom_id,
+                    "method": "POST",
+                    "url": BATCH_ENDPOINT,
+                    "body": body,
+                },
+                ensure_ascii=False,
+            )
+        )
+    return "\n".join(lines) + "\n"
+
+
+def parse_batch_output(text):
+    """Map custom_id -> response body (dict) or None for failed requests."""
+    results = {}
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        response = entry.get("response") or {}
+        if entry.get("error") or response.get("status_code") != 200:
+            results[entry["custom_id"]] = None
+        else:
+            results[entry["custom_id"]] = response.get("body")
+    return results
+
+
+def _file_text(content):
+    text = getattr(content, "text", None)
+    if text is None:
+        text = content.read().decode("utf-8")
+    return text
+
+
+def run_enrichment_batch(
+    client,
+    requests,
+    logger,
+    poll_interval=BATCH_POLL_INTERVAL_S,
+    timeout=None,
+    recorder=None,
+    jsonl_path=None,
+):
+    """Submit `requests` ({custom_id: body}) as one batch and wait for it.
+
+    Returns {custom_id: message content or None}. The JSONL is also written to
+    `jsonl_path` when given. Raises if the batch cannot be created or ends failed.
+    """
+    if not requests:
+        return {}
+    jsonl = build_batch_jsonl(requests)
+    if jsonl_path:
+        try:
+            with open(jsonl_path, "w", encoding="utf-8") as f:
+                f.write(jsonl)
+            logger(f"批次請求檔已儲存至: {jsonl_path}")
+        except OSError as e:
+            logger(f"儲存批次請求檔時發生錯誤: {e}")
+
+    data = jsonl.encode("utf-8")
+    batch_file = record_call(
+        recorder,
+        "openai.files.create",
+        client.files.create,
+        file=("enrichment_batch.jsonl", io.BytesIO(data)),
+        purpose="batch",
+        request_bytes=len(data),
+    )
+    with track_call(recorder, "openai.batches.create"):
+        batch = client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=BATCH_COMPLETION_WINDOW,
+        )
+    logger(f"已送出批次工作 {batch.id}（{len(requests)} 個請求），等待完成中...")
+
+    started = time.monotonic()
+    last_status = None
+    while batch.status not in TERMINAL_STATUSES:
+        if timeout is not None and time.monotonic() - started > timeout:
+            raise TimeoutError(f"Batch {batch.id} did not finish within {timeout}s")
+        time.sleep(poll_interval)
+        batch = record_call(
+            recorder, "openai.batches.retrieve", client.batches.retrieve, batch.id
+        )
+        counts = getattr(batch, "request_counts", None)
+        status = (
+            batch.status,
+            getattr(counts, "completed", None),
+            getattr(counts, "failed", None),
+        )
+        if status != last_status:
+            progress = ""
+            if counts is not None:
+                progress = (
+                    f"（完成 {counts.completed}/{counts.total}，失敗 {counts.failed}）"
+                )
+            logger(f"批次工作 {batch.id} 狀態: {batch.status}{progress}")
+            last_status = status
+
+    if batch.status != "completed":
+        raise RuntimeError(f"Batch {batch.id} ended with status '{batch.status}'")
+
+    results = {custom_id: None for custom_id in requests}
+    if batch.output_file_id:
+        output = _file_text(
+            record_call(
+                recorder,
+                "openai.files.content",
+                client.files.content,
+                batch.output_file_id,
+            )
+        )
+        for custom_id, body in parse_batch_output(output).items():
+            if body is None:
+                continue
+            # one record per request so token usage is attributed per file
+            with track_call(
+                recorder,
+                "openai.batch.chat.completions",
+                source=custom_id,
+                request_bytes=payload_size(requests.get(custom_id)),
+            ) as record:
+                record["response_bytes"] = payload_size(body)
+                record_usage(record, _usage_namespace(body.get("usage")))
+            try:
+                results[custom_id] = body["choices"][0]["message"]["content"]
+            except (KeyError, IndexError, TypeError):
+                results[custom_id] = None
+    failed = [custom_id for custom_id, content in results.items() if content is None]
+    if failed:
+        logger(f"批次工作中有 {len(failed)} 個請求失敗: {', '.join(failed)}")
+    return results
+
+
+def _usage_namespace(usage):
+    if not usage:
+        return None
+    details = usage.get("prompt_tokens_details") or {}
+    return SimpleNamespace(
+        prompt_tokens=usage.get("prompt_tokens", 0),
+        completion_tokens=usage.get("completion_tokens", 0),
+        prompt_tokens_details=SimpleNamespace(
+            cached_tokens=details.get("cached_tokens", 0)
+        ),
+    )
+
+
+# --- offline stand-in ---
+
+
+def echo_completion(body):
+    """A chat.completion body with the mock server's enrichment of the request's products."""
+    # the mock server is a development tool; only the offline stand-in loads it
+    from mock_openai_server import enrichment_content
+
+    prompt = body["messages"][-1]["content"]
+    content = enrichment_content(prompt)
+    return {
+        "id": f"chatcmpl-local-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", ""),
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": len(prompt) // 4,
+            "completion_tokens": len(content) // 4,
+            "total_tokens": (len(prompt) + len(content)) // 4,
+        },
+    }
+
+
+class _LocalFiles:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def create(self, file, purpose):
+        name, handle = file if isinstance(file, tuple) else ("upload.jsonl", file)
+        data = handle.read() if hasattr(handle, "read") else bytes(handle)
+        file_id = f"file-local-{uuid.uuid4().hex[:12]}"
+        with self._owner._lock:
+            self._owner._files[file_id] = data
+        return SimpleNamespace(
+            id=file_id, filename=name, purpose=purpose, bytes=len(data)
+        )
+
+    def content(self, file_id):
+        with self._owner._lock:
+            data = self._owner._files[file_id]
+        return SimpleNamespace(content=data, text=data.decode("utf-8"))
+
+
+class _LocalBatches:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def create(self, input_file_id, endpoint, completion_window, metadata=None):
+        owner = self._owner
+        with owner._lock:
+            lines = owner._files[input_file_id].decode("utf-8").splitlines()
+        batch = SimpleNamespace(
+            id=f"batch-local-{uuid.uuid4().hex[:12]}",
+            status="validating",
+            endpoint=endpoint,
+            input_file_id=input_file_id,
+            output_file_id=None,
+            error_file_id=None,
+            request_counts=SimpleNamespace(
+                total=sum(1 for line in lines if line.strip()), completed=0, failed=0
+            ),
+        )
+        with owner._lock:
+            owner._batches[batch.id] = batch
+        threading.Thread(
+            target=owner._process, args=(batch, lines), daemon=True
+        ).start()
+        return SimpleNamespace(**vars(batch))
+
+    def retrieve(self, batch_id):
+        with self._owner._lock:
+            return SimpleNamespace(**vars(self._owner._batches[batch_id]))
+
+
+class LocalBatchClient:
+    """In-process stand-in for `client.files` and `client.batches`."""
+
+    def __init__(self, chat_client=None, processing_delay=0.0):
+        self.chat_client = chat_client
+        self.processing_delay = processing_delay
+        self.files = _LocalFiles(self)
+        self.batches = _LocalBatches(self)
+        self._files = {}
+        self._batches = {}
+        self._lock = threading.Lock()
+
+    def _complete(self, body):
+        if self.chat_client is None:
+            return echo_completion(body)
+        response = self.chat_client.chat.completions.create(**body)
+        return response.model_dump()
+
+    def _process(self, batch, lines):
+        with self._lock:
+            batch.status = "in_progress"
+        output = []
+        for line in lines:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if self.processing_delay:
+                time.sleep(self.processing_delay)
+            try:
+                body = self._complete(entry["body"])
+                result = {"status_code": 200, "body": body}
+                error = None
+            except (openai.OpenAIError, ValueError) as e:
+                result = None
+                error = {"code": type(e).__name__, "message": str(e)}
+            output.append(
+                json.dumps(
+                    {
+                        "id": f"batch_req_{uuid.uuid4().hex[:12]}",
+                        "custom_id": entry["custom_id"],
+                        "response": result,
+                        "error": error,
+                    },
+                    ensure_ascii=False,
+                )
+            )
+            with self._lock:
+                if error:
+                    batch.request_counts.failed += 1
+                else:
+                    batch.request_counts.completed += 1
+        output_id = f"file-local-{uuid.uuid4().hex[:12]}"
+        with self._lock:
+            self._files[output_id] = ("\n".join(output) + "\n").encode("utf-8")
+            batch.output_file_id = output_id
+            batch.status = "completed"
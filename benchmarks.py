@@ -0,0 +1,262 @@
+"""Micro-benchmarks for the Python side of the pipeline, on synthetic vendor workbooks.
+
+Measures extract_products_from_excel (and its streaming variant), the brand scan,
+build_final_df and generate_erp_excel for several workbook sizes, plus the raw sheet
+read with each available `excel_reader` engine (also on a copy whose used range is
+inflated with formatted empty rows/columns) and reports median wall time, rows per
+second and peak allocated memory (tracemalloc, measured in a separate run so it does
+not distort the timings).
+
+    python benchmarks.py --rows 1000 10000 --repeat 3 --json bench.json
+    python benchmarks.py --rows 10000 --baseline bench.json   # fail if >20% slower
+
+    python benchmarks.py --rows 1000 --memory-rows 100000  # dicts vs ProductRecord
+
+Generated workbooks are cached in --workdir so repeated runs compare the same input.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from data_processor import (
+    build_final_df,
+    extract_products_from_excel,
+    generate_erp_excel,
+    scan_brands,
+    stream_products_from_excel,
+)
+from excel_reader import CalamineWorkbook, read_sheet
+from records import OrderLine, ProductRecord
+from synthetic_orders import DEFAULT_BRANDS, generate_vendor_workbook
+
+
+class NullLogger:
+    """Swallows log output."""
+
+    def __call__(self, message):
+        pass
+
+
+def _reference_maps(brands):
+    brand_map = {
+        b.lower(): {"code": f"{i:04d}", "display_name": b} for i, b in enumerate(brands)
+    }
+    category1_map = {
+        kw: {"類1": f"C{i:03d}", "suffix": "", "command": "保留" if i % 2 else ""}
+        for i, kw in enumerate(["ねんどろいど", "figma", "一番賞", "景品", "比例模型"])
+    }
+    keywords_sorted = sorted(category1_map, key=len, reverse=True)
+    return brand_map, category1_map, keywords_sorted
+
+
+def _enriched(products, brands):
+    """Simulate the AI step: tag each product with a brand and a normalized month."""
+    global_info = {
+        "寄件廠商": "萬榮",
+        "結單日期": "2026/01/26",
+        "內部結單日期": "2026/01/26",
+    }
+    rows = []
+    for i, p in enumerate(products):
+        p = dict(p)
+        p["偵測到的品牌"] = brands[i % len(brands)]
+        p["預計發售月份"] = "2026-03"
+        rows.append({"global_info": global_info, "product_data": p})
+    return rows
+
+
+def measure(fn, repeat):
+    """Return (median seconds, min seconds, peak bytes) for calling fn()."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return statistics.median(times), min(times), peak
+
+
+def read_engines():
+    engines = ["pandas", "openpyxl"]
+    if CalamineWorkbook is not None:
+        engines.append("calamine")
+    return engines
+
+
+def run_benchmarks(sizes, repeat, workdir, brands=DEFAULT_BRANDS):
+    results = []
+    log = NullLogger()
+    brand_map, category1_map, keywords_sorted = _reference_maps(brands)
+    for n in sizes:
+        path = os.path.join(workdir, f"vendor_{n}.xlsx")
+        if not os.path.exists(path):
+            print(f"Generating {n}-row workbook...", file=sys.stderr)
+            generate_vendor_workbook(path, n, seed=n)
+        inflated_path = os.path.join(workdir, f"vendor_{n}_inflated.xlsx")
+        if not os.path.exists(inflated_path):
+            print(
+                f"Generating {n}-row workbook with inflated range...", file=sys.stderr
+            )
+            generate_vendor_workbook(
+                inflated_path, n, seed=n, inflate_rows=n, inflate_cols=30
+            )
+
+        products, _ = extract_products_from_excel(path, log)
+        raw_df = read_sheet(path)
+        all_products = _enriched(products, brands)
+        final_df = build_final_df(
+            all_products, brand_map, category1_map, keywords_sorted, log
+        )
+        out_path = os.path.join(workdir, f"erp_{n}.xlsx")
+
+        # bind the per-size inputs as defaults so each case keeps its own workbook
+        cases = {
+            "extract_products_from_excel": lambda path=path: (
+                extract_products_from_excel(path, log)
+            ),
+            "stream_products_from_excel": lambda path=path: sum(
+                1 for _ in stream_products_from_excel(path, log)[0]
+            ),
+            "scan_brands": lambda raw_df=raw_df: scan_brands(raw_df, brands),
+            "build_final_df": lambda all_products=all_products: build_final_df(
+                all_products, brand_map, category1_map, keywords_sorted, log
+            ),
+            "generate_erp_excel": lambda final_df=final_df, out_path=out_path: (
+                generate_erp_excel(final_df, out_path, log)
+            ),
+        }
+        for engine in read_engines():
+            cases[f"read_sheet[{engine}]"] = lambda e=engine, path=path: read_sheet(
+                path, engine=e
+            )
+            cases[f"read_sheet_inflated[{engine}]"] = (
+                lambda e=engine, path=inflated_path: read_sheet(path, engine=e)
+            )
+        for name, fn in cases.items():
+            median, best, peak = measure(fn, repeat)
+            results.append(
+                {
+                    "benchmark": name,
+                    "rows": n,
+                    "products": len(products),
+                    "median_s": median,
+                    "min_s": best,
+                    "rows_per_s": n / median if median else float("inf"),
+                    "peak_mb": peak / 1024 / 1024,
+                }
+            )
+            print(
+                f"{name:<28} {n:>7} rows  {median:8.3f}s  "
+                f"{results[-1]['rows_per_s']:>10.0f} rows/s  {results[-1]['peak_mb']:8.1f} MB"
+            )
+    return results
+
+
+def _retained(build):
+    """Bytes still allocated after build() returns (its result is kept alive)."""
+    tracemalloc.start()
+    try:
+        result = build()
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return current
+
+
+def record_memory(n, workdir):
+    """Memory held by n parsed products: plain dicts vs ProductRecord/OrderLine."""
+    path = os.path.join(workdir, f"vendor_{n}.xlsx")
+    if not os.path.exists(path):
+        print(f"Generating {n}-row workbook...", file=sys.stderr)
+        generate_vendor_workbook(path, n, seed=n)
+    log = NullLogger()
+    rows = [dict(p.items()) for p in stream_products_from_excel(path, log)[0]]
+    # rebuild the strings so neither variant benefits from sharing with `rows`
+    payload = json.dumps(rows, ensure_ascii=False)
+    del rows
+
+    def as_dicts():
+        global_info = {}
+        return [
+            {"global_info": global_info, "product_data": p} for p in json.loads(payload)
+        ]
+
+    def as_records():
+        global_info = {}
+        pool = {}
+        return [
+            OrderLine(global_info, ProductRecord(p, pool=pool))
+            for p in json.loads(payload)
+        ]
+
+    result = {"rows": n, "dict_mb": _retained(as_dicts) / 1024 / 1024}
+    result["record_mb"] = _retained(as_records) / 1024 / 1024
+    print(
+        f"product memory @ {n} rows: dicts {result['dict_mb']:.1f} MB, "
+        f"records {result['record_mb']:.1f} MB"
+    )
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """Return the benchmarks that got slower than baseline * (1 + tolerance)."""
+    previous = {(r["benchmark"], r["rows"]): r for r in baseline}
+    regressions = []
+    for r in results:
+        old = previous.get((r["benchmark"], r["rows"]))
+        if old and r["median_s"] > old["median_s"] * (1 + tolerance):
+            regressions.append((r, old))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the vendor order parser.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workdir", default=None, help="where workbooks are cached")
+    parser.add_argument("--json", dest="json_out", help="write results to this file")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument(
+        "--memory-rows",
+        type=int,
+        help="also compare product memory (dicts vs records) at this many rows",
+    )
+    args = parser.parse_args()
+
+    workdir = args.workdir or os.path.join(tempfile.gettempdir(), "vop_bench")
+    os.makedirs(workdir, exist_ok=True)
+    results = run_benchmarks(args.rows, args.repeat, workdir)
+    if args.memory_rows:
+        record_memory(args.memory_rows, workdir)
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for r, old in regressions:
+            print(
+                f"REGRESSION {r['benchmark']} @ {r['rows']} rows: "
+                f"{old['median_s']:.3f}s -> {r['median_s']:.3f}s"
+            )
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Business-day calendar for 內部結單日期 (internal closing date).
+
+The internal closing date is the business day before the vendor's closing date.
+Business days are Monday to Friday minus the public holidays listed in a local text
+file, one date per line, e.g.
+
+    # 2026 國定假日
+    2026/01/01 元旦
+    2026-02-16 春節
+
+The file is `holidays.txt` next to the program (next to the exe when frozen), or the
+path set as HOLIDAY_FILE in config.json. Without it only weekends are skipped. All
+dates of a run are adjusted in one numpy `busday_offset` call.
+"""
+
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+HOLIDAY_FILENAME = "holidays.txt"
+WEEKMASK = "1111100"  # Mon-Fri
+
+_DATE = re.compile(r"(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})")
+
+
+def read_holiday_file(path):
+    """The dates listed in `path`; text after a date or a '#' is ignored."""
+    holidays = []
+    with open(path, encoding="utf-8-sig") as f:
+        for line in f:
+            m = _DATE.search(line.split("#", 1)[0])
+            if m:
+                year, month, day = (int(g) for g in m.groups())
+                holidays.append(np.datetime64(f"{year:04d}-{month:02d}-{day:02d}"))
+    return holidays
+
+
+class BusinessCalendar:
+    def __init__(self, holidays=(), weekmask=WEEKMASK):
+        self.holidays = sorted({np.datetime64(h, "D") for h in holidays})
+        self._calendar = np.busdaycalendar(weekmask=weekmask, holidays=self.holidays)
+
+    @classmethod
+    def from_config(cls, get_config, data_dir, logger=None):
+        """A calendar with the holidays of HOLIDAY_FILE (default holidays.txt).
+
+        A relative path is taken from `data_dir` (`preload.resolve_data_dir`).
+        """
+        path = get_config("HOLIDAY_FILE", None) or HOLIDAY_FILENAME
+        if not os.path.isabs(path):
+            path = os.path.join(data_dir, path)
+        if not os.path.exists(path):
+            return cls()
+        try:
+            calendar = cls(read_holiday_file(path))
+        except (OSError, ValueError) as e:
+            if logger:
+                logger(f"讀取假日檔 '{path}' 時發生錯誤，僅避開週末: {e}")
+            return cls()
+        if logger:
+            logger(f"成功讀取 {len(calendar.holidays)} 個假日: {path}")
+        return calendar
+
+    def previous_business_days(self, values):
+        """The business day before each date string, as 'YYYY/MM/DD'.
+
+        A date that is not a business day itself is first moved back to the nearest
+        business day. Values that cannot be parsed give None.
+        """
+        values = list(values)
+        parsed = pd.to_datetime(
+            pd.Series(values, dtype=object), errors="coerce", format="mixed"
+        )
+        valid = parsed.notna().to_numpy()
+        result = [None] * len(values)
+        if not valid.any():
+            return result
+        days = parsed[valid].to_numpy().astype("datetime64[D]")
+        shifted = np.busday_offset(days, -1, roll="backward", busdaycal=self._calendar)
+        for i, text in zip(
+            np.flatnonzero(valid), pd.DatetimeIndex(shifted).strftime("%Y/%m/%d")
+        ):
+            result[i] = text
+        return result
+
+
+# weekends only; used when no calendar is passed in
+DEFAULT_CALENDAR = BusinessCalendar()
@@ -0,0 +1,170 @@
+"""Accounting for outbound API calls (OpenAI, Google Sheets, Google Drive).
+
+A `CallRecorder` collects one record per call with its latency, request/response bytes,
+token usage and retry count. At the end of a run it can log a per-endpoint and per-file
+summary and export everything as JSON.
+"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+
+def payload_size(obj):
+    """Approximate wire size in bytes of a JSON-like payload."""
+    if obj is None:
+        return 0
+    if isinstance(obj, bytes):
+        return len(obj)
+    if isinstance(obj, str):
+        return len(obj.encode("utf-8"))
+    return len(json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8"))
+
+
+def _new_record(endpoint, source, request_bytes):
+    return {
+        "endpoint": endpoint,
+        "source": source,
+        "started_at": time.time(),
+        "latency_s": 0.0,
+        "request_bytes": request_bytes,
+        "response_bytes": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "cached_tokens": 0,
+        "retries": 0,
+        "ok": True,
+        "error": None,
+    }
+
+
+class CallRecorder:
+    """Thread-safe collector of call records for one processing run."""
+
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def track(self, endpoint, source=None, request_bytes=0):
+        """Time the enclosed call; the yielded dict can be filled with bytes/tokens/retries."""
+        record = _new_record(endpoint, source, request_bytes)
+        start = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record["ok"] = False
+            record["error"] = f"{type(e).__name__}: {e}"[:300]
+            raise
+        finally:
+            record["latency_s"] = time.perf_counter() - start
+            with self._lock:
+                self.records.append(record)
+
+    def summary(self):
+        """Aggregate records per endpoint and per source (file or sheet)."""
+        with self._lock:
+            records = list(self.records)
+
+        def aggregate(key):
+            groups = {}
+            for r in records:
+                g = groups.setdefault(
+                    r[key] or "",
+                    {
+                        "calls": 0,
+                        "errors": 0,
+                        "latency_s": 0.0,
+                        "request_bytes": 0,
+                        "response_bytes": 0,
+                        "prompt_tokens": 0,
+                        "completion_tokens": 0,
+                        "cached_tokens": 0,
+                        "retries": 0,
+                    },
+                )
+                g["calls"] += 1
+                g["errors"] += 0 if r["ok"] else 1
+                for field in (
+                    "latency_s",
+                    "request_bytes",
+                    "response_bytes",
+                    "prompt_tokens",
+                    "completion_tokens",
+                    "cached_tokens",
+                    "retries",
+                ):
+                    g[field] += r[field]
+            # slowest first, so the dominating endpoints/files are on top
+            return dict(
+                sorted(groups.items(), key=lambda kv: kv[1]["latency_s"], reverse=True)
+            )
+
+        totals = aggregate("endpoint")
+        return {
+            "total_calls": len(records),
+            "total_latency_s": sum(r["latency_s"] for r in records),
+            "by_endpoint": totals,
+            "by_source": aggregate("source"),
+        }
+
+    def log_summary(self, logger):
+        summary = self.summary()
+        if not summary["total_calls"]:
+            return
+        logger(
+            f"外部呼叫統計: 共 {summary['total_calls']} 次，累計 {summary['total_latency_s']:.1f} 秒。"
+        )
+        for endpoint, s in summary["by_endpoint"].items():
+            line = (
+                f"  {endpoint}: {s['calls']} 次, {s['latency_s']:.1f}s, "
+                f"送出 {s['request_bytes'] / 1024:.1f} KB / 接收 {s['response_bytes'] / 1024:.1f} KB"
+            )
+            if s["prompt_tokens"] or s["completion_tokens"]:
+                line += (
+                    f", tokens {s['prompt_tokens']}+{s['completion_tokens']}"
+                    f" (cached {s['cached_tokens']}"
+                )
+                if s["prompt_tokens"]:
+                    line += f", {s['cached_tokens'] / s['prompt_tokens']:.0%}"
+                line += ")"
+            if s["retries"] or s["errors"]:
+                line += f", 重試 {s['retries']} / 失敗 {s['errors']}"
+            logger(line)
+        for source, s in summary["by_source"].items():
+            if source:
+                logger(f"  [{source}] {s['calls']} 次, {s['latency_s']:.1f}s")
+
+    def export_json(self, path):
+        with self._lock:
+            records = list(self.records)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"summary": self.summary(), "calls": records},
+                f,
+                ensure_ascii=False,
+                indent=2,
+            )
+
+
+def track_call(recorder, endpoint, source=None, request_bytes=0):
+    """`recorder.track(...)`, or a no-op context yielding a scratch dict when recorder is None."""
+    if recorder is None:
+        return nullcontext(_new_record(endpoint, source, request_bytes))
+    return recorder.track(endpoint, source=source, request_bytes=request_bytes)
+
+
+def record_call(
+    recorder, endpoint, fn, *args, source=None, request_bytes=None, **kwargs
+):
+    """Call `fn(*args, **kwargs)` and record it; response size is estimated from the result."""
+    if recorder is None:
+        return fn(*args, **kwargs)
+    if request_bytes is None:
+        request_bytes = payload_size({"args": args, "kwargs": kwargs})
+    with recorder.track(endpoint, source=source, request_bytes=request_bytes) as rec:
+        result = fn(*args, **kwargs)
+        if isinstance(result, (dict, list, str, bytes)):
+            rec["response_bytes"] = payload_size(result)
+        return result
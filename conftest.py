@@ -0,0 +1,3 @@
+# test_gsheet_access.py is a manual check against a live sheet (needs
+# service_account.json), not a pytest test
+collect_ignore = ["test_gsheet_access.py"]
@@ -1,7 +1,27 @@
+import functools
+import itertools
+import multiprocessing
 import os
-import pandas as pd
+import pickle
 import re
-from datetime import datetime, date, timedelta
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+
+import pandas as pd
+
+from business_calendar import DEFAULT_CALENDAR
+from erp_writer import write_erp_file
+from excel_reader import READ_ERRORS, iter_sheet_rows, read_sheet, sheet_names
+from layout_cache import LayoutRegistry
+from records import SHEET_SOURCE_KEY, ProductRecord
+from stage_profiler import StageProfiler, profile_stage
+
+# Files at least this large are extracted with `stream_products_from_excel`
+STREAMING_MIN_FILE_BYTES = 5 * 1024 * 1024
+# Rows searched for headers, and data rows included in the AI sample, when streaming
+HEADER_SCAN_ROWS = 50
+AI_SAMPLE_ROWS = 200
 
 ERP_COLUMNS = [
     # ERP layout: first three are ERP / GD / 平台前導
@@ -40,13 +60,20 @@ ERP_COLUMNS = [
 
 
 def convert_excel_to_csv(file_path, logger):
-    """Reads an Excel file and converts its first sheet to a CSV string."""
+    """Reads an Excel file and converts its worksheets to one CSV string.
+
+    With several worksheets, each sheet's CSV is preceded by a '### 工作表: name' line.
+    """
     try:
-        df = pd.read_excel(file_path, sheet_name=0, header=None)
-        df = df.astype(str)
-        df.replace("nan", "", inplace=True)
+        names = sheet_names(file_path)
+        parts = []
+        for name in names:
+            csv_text = read_sheet(file_path, sheet_name=name).to_csv(
+                index=False, header=False
+            )
+            parts.append((name, csv_text))
         logger(f"Successfully converted '{os.path.basename(file_path)}' to CSV format.")
-        return df.to_csv(index=False, header=False)
+        return join_sheet_csv(parts)
     except Exception as e:
         logger(
             f"Error reading or converting Excel file {os.path.basename(file_path)}: {e}"
@@ -54,6 +81,14 @@ def convert_excel_to_csv(file_path, logger):
         return None
 
 
+def join_sheet_csv(parts):
+    """Join (sheet name, csv) pairs; a single sheet is returned without a separator."""
+    parts = [(name, text) for name, text in parts if text is not None]
+    if len(parts) == 1:
+        return parts[0][1]
+    return "".join(f"### 工作表: {name}\n{text}" for name, text in parts)
+
+
 def extract_order_date_from_filename(file_path, logger=None):
     """Attempt to extract an order date (MMDD) from the start of the filename.
 
@@ -61,11 +96,22 @@ def extract_order_date_from_filename(file_path, logger=None):
     - If the filename starts with 4 digits like '0126', treat as MMDD.
     - Choose the nearest future date (strictly greater than today). If current year's MMDD is in the future, use that; otherwise use next year, etc.
     - Returns a string formatted as 'YYYY/MM/DD' or None if not found/invalid.
+
+    Results are memoized per file name and day.
     """
     filename = os.path.basename(file_path)
+    found, order_date = _order_date_from_filename(filename, date.today())
+    if found and order_date is None and logger:
+        logger(f"無法從檔名產生有效的未來結單日期: {filename}")
+    return order_date
+
+
+@functools.lru_cache(maxsize=256)
+def _order_date_from_filename(filename, today):
+    """(whether the name starts with MMDD, the date string or None)."""
     m = re.match(r"^(\d{3,4})", filename)
     if not m:
-        return None
+        return False, None
 
     mmdd = m.group(1)
     try:
@@ -77,9 +123,8 @@ def extract_order_date_from_filename(file_path, logger=None):
             month = int(mmdd[0])
             day = int(mmdd[1:])
     except ValueError:
-        return None
+        return False, None
 
-    today = date.today()
     # try this year first, then increment year until a valid future date is found (limit to 5 years)
     for add_years in range(0, 6):
         year = today.year + add_years
@@ -90,76 +135,110 @@ def extract_order_date_from_filename(file_path, logger=None):
             continue
         # must be strictly greater than today
         if candidate > today:
-            return candidate.strftime("%Y/%m/%d")
-
-    if logger:
-        logger(f"無法從檔名產生有效的未來結單日期: {filename}")
-    return None
+            return True, candidate.strftime("%Y/%m/%d")
+    return True, None
 
 
-def adjust_order_date(date_str, logger=None):
-    """Adjust order date by: subtracting one day, then if the result falls on weekend (Sat/Sun)
-    move backwards to the nearest previous non-weekend day.
+def adjust_order_date(date_str, logger=None, calendar=None):
+    """Move an order date back one business day (weekends and `calendar` holidays).
 
     Input: date_str in formats parseable by pandas.to_datetime or 'YYYY/MM/DD'.
-    Output: string 'YYYY/MM/DD' or None on failure.
+    Output: string 'YYYY/MM/DD' or None on failure. For many dates at once use
+    `BusinessCalendar.previous_business_days`.
     """
     if not date_str:
         return None
-
-    try:
-        dt = pd.to_datetime(date_str).date()
-    except Exception:
-        if logger:
-            logger(f"adjust_order_date: 無法解析日期字串: {date_str}")
-        return None
-
-    def back_to_weekday(d):
-        # move backwards until it's Mon-Fri
-        while d.weekday() >= 5:
-            d = d - timedelta(days=1)
-        return d
-
-    # If the initial date is a holiday (weekend), first move back to the nearest previous weekday,
-    # then subtract one more day, and finally ensure result is a weekday.
-    if dt.weekday() >= 5:
-        prev_weekday = back_to_weekday(dt)
-        result = prev_weekday - timedelta(days=1)
-        result = back_to_weekday(result)
-        return result.strftime("%Y/%m/%d")
-
-    # Else, initial date is not holiday: subtract one day first, then if that day is holiday move back to previous weekday.
-    candidate = dt - timedelta(days=1)
-    if candidate.weekday() >= 5:
-        candidate = back_to_weekday(candidate)
-    return candidate.strftime("%Y/%m/%d")
+    result = (calendar or DEFAULT_CALENDAR).previous_business_days([date_str])[0]
+    if result is None and logger:
+        logger(f"adjust_order_date: 無法解析日期字串: {date_str}")
+    return result
 
 
 def generate_erp_excel(final_df, output_path, logger):
-    """Generates the final ERP Excel file from a pre-built DataFrame."""
-    if final_df.empty:
+    """Generates the final ERP output file (.xlsx, .csv or .parquet).
+
+    `final_df` is a DataFrame or an iterable of row dicts (e.g. `iter_erp_rows(...)`);
+    rows are streamed to the file instead of building the workbook in memory.
+    """
+    if isinstance(final_df, pd.DataFrame) and final_df.empty:
         logger("No products to process for the final ERP output.")
         return
 
     logger("Saving data to the final ERP Excel file...")
 
     try:
-        # Convert all data to string type before saving to prevent auto-formatting
-        final_df = final_df.astype(str)
-        final_df.to_excel(output_path, index=False, sheet_name="ERP")
+        # Every value is written as text to prevent auto-formatting
+        count = write_erp_file(output_path, final_df, columns=ERP_COLUMNS)
+        if not count:
+            logger("No products to process for the final ERP output.")
+            return
         logger(f"Success! Final report saved to:\n{output_path}")
     except Exception as e:
         logger(f"Error saving final Excel file: {e}")
 
 
 def build_final_df(
-    all_products, brand_map, category1_map, category1_keywords_sorted, logger
+    all_products,
+    brand_map,
+    category1_map,
+    category1_keywords_sorted,
+    logger,
+    calendar=None,
+    resolver=None,
 ):
     """Builds and returns the final ERP DataFrame from processed products.
 
     This helper is used by both Excel output and Google Sheets append.
     """
-    processed_rows = []
+    final_df = pd.DataFrame(
+        list(
+            iter_erp_rows(
+                all_products,
+                brand_map,
+                category1_map,
+                category1_keywords_sorted,
+                logger,
+                calendar=calendar,
+                resolver=resolver,
+            )
+        )
+    )
+    final_df = final_df.reindex(columns=ERP_COLUMNS).fillna("")
+    return final_df
+
+
+def iter_erp_rows(
+    all_products,
+    brand_map,
+    category1_map,
+    category1_keywords_sorted,
+    logger,
+    calendar=None,
+    resolver=None,
+):
+    """Yield one ERP row dict per processed product, in ERP_COLUMNS order.
+
+    `calendar` (a `business_calendar.BusinessCalendar`) decides which days 內部結單日期
+    may fall on; by default only weekends are skipped.
+
+    品牌 and 廠商 are written as lookup formulas unless `resolver` (a
+    `reference_data.CodeResolver`) finds their codes; formulas remain only for the
+    rows it cannot resolve.
+    """
+    if not isinstance(all_products, (list, tuple)):
+        all_products = list(all_products)
+    # a run has only a few distinct order dates; adjust them all in one call
+    raw_dates = {}
+    for p_info in all_products:
+        value = p_info["global_info"].get("內部結單日期")
+        if isinstance(value, str) and value:
+            raw_dates[value] = None
+    raw_dates = list(raw_dates)
+    adjusted_dates = dict(
+        zip(raw_dates, (calendar or DEFAULT_CALENDAR).previous_business_days(raw_dates))
+    )
+
+    unresolved = 0
     for p_info in all_products:
         p = p_info["product_data"]
         global_info = p_info["global_info"]
@@ -173,7 +252,7 @@ def build_final_df(
                 release_month = normalized_month.replace("-", "")
             else:
                 # If AI fails to follow instructions, log it and use the value as-is
-                logger.warning(
+                logger(
                     f"AI returned unexpected format for 預計發售月份: '{normalized_month}'. Using value as-is."
                 )
                 release_month = normalized_month
@@ -193,16 +272,11 @@ def build_final_df(
         # 內部結單日期（J 欄）：可被檔名覆寫後再做週末避開調整
         order_date = global_info.get("內部結單日期", "")
         if isinstance(order_date, str) and order_date:
-            try:
-                # normalize first
-                normalized = pd.to_datetime(order_date).strftime("%Y/%m/%d")
-                # then apply business rule: move back one day and skip weekends
-                adjusted = adjust_order_date(normalized, logger=logger)
-                if adjusted:
-                    order_date = adjusted
-                else:
-                    order_date = normalized
-            except (ValueError, TypeError):
+            # business rule: move back one business day (weekends and holidays)
+            adjusted = adjusted_dates.get(order_date)
+            if adjusted:
+                order_date = adjusted
+            else:
                 logger(f"Could not parse date '{order_date}', leaving as is.")
 
         # 上架日期：填入今天日期，格式 YYYY/MM/DD
@@ -292,6 +366,19 @@ def build_final_df(
 
         # formula to lookup 廠商代碼 from '廠商基本資料' sheet by matching 寄件廠商 in column D
         vendor_formula = "=IFERROR(INDEX('廠商基本資料'!A:A, MATCH(INDIRECT(\"D\"&ROW()), '廠商基本資料'!D:D, 0)), \"\")"
+        vendor_code = vendor_formula
+
+        if resolver is not None:
+            # plain values recalculate nothing when the sheet is edited
+            vendor_code = (
+                resolver.vendor_code(global_info.get("寄件廠商")) or vendor_code
+            )
+            if final_brand_code == brand_formula:
+                final_brand_code = (
+                    resolver.brand_code(new_product_name) or final_brand_code
+                )
+            if vendor_code == vendor_formula or final_brand_code == brand_formula:
+                unresolved += 1
 
         new_row = {
             # first three columns required by Google Sheet template
@@ -312,7 +399,7 @@ def build_final_df(
             "國際條碼": "",
             "起始進價": p.get("起始進價", ""),
             "建議售價": p.get("建議售價", ""),
-            "廠商": vendor_formula,
+            "廠商": vendor_code,
             "類1": cat1_value,
             "類2": "",
             "類3": "",
@@ -327,60 +414,57 @@ def build_final_df(
             "備註": p.get("備註", ""),
             "規格": "",
         }
-        processed_rows.append(new_row)
+        yield new_row
+
+    if resolver is not None and unresolved:
+        logger(
+            f"{unresolved} 列的品牌或廠商代碼無法在本機對照，這些儲存格保留查詢公式。"
+        )
 
-    final_df = pd.DataFrame(processed_rows)
-    final_df = final_df.reindex(columns=ERP_COLUMNS).fillna("")
-    return final_df
 
+def scan_brands(df, brand_keywords):
+    """Return the set of brand keywords found (case-insensitive substring) in any cell of df."""
+    found_brands = set()
 
-def extract_products_from_excel(file_path, logger):
+    all_cells = df.unstack().dropna().astype(str).str.lower()
+
+    for keyword in brand_keywords:
+        if (
+            keyword
+            and str(keyword).strip()
+            and all_cells.str.contains(keyword.lower(), na=False, regex=False).any()
+        ):
+            found_brands.add(keyword)
+    return found_brands
+
+
+def extract_products_from_excel(
+    file_path, logger, profiler=None, sheet_name=0, layout_cache=None
+):
     """
     Reads an Excel file, intelligently finds header cells for required columns (even if they are on different rows),
     validates product rows based on price columns, and extracts data into a clean list of dictionaries.
+
+    When a `stage_profiler.StageProfiler` is given, parsing, header detection and row
+    extraction are recorded as separate stages.
     """
     try:
-        df = (
-            pd.read_excel(file_path, sheet_name=0, header=None)
-            .astype(str)
-            .replace("nan", "")
-        )
+        with profile_stage(profiler, "excel_parse", file_path):
+            df = read_sheet(file_path, sheet_name=sheet_name, compact=True)
     except Exception as e:
         logger(f"Error reading Excel file {os.path.basename(file_path)}: {e}")
         return [], None
+    return extract_products_from_sheet(
+        df, logger, profiler=profiler, file=file_path, layout_cache=layout_cache
+    )
 
-    # --- Find Header Locations (Row, Col) for each keyword ---
-    header_map = {
-        "品名": ["品名", "商品名", "品項", "商品", "中文品名"],
-        "貨號": ["sku", "貨號", "商品貨號"],
-        "國際條碼": ["國際條碼", "jan code", "jancode", "條碼"],
-        "預計發售月份": ["發售日", "預定到貨", "預計上市日", "發貨日"],
-        "備註": ["備註", "備考", "附註", "註"],
-        "起始進價": ["東海成本"],
-        "建議售價": ["東海售價"],
-    }
-    header_locs = {}  # Stores {'起始進價': (row, col), ...}
 
-    for key, keywords in header_map.items():
-        found = False
-        for keyword in keywords:
-            # Find cells that contain the keyword (case-insensitive)
-            matches = df.apply(
-                lambda col: col.str.contains(keyword, na=False, case=False)
-            )
-            if matches.any().any():
-                # Get the location of the first match
-                row_idx = matches.any(axis=1).idxmax()
-                col_idx = matches.iloc[row_idx].idxmax()
-                header_locs[key] = (row_idx, col_idx)
-                logger(
-                    f"Found header '{keyword}' for '{key}' at location ({row_idx}, {col_idx})."
-                )
-                found = True
-                break  # Found a match for this key, move to the next key
-        if not found:
-            logger(f"Warning: Header for '{key}' (keywords: {keywords}) not found.")
-            header_locs[key] = (None, None)
+def extract_products_from_sheet(
+    df, logger, profiler=None, file=None, layout_cache=None
+):
+    """Header detection and product extraction on an already-read sheet."""
+    with profile_stage(profiler, "header_detection", file):
+        header_locs = detect_headers(df, logger, layout_cache)
 
     # --- Validate that critical headers were found ---
     cost_price_loc = header_locs.get("起始進價")
@@ -398,28 +482,391 @@ def extract_products_from_excel(file_path, logger):
     data_start_row = last_header_row + 1
     logger(f"Data rows will be processed starting from row index {data_start_row}.")
 
-    product_df = df.iloc[data_start_row:]
+    with profile_stage(profiler, "product_extraction", file):
+        product_df = df.iloc[data_start_row:]
 
-    # --- Iterate, Validate, and Extract ---
-    extracted_products = []
-    cost_price_col = cost_price_loc[1]
-    sell_price_col = sell_price_loc[1]
+        # --- Iterate, Validate, and Extract ---
+        extracted_products = []
+        cost_price_col = cost_price_loc[1]
+        sell_price_col = sell_price_loc[1]
+        pool = {}
 
-    for i, row in product_df.iterrows():
-        cost_price = row.get(cost_price_col, "").strip()
-        sell_price = row.get(sell_price_col, "").strip()
+        for i, row in product_df.iterrows():
+            cost_price = row.get(cost_price_col, "").strip()
+            sell_price = row.get(sell_price_col, "").strip()
 
-        if cost_price and sell_price:
-            product_data = {}
-            for key, loc in header_locs.items():
-                if loc[1] is not None:  # if column was found
-                    product_data[key] = row.get(loc[1], "").strip()
+            if cost_price and sell_price:
+                product_data = {}
+                for key, loc in header_locs.items():
+                    if loc[1] is not None:  # if column was found
+                        product_data[key] = row.get(loc[1], "").strip()
 
-            extracted_products.append(product_data)
+                extracted_products.append(ProductRecord(product_data, pool=pool))
 
-    logger(
-        f"Extracted {len(extracted_products)} valid products from the file based on price columns."
-    )
+        logger(
+            f"Extracted {len(extracted_products)} valid products from the file based on price columns."
+        )
 
-    full_csv_for_ai = df.to_csv(index=False, header=False)
+        full_csv_for_ai = df.to_csv(index=False, header=False)
     return extracted_products, full_csv_for_ai
+
+
+def _scan_brands_logged(scan, logger, *args, **kwargs):
+    try:
+        return scan(*args, **kwargs)
+    except READ_ERRORS as e:
+        logger(f"掃描檔案品牌時發生錯誤: {e}")
+        return set()
+
+
+def _extract_sheet_job(
+    file_path, sheet_name, brand_keywords, streaming, track_memory, layout_cache=None
+):
+    """Extract and brand-scan one worksheet; runs in a worker process.
+
+    Log lines and profiler records are returned so the parent can replay/merge them.
+    """
+    logs = []
+    profiler = StageProfiler(track_memory=track_memory)
+    try:
+        if streaming:
+            products_iter, sheet_csv = stream_products_from_excel(
+                file_path,
+                logs.append,
+                profiler=profiler,
+                sheet_name=sheet_name,
+                layout_cache=layout_cache,
+            )
+            with profiler.stage("product_extraction", file_path):
+                products = list(products_iter)
+            with profiler.stage("brand_scan", file_path):
+                found_brands = _scan_brands_logged(
+                    scan_brands_in_file,
+                    logs.append,
+                    file_path,
+                    brand_keywords,
+                    sheet_name=sheet_name,
+                )
+        else:
+            try:
+                with profiler.stage("excel_parse", file_path):
+                    df = read_sheet(file_path, sheet_name=sheet_name, compact=True)
+            except READ_ERRORS as e:
+                logs.append(
+                    f"Error reading Excel file {os.path.basename(file_path)}: {e}"
+                )
+                return {
+                    "sheet": sheet_name,
+                    "products": [],
+                    "csv": None,
+                    "brands": set(),
+                    "logs": logs,
+                    "stages": profiler.records,
+                }
+            products, sheet_csv = extract_products_from_sheet(
+                df,
+                logs.append,
+                profiler=profiler,
+                file=file_path,
+                layout_cache=layout_cache,
+            )
+            with profiler.stage("brand_scan", file_path):
+                found_brands = _scan_brands_logged(
+                    scan_brands, logs.append, df, brand_keywords
+                )
+    finally:
+        profiler.close()
+    return {
+        "sheet": sheet_name,
+        "products": products,
+        "csv": sheet_csv,
+        "brands": found_brands,
+        "logs": logs,
+        "stages": profiler.records,
+    }
+
+
+def extract_products_from_workbook(
+    file_path,
+    logger,
+    brand_keywords=(),
+    profiler=None,
+    streaming=False,
+    max_workers=None,
+    layout_cache=None,
+):
+    """Extract products from every worksheet of a vendor workbook.
+
+    Each sheet gets its own header detection, extraction and brand scan. With more
+    than one sheet the sheets are processed in a process pool, so a multi-tab catalog
+    takes about as long as its largest tab. In multi-sheet workbooks, products carry
+    their sheet name under SHEET_SOURCE_KEY.
+
+    Returns (products, combined CSV for the AI, set of brand keywords found).
+    """
+    try:
+        names = sheet_names(file_path)
+    except READ_ERRORS as e:
+        logger(f"Error reading Excel file {os.path.basename(file_path)}: {e}")
+        return [], None, set()
+
+    track_memory = profiler is not None and profiler.track_memory
+    jobs = [
+        (file_path, name, list(brand_keywords), streaming, track_memory, layout_cache)
+        for name in names
+    ]
+    results = None
+    workers = min(len(names), max_workers or os.cpu_count() or 1)
+    if len(names) > 1:
+        logger(f"活頁簿共有 {len(names)} 個工作表: {', '.join(names)}")
+    if workers > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(_extract_sheet_job, *zip(*jobs)))
+        except (OSError, RuntimeError, pickle.PicklingError) as e:
+            logger(f"平行處理工作表失敗 ({e})，改為逐一處理。")
+    if results is None:
+        results = [_extract_sheet_job(*job) for job in jobs]
+
+    products = []
+    found_brands = set()
+    csv_parts = []
+    for result in results:
+        prefix = f"[{result['sheet']}] " if len(names) > 1 else ""
+        for line in result["logs"]:
+            logger(prefix + line)
+        if profiler is not None:
+            profiler.merge(result["stages"])
+        if len(names) > 1:
+            for p in result["products"]:
+                p[SHEET_SOURCE_KEY] = result["sheet"]
+        products.extend(result["products"])
+        found_brands |= result["brands"]
+        csv_parts.append((result["sheet"], result["csv"]))
+    return products, join_sheet_csv(csv_parts) if csv_parts else None, found_brands
+
+
+def parse_vendor_file(
+    file_path, brand_keywords=(), track_memory=False, layout_cache=None
+):
+    """Parse one vendor workbook (the CPU-bound part of processing a file).
+
+    Meant to run in a `pipeline.FilePipeline` worker process: logs and profiler
+    records are returned instead of written, so the parent can replay and merge them.
+    Inside a worker the sheets are processed one after another (no nested pool).
+    """
+    logs = []
+    profiler = StageProfiler(track_memory=track_memory)
+    try:
+        try:
+            streaming = os.path.getsize(file_path) >= STREAMING_MIN_FILE_BYTES
+        except OSError:
+            streaming = False
+        if streaming:
+            # large price list: read rows lazily and give the AI a bounded sample
+            logs.append("檔案較大，改用串流模式讀取，AI 僅取前段資料作為參考。")
+        in_worker = multiprocessing.parent_process() is not None
+        products, csv_text, found_brands = extract_products_from_workbook(
+            file_path,
+            logs.append,
+            brand_keywords=brand_keywords,
+            profiler=profiler,
+            streaming=streaming,
+            max_workers=1 if in_worker else None,
+            layout_cache=layout_cache,
+        )
+    finally:
+        profiler.close()
+    return {
+        "file": file_path,
+        "products": products,
+        "csv": csv_text,
+        "brands": found_brands,
+        "logs": logs,
+        "stages": profiler.records,
+    }
+
+
+def _row_products(rows, header_locs, cost_price_col, sell_price_col):
+    """Yield a ProductRecord for every row that has both price cells filled."""
+    cols = [(key, loc[1]) for key, loc in header_locs.items() if loc[1] is not None]
+    pool = {}
+    for row in rows:
+        width = len(row)
+        cost_price = row[cost_price_col].strip() if cost_price_col < width else ""
+        sell_price = row[sell_price_col].strip() if sell_price_col < width else ""
+        if cost_price and sell_price:
+            yield ProductRecord(
+                {key: row[col].strip() if col < width else "" for key, col in cols},
+                pool=pool,
+            )
+
+
+def stream_products_from_excel(
+    file_path,
+    logger,
+    header_scan_rows=HEADER_SCAN_ROWS,
+    sample_rows=AI_SAMPLE_ROWS,
+    profiler=None,
+    sheet_name=0,
+    layout_cache=None,
+):
+    """Streaming variant of `extract_products_from_excel` for very large price lists.
+
+    Only the first `header_scan_rows + sample_rows` rows are held in memory: headers are
+    located in the first `header_scan_rows`, and the CSV for the AI is built from the
+    header block plus at most `sample_rows` data rows. Products are produced lazily
+    while the rest of the sheet is read.
+
+    Returns (product iterator, sample CSV); the iterator is empty and the CSV is None if
+    the file cannot be read.
+    """
+    try:
+        with profile_stage(profiler, "excel_parse", file_path):
+            rows = iter_sheet_rows(file_path, sheet_name=sheet_name)
+            head = []
+            for row in rows:
+                head.append(row)
+                if len(head) >= header_scan_rows + sample_rows:
+                    break
+    except READ_ERRORS as e:
+        logger(f"Error reading Excel file {os.path.basename(file_path)}: {e}")
+        return iter(()), None
+
+    width = max((len(r) for r in head), default=0)
+    with profile_stage(profiler, "header_detection", file_path):
+        head_df = pd.DataFrame(
+            [r + [""] * (width - len(r)) for r in head[:header_scan_rows]], dtype=object
+        )
+        header_locs = detect_headers(head_df, logger, layout_cache)
+
+    cost_price_loc = header_locs.get("起始進價")
+    sell_price_loc = header_locs.get("建議售價")
+    head_csv = pd.DataFrame([r + [""] * (width - len(r)) for r in head], dtype=object)
+
+    if cost_price_loc[1] is None or sell_price_loc[1] is None:
+        logger(
+            "Error: Critical headers '東海成本' or '東海售價' not found. Cannot process products."
+        )
+        rows.close()
+        return iter(()), head_csv.to_csv(index=False, header=False)
+
+    last_header_row = max(r for r, c in header_locs.values() if r is not None)
+    data_start_row = last_header_row + 1
+    logger(f"Data rows will be processed starting from row index {data_start_row}.")
+
+    sample_end = data_start_row + sample_rows
+    sample_csv = head_csv.iloc[:sample_end].to_csv(index=False, header=False)
+    if len(head) > sample_end or len(head) == header_scan_rows + sample_rows:
+        sample_csv += f"(以下省略；僅提供前 {sample_rows} 列資料作為範例)\n"
+
+    def products():
+        count = 0
+        try:
+            for product in _row_products(
+                itertools.chain(head[data_start_row:], rows),
+                header_locs,
+                cost_price_loc[1],
+                sell_price_loc[1],
+            ):
+                count += 1
+                yield product
+        finally:
+            rows.close()
+        logger(
+            f"Extracted {count} valid products from the file based on price columns."
+        )
+
+    return products(), sample_csv
+
+
+def scan_brands_in_file(file_path, brand_keywords, sheet_name=0):
+    """`scan_brands` over a file read row by row, without loading the whole sheet."""
+    remaining = {k: k.lower() for k in brand_keywords if k and str(k).strip()}
+    found_brands = set()
+    for row in iter_sheet_rows(file_path, sheet_name=sheet_name):
+        if not remaining:
+            break
+        if not row:
+            continue
+        cells = [c.lower() for c in row if c]
+        for keyword, needle in list(remaining.items()):
+            if any(needle in c for c in cells):
+                found_brands.add(keyword)
+                del remaining[keyword]
+    return found_brands
+
+
+# --- Header keywords used to locate each column (case-insensitive substring match) ---
+HEADER_MAP = {
+    "品名": ["品名", "商品名", "品項", "商品", "中文品名"],
+    "貨號": ["sku", "貨號", "商品貨號"],
+    "國際條碼": ["國際條碼", "jan code", "jancode", "條碼"],
+    "預計發售月份": ["發售日", "預定到貨", "預計上市日", "發貨日"],
+    "備註": ["備註", "備考", "附註", "註"],
+    "起始進價": ["東海成本"],
+    "建議售價": ["東海售價"],
+}
+
+
+def detect_headers(df, logger, layout_cache=None):
+    """`locate_headers`, skipped for sheets whose layout is in the registry.
+
+    `layout_cache` is the path of a `layout_cache.LayoutRegistry`; None searches as
+    before. Layouts found by a full search are added to the registry.
+    """
+    if not layout_cache:
+        return locate_headers(df, logger)
+    try:
+        registry = LayoutRegistry(layout_cache)
+    except (sqlite3.Error, OSError) as e:
+        logger(f"無法開啟版面快取 ({e})，改為搜尋標題。")
+        return locate_headers(df, logger)
+    try:
+        try:
+            header_locs = registry.find(df, HEADER_MAP)
+        except (sqlite3.Error, ValueError) as e:
+            logger(f"讀取版面快取時發生錯誤 ({e})，改為搜尋標題。")
+            header_locs = None
+        if header_locs is not None:
+            logger("使用已知的檔案版面（版面快取），略過標題搜尋。")
+            return header_locs
+        header_locs = locate_headers(df, logger)
+        if all(header_locs[key][1] is not None for key in ("起始進價", "建議售價")):
+            try:
+                registry.remember(df, header_locs)
+            except sqlite3.Error as e:
+                logger(f"無法更新版面快取: {e}")
+        return header_locs
+    finally:
+        registry.close()
+
+
+def locate_headers(df, logger):
+    """Find the (row, col) of the header cell for every key in HEADER_MAP.
+
+    Keys whose header is not found map to (None, None).
+    """
+    header_locs = {}  # Stores {'起始進價': (row, col), ...}
+
+    for key, keywords in HEADER_MAP.items():
+        found = False
+        for keyword in keywords:
+            # Find cells that contain the keyword (case-insensitive)
+            matches = df.apply(
+                lambda col, kw=keyword: col.str.contains(kw, na=False, case=False)
+            )
+            if matches.any().any():
+                # Get the location of the first match
+                row_idx = matches.any(axis=1).idxmax()
+                col_idx = matches.iloc[row_idx].idxmax()
+                header_locs[key] = (row_idx, col_idx)
+                logger(
+                    f"Found header '{keyword}' for '{key}' at location ({row_idx}, {col_idx})."
+                )
+                found = True
+                break  # Found a match for this key, move to the next key
+        if not found:
+            logger(f"Warning: Header for '{key}' (keywords: {keywords}) not found.")
+            header_locs[key] = (None, None)
+    return header_locs
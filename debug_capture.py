@@ -0,0 +1,126 @@
+"""Debug artifacts (AI prompts and responses) collected into one zip per run.
+
+Entries are handed to a background thread that compresses them into
+`<output>_debug.zip`, so saving them costs the processing thread nothing but a queue
+put. Files can be sampled (a stable choice per file name) and the archive stops taking
+entries once `max_bytes` of uncompressed data have been written.
+
+Configured in config.json:
+    DEBUG_CAPTURE      true to enable (default off)
+    DEBUG_SAMPLE_RATE  share of files to capture, 0..1 (default 1)
+    DEBUG_MAX_MB       size cap in MB of uncompressed data (default 50)
+"""
+
+import json
+import queue
+import threading
+import zipfile
+import zlib
+
+DEFAULT_MAX_MB = 50
+_STOP = object()
+
+
+class DebugCapture:
+    def __init__(self, archive_path, sample_rate=1.0, max_bytes=None, logger=None):
+        self.archive_path = archive_path
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.logger = logger
+        self.entries = 0
+        self.bytes_written = 0
+        self.dropped = 0
+        self._queued_bytes = 0
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_config(cls, get_config, archive_path, logger=None):
+        """A DebugCapture as configured in config.json, or None when disabled."""
+        if not get_config("DEBUG_CAPTURE", False):
+            return None
+        max_mb = float(get_config("DEBUG_MAX_MB", DEFAULT_MAX_MB))
+        return cls(
+            archive_path,
+            sample_rate=float(get_config("DEBUG_SAMPLE_RATE", 1.0)),
+            max_bytes=int(max_mb * 1024 * 1024) if max_mb > 0 else None,
+            logger=logger,
+        )
+
+    def _log(self, message):
+        if self.logger:
+            self.logger(message)
+
+    def wants(self, name):
+        """Whether artifacts of `name` (a file) are sampled; stable across runs."""
+        if self.sample_rate >= 1:
+            return True
+        if self.sample_rate <= 0:
+            return False
+        return zlib.crc32(name.encode("utf-8")) / 0xFFFFFFFF < self.sample_rate
+
+    def add(self, name, content):
+        """Queue `content` (str, bytes, or JSON-able object) as archive member `name`."""
+        if isinstance(content, bytes):
+            size = len(content)
+        else:
+            size = len(content) if isinstance(content, str) else 0
+        with self._lock:
+            if (
+                self.max_bytes is not None
+                and self._queued_bytes + size > self.max_bytes
+            ):
+                if not self.dropped:
+                    self._log(
+                        f"除錯檔案已達大小上限 ({self.max_bytes / (1024 * 1024):g} MB)，之後的內容不再保存。"
+                    )
+                self.dropped += 1
+                return False
+            self._queued_bytes += size
+        self._queue.put((name, content))
+        return True
+
+    def _encode(self, name, content):
+        if isinstance(content, bytes):
+            return content
+        if not isinstance(content, str):
+            content = json.dumps(content, ensure_ascii=False, indent=4, default=str)
+        elif name.endswith(".json"):
+            # pretty-print here rather than on the processing thread
+            try:
+                content = json.dumps(json.loads(content), ensure_ascii=False, indent=4)
+            except json.JSONDecodeError:
+                pass
+        return content.encode("utf-8")
+
+    def _run(self):
+        archive = None
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _STOP:
+                    break
+                name, content = item
+                try:
+                    if archive is None:
+                        archive = zipfile.ZipFile(
+                            self.archive_path, "w", zipfile.ZIP_DEFLATED
+                        )
+                    data = self._encode(name, content)
+                    archive.writestr(name, data)
+                    self.entries += 1
+                    self.bytes_written += len(data)
+                except (OSError, ValueError) as e:
+                    self._log(f"寫入除錯檔案 {name} 時發生錯誤: {e}")
+        finally:
+            if archive is not None:
+                archive.close()
+
+    def close(self):
+        """Wait for queued entries to be written and close the archive."""
+        self._queue.put(_STOP)
+        self._thread.join()
+        if self.entries:
+            self._log(f"已將 {self.entries} 個除錯檔案壓縮儲存至: {self.archive_path}")
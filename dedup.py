@@ -0,0 +1,123 @@
+"""Cross-file deduplication of products before AI enrichment.
+
+The same item often appears in several files of one run (a distributor sheet and the
+maker's own sheet). Only its first occurrence is sent to the model; later occurrences
+copy the fields the model produced for it. Their own data (prices, notes, ...) is
+left as it is.
+
+Products are identified by the digits of 國際條碼 (JAN/EAN) or, without a usable barcode,
+by the normalized 貨號. An occurrence with a different raw 預計發售月份 is not a duplicate:
+the model has to normalize its month, so it is sent as well. With a `product_store.ProductStore`, products enriched in
+earlier runs are treated the same way and new results are added to the store.
+"""
+
+import re
+import unicodedata
+
+from product_store import month_text
+from records import ProductRecord
+
+# fields the enrichment step fills in or rewrites
+ENRICHED_FIELDS = ("預計發售月份", "偵測到的品牌", "ai_matched_category_keyword")
+MIN_BARCODE_DIGITS = 8
+
+_NON_DIGITS = re.compile(r"\D")
+_SPACES = re.compile(r"\s+")
+
+
+def product_key(product):
+    """('jan', digits) or ('sku', normalized 貨號), or None if neither is usable."""
+    barcode = product.get("國際條碼")
+    if barcode is not None:
+        digits = _NON_DIGITS.sub("", unicodedata.normalize("NFKC", str(barcode)))
+        if len(digits) >= MIN_BARCODE_DIGITS:
+            return ("jan", digits.lstrip("0") or "0")
+    sku = product.get("貨號")
+    if sku is not None:
+        sku = _SPACES.sub("", unicodedata.normalize("NFKC", str(sku))).casefold()
+        if sku and sku not in ("nan", "none"):
+            return ("sku", sku)
+    return None
+
+
+class ProductDeduplicator:
+    """Tracks which products of a run were already sent for enrichment.
+
+    split() must see the files in the order their enrichment results are remember()ed,
+    so a duplicate always refers to a product of the same or an earlier file. The
+    answers for one key are matched to its sent products in order.
+    """
+
+    def __init__(self, store=None):
+        self.store = store
+        self._sent = {}  # key -> raw 預計發售月份 of each product sent, in order
+        self._answered = {}  # key -> number of its answers remember()ed
+        self._enriched = {}  # (key, raw 預計發售月份) -> AI fields
+        self.total = 0
+        self.sent = 0
+        self.reused = 0
+        self.from_store = 0
+
+    def split(self, products):
+        """Return (to_send, duplicates), both in input order."""
+        to_send = []
+        duplicates = []
+        for product in products:
+            self.total += 1
+            key = product_key(product)
+            raw_month = month_text(product.get("預計發售月份"))
+            if key is not None and raw_month in self._sent.get(key, ()):
+                duplicates.append(product)
+                continue
+            if self._stored_fields(key, product) is not None:
+                self.from_store += 1
+                duplicates.append(product)
+                continue
+            if key is not None:
+                self._sent.setdefault(key, []).append(raw_month)
+            to_send.append(product)
+        self.sent += len(to_send)
+        return to_send, duplicates
+
+    def remember(self, enriched_product, accepted=True):
+        """Take the answer for the next sent product of its key.
+
+        Only the AI fields of an `accepted` answer are kept for the later duplicates
+        (and the store); a rejected one still uses up its sent product.
+        """
+        key = product_key(enriched_product)
+        months = self._sent.get(key, ())
+        answered = self._answered.get(key, 0)
+        if answered >= len(months):
+            return
+        self._answered[key] = answered + 1
+        if not accepted:
+            return
+        fields = {
+            field: enriched_product.get(field)
+            for field in ENRICHED_FIELDS
+            if field in enriched_product
+        }
+        self._enriched[(key, months[answered])] = fields
+        if self.store is not None:
+            self.store.put(
+                key, months[answered], fields, product_name=enriched_product.get("品名")
+            )
+
+    def _stored_fields(self, key, product):
+        if key is None or self.store is None:
+            return None
+        return self.store.get(key, product.get("預計發售月份"))
+
+    def fan_out(self, product):
+        """The duplicate with the remembered AI fields, or None if none are known."""
+        key = product_key(product)
+        fields = self._stored_fields(key, product)
+        if fields is None:
+            fields = self._enriched.get((key, month_text(product.get("預計發售月份"))))
+        if fields is None:
+            return None
+        self.reused += 1
+        merged = ProductRecord.from_dict(product).to_dict()
+        merged.update(fields)
+        return merged
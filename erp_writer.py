@@ -0,0 +1,184 @@
+"""Streaming writers for the ERP output file.
+
+Rows are written one at a time, so the whole output never has to sit in memory as a
+workbook. The format follows the file extension:
+
+- .xlsx:    xlsxwriter in constant_memory mode (openpyxl write_only if xlsxwriter is
+            missing). Every value is stored as text, except strings starting with "=",
+            which stay formulas (the 品牌 / 廠商 lookups).
+- .csv:     UTF-8 with BOM so Excel opens the Chinese headers correctly.
+- .parquet: all-string columns, written in row groups (needs pyarrow).
+"""
+
+import csv
+import os
+from contextlib import ExitStack
+
+import openpyxl
+import pandas as pd
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# what writing an output file raises (pyarrow's errors derive from these too)
+WRITE_ERRORS = (OSError, ValueError, RuntimeError)
+OUTPUT_FORMATS = {".xlsx": "xlsx", ".csv": "csv", ".parquet": "parquet"}
+PARQUET_ROW_GROUP = 10000
+
+
+def output_format(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in OUTPUT_FORMATS:
+        raise ValueError(
+            f"Unsupported output type '{ext}', expected one of {sorted(OUTPUT_FORMATS)}"
+        )
+    return OUTPUT_FORMATS[ext]
+
+
+def _text(value):
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return ""
+    return str(value)
+
+
+class ErpWriter:
+    """Write rows (dicts keyed by column name, or sequences in column order) to `path`.
+
+    Use as a context manager; the header row is written on open.
+    """
+
+    def __init__(self, path, columns, sheet_name="ERP"):
+        self.path = path
+        self.columns = list(columns)
+        self.sheet_name = sheet_name
+        self.format = output_format(path)
+        self.rows_written = 0
+        self._files = None
+        self._open()
+
+    def _open(self):
+        if self.format == "xlsx" and xlsxwriter is not None:
+            self._book = xlsxwriter.Workbook(
+                self.path,
+                {
+                    "constant_memory": True,
+                    "strings_to_numbers": False,
+                    "strings_to_formulas": False,
+                    "strings_to_urls": False,
+                },
+            )
+            self._sheet = self._book.add_worksheet(self.sheet_name)
+            bold = self._book.add_format({"bold": True})
+            for col, name in enumerate(self.columns):
+                self._sheet.write_string(0, col, name, bold)
+            self._write = self._write_xlsxwriter
+        elif self.format == "xlsx":
+            self._book = openpyxl.Workbook(write_only=True)
+            self._sheet = self._book.create_sheet(self.sheet_name)
+            header = []
+            for name in self.columns:
+                cell = WriteOnlyCell(self._sheet, value=name)
+                cell.font = Font(bold=True)
+                header.append(cell)
+            self._sheet.append(header)
+            # openpyxl turns strings starting with "=" into formulas by itself
+            self._write = self._sheet.append
+        elif self.format == "csv":
+            # the file stays open for the writer's lifetime; close() releases it
+            with ExitStack() as stack:
+                handle = stack.enter_context(
+                    open(self.path, "w", encoding="utf-8-sig", newline="")
+                )
+                self._csv = csv.writer(handle)
+                self._csv.writerow(self.columns)
+                self._files = stack.pop_all()
+            self._write = self._csv.writerow
+        else:
+            if pq is None:
+                raise RuntimeError("Parquet output requires the 'pyarrow' package.")
+            self._schema = pa.schema([(name, pa.string()) for name in self.columns])
+            self._parquet = pq.ParquetWriter(self.path, self._schema)
+            self._batch = []
+            self._write = self._write_parquet
+
+    def _write_xlsxwriter(self, values):
+        row = self.rows_written + 1
+        for col, value in enumerate(values):
+            if not value:
+                continue
+            if value.startswith("="):
+                self._sheet.write_formula(row, col, value)
+            else:
+                self._sheet.write_string(row, col, value)
+
+    def _write_parquet(self, values):
+        self._batch.append(values)
+        if len(self._batch) >= PARQUET_ROW_GROUP:
+            self._flush_parquet()
+
+    def _flush_parquet(self):
+        if not self._batch:
+            return
+        table = pa.Table.from_arrays(
+            [pa.array(list(col), pa.string()) for col in zip(*self._batch)],
+            schema=self._schema,
+        )
+        self._parquet.write_table(table)
+        self._batch = []
+
+    def write_row(self, row):
+        if isinstance(row, dict):
+            values = [_text(row.get(name, "")) for name in self.columns]
+        else:
+            values = [_text(v) for v in row]
+        self._write(values)
+        self.rows_written += 1
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.write_row(row)
+
+    def close(self):
+        if self.format == "xlsx":
+            if xlsxwriter is not None:
+                self._book.close()
+            else:
+                self._book.save(self.path)
+        elif self.format == "csv":
+            self._files.close()
+        else:
+            self._flush_parquet()
+            self._parquet.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def write_erp_file(path, rows, columns=None, sheet_name="ERP"):
+    """Stream `rows` (a DataFrame or an iterable of dicts) to `path`; returns the row count.
+
+    An empty DataFrame writes nothing (no header-only file) and returns 0.
+    """
+    if hasattr(rows, "itertuples"):
+        if rows.empty:
+            return 0
+        columns = list(rows.columns) if columns is None else columns
+        rows = rows.reindex(columns=columns).itertuples(index=False, name=None)
+    with ErpWriter(path, columns, sheet_name=sheet_name) as writer:
+        writer.write_rows(rows)
+        return writer.rows_written
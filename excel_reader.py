@@ -0,0 +1,170 @@
+"""Reading vendor worksheets into string grids.
+
+Vendor files often carry a used range inflated to thousands of empty but formatted
+rows/columns. Instead of `pd.read_excel(...).astype(str)` over that whole range, the
+readers here stream cell values, turn them into strings as they go and trim the grid
+to the real data bounds (trailing empty rows and columns are dropped; leading ones are
+kept so row/column indices stay the same as in Excel).
+
+Engines:
+- "calamine": python-calamine (Rust), fastest; reads .xlsx/.xlsm/.xls/.ods.
+- "openpyxl": openpyxl read_only streaming; .xlsx/.xlsm only.
+- "pandas":   the original pd.read_excel path, kept for comparison and as last resort.
+- "auto":     calamine if installed, otherwise openpyxl (or pandas for .xls).
+"""
+
+import os
+import zipfile
+from datetime import date, datetime, time
+
+import openpyxl
+import pandas as pd
+from openpyxl.utils.exceptions import InvalidFileException
+
+try:
+    from python_calamine import CalamineError, CalamineWorkbook
+except ImportError:
+    CalamineError = None
+    CalamineWorkbook = None
+
+ENGINES = ("auto", "calamine", "openpyxl", "pandas")
+DEFAULT_ENGINE = "auto"
+
+# what opening/reading a broken, missing or unexpected workbook raises, per engine
+READ_ERRORS = (OSError, ValueError, KeyError, zipfile.BadZipFile, InvalidFileException)
+if CalamineError is not None:
+    READ_ERRORS += (CalamineError,)
+
+
+def cell_to_str(value):
+    """Render one cell value the way the parser expects it as text."""
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, float):
+        if pd.isna(value):
+            return ""
+        # Excel stores every number as float; show whole numbers without '.0'
+        return str(int(value)) if value.is_integer() else str(value)
+    if isinstance(value, datetime):
+        return str(value)
+    if isinstance(value, date):
+        return str(datetime(value.year, value.month, value.day))
+    if isinstance(value, time):
+        return value.isoformat()
+    return str(value)
+
+
+def resolve_engine(file_path, engine=DEFAULT_ENGINE):
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown Excel engine '{engine}', expected one of {ENGINES}")
+    if engine != "auto":
+        return engine
+    if CalamineWorkbook is not None:
+        return "calamine"
+    if os.path.splitext(file_path)[1].lower() == ".xls":
+        return "pandas"
+    return "openpyxl"
+
+
+def sheet_names(file_path, engine=DEFAULT_ENGINE):
+    """Names of all worksheets in the workbook, in tab order."""
+    engine = resolve_engine(file_path, engine)
+    if engine == "calamine":
+        return list(CalamineWorkbook.from_path(file_path).sheet_names)
+    if engine == "openpyxl":
+        workbook = openpyxl.load_workbook(file_path, read_only=True)
+        try:
+            return list(workbook.sheetnames)
+        finally:
+            workbook.close()
+    with pd.ExcelFile(file_path) as workbook:
+        return list(workbook.sheet_names)
+
+
+def iter_sheet_rows(file_path, sheet_name=0, engine=DEFAULT_ENGINE):
+    """Yield every row of a worksheet as a list of strings (trailing empty cells removed).
+
+    Rows are produced lazily; empty rows are yielded as []. `sheet_name` may be an
+    index or a name.
+    """
+    engine = resolve_engine(file_path, engine)
+    if engine == "calamine":
+        workbook = CalamineWorkbook.from_path(file_path)
+        if isinstance(sheet_name, int):
+            sheet = workbook.get_sheet_by_index(sheet_name)
+        else:
+            sheet = workbook.get_sheet_by_name(sheet_name)
+        # calamine starts each row at the first used column; pad back to column A
+        pad = [""] * (sheet.start[1] if sheet.start else 0)
+        for values in sheet.iter_rows():
+            yield _trim_row(pad + [cell_to_str(v) for v in values])
+    elif engine == "openpyxl":
+        workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            if isinstance(sheet_name, int):
+                sheet = workbook.worksheets[sheet_name]
+            else:
+                sheet = workbook[sheet_name]
+            # ignore the (often inflated) declared dimension and read what is stored
+            sheet.reset_dimensions()
+            for values in sheet.iter_rows(values_only=True):
+                yield _trim_row([cell_to_str(v) for v in values])
+        finally:
+            workbook.close()
+    else:
+        df = pd.read_excel(file_path, sheet_name=sheet_name, header=None)
+        for values in df.itertuples(index=False, name=None):
+            yield _trim_row([cell_to_str(v) for v in values])
+
+
+def _trim_row(cells):
+    end = len(cells)
+    while end and not cells[end - 1].strip():
+        end -= 1
+    return cells[:end]
+
+
+def read_sheet_rows(file_path, sheet_name=0, engine=DEFAULT_ENGINE):
+    """Return the worksheet trimmed to its data bounds as a rectangular list of string rows."""
+    rows = []
+    pending_empty = 0
+    width = 0
+    for cells in iter_sheet_rows(file_path, sheet_name=sheet_name, engine=engine):
+        if not cells:
+            # only keep empty rows that turn out to sit between data rows
+            pending_empty += 1
+            continue
+        if pending_empty:
+            rows.extend([] for _ in range(pending_empty))
+            pending_empty = 0
+        rows.append(cells)
+        width = max(width, len(cells))
+    return [r + [""] * (width - len(r)) for r in rows]
+
+
+def read_sheet(file_path, sheet_name=0, engine=DEFAULT_ENGINE, compact=False):
+    """Read a worksheet into a DataFrame of strings (empty cells are "").
+
+    Columns and index are 0-based integers, as with `pd.read_excel(header=None)`.
+    With `compact=True` every column is categorical: vendor sheets are mostly empty
+    cells and repeated values, which then cost one small code per cell.
+    """
+    if engine == "pandas":
+        # original behaviour, untrimmed
+        df = (
+            pd.read_excel(file_path, sheet_name=sheet_name, header=None)
+            .astype(str)
+            .replace("nan", "")
+        )
+    else:
+        df = pd.DataFrame(
+            read_sheet_rows(file_path, sheet_name=sheet_name, engine=engine),
+            dtype=object,
+        )
+    if compact:
+        df = df.astype("category")
+    return df
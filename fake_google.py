@@ -0,0 +1,598 @@
+"""In-memory stand-in for Google Sheets (gspread) and Drive v3.
+
+`GSheetsClient` can be pointed at a `FakeGoogleBackend` so the Sheets/Drive code paths
+(append_dataframe, ensure_month_sheet(s)) run offline. The backend counts every request
+and the bytes sent/received per endpoint, and can simulate latency and quota errors.
+
+Example:
+    backend = FakeGoogleBackend(latency=0.05)
+    base = backend.add_folder("究極進化版")
+    backend.add_spreadsheet("複製用範本-究極進化", parent=base, header=ERP_COLUMNS)
+    gs = backend.gsheets_client()
+    sheet_id = gs.ensure_month_sheet(2025, 3)
+    gs.append_dataframe(sheet_id, df, print)
+    print(backend.stats.summary())
+"""
+
+import copy
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+
+import gspread
+import httplib2
+import requests
+from googleapiclient.errors import HttpError
+
+from call_metrics import payload_size
+from gsheets import FOLDER_MIME_TYPE, SHEET_MIME_TYPE, GSheetsClient
+
+
+class FakeStats:
+    """Request and transfer counters, keyed by endpoint name (e.g. 'sheets.update')."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = Counter()
+        self.bytes_sent = Counter()
+        self.bytes_received = Counter()
+        self.errors = Counter()
+
+    def record(self, endpoint, sent, received):
+        with self._lock:
+            self.requests[endpoint] += 1
+            self.bytes_sent[endpoint] += sent
+            self.bytes_received[endpoint] += received
+
+    def record_error(self, endpoint):
+        with self._lock:
+            self.errors[endpoint] += 1
+
+    @property
+    def total_requests(self):
+        return sum(self.requests.values())
+
+    def summary(self):
+        """Return a plain dict that can be dumped to JSON or compared in benchmarks."""
+        with self._lock:
+            return {
+                "total_requests": sum(self.requests.values()),
+                "bytes_sent": sum(self.bytes_sent.values()),
+                "bytes_received": sum(self.bytes_received.values()),
+                "endpoints": {
+                    name: {
+                        "requests": self.requests[name],
+                        "bytes_sent": self.bytes_sent[name],
+                        "bytes_received": self.bytes_received[name],
+                        "errors": self.errors[name],
+                    }
+                    for name in sorted(set(self.requests) | set(self.errors))
+                },
+            }
+
+
+class FakeGoogleBackend:
+    """Shared state for the fake Sheets and Drive services.
+
+    latency:            seconds added to every request
+    latency_per_kb:     extra seconds per KiB transferred (so big reads/writes get slower)
+    quota_error_rate:   probability that a request fails with a 429/403 rate-limit error
+    storage_full:       make Drive copies fail with 'storageQuotaExceeded'
+    """
+
+    def __init__(
+        self,
+        latency=0.0,
+        latency_per_kb=0.0,
+        quota_error_rate=0.0,
+        storage_full=False,
+        seed=0,
+    ):
+        self.latency = latency
+        self.latency_per_kb = latency_per_kb
+        self.quota_error_rate = quota_error_rate
+        self.storage_full = storage_full
+        self.stats = FakeStats()
+        self.files = {}  # Drive metadata: id -> {'id', 'name', 'mimeType', 'parents', 'trashed'}
+        self.spreadsheets = {}  # id -> {'title': str, 'worksheets': {title: rows}}
+        self._forced_errors = Counter()
+        self._rng = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+
+    # --- fixtures ---
+    def _new_id(self, prefix):
+        return f"{prefix}{next(self._ids):06d}"
+
+    def add_folder(self, name, parent=None):
+        folder_id = self._new_id("folder")
+        self.files[folder_id] = {
+            "id": folder_id,
+            "name": name,
+            "mimeType": FOLDER_MIME_TYPE,
+            "parents": [parent] if parent else [],
+            "trashed": False,
+        }
+        return folder_id
+
+    def add_spreadsheet(
+        self, name, parent=None, header=None, rows=None, worksheet="究極進化"
+    ):
+        """Create a spreadsheet with one worksheet holding `header` followed by `rows`."""
+        sheet_id = self._new_id("sheet")
+        values = []
+        if header:
+            values.append([str(c) for c in header])
+        values.extend([str(c) for c in row] for row in rows or [])
+        self.files[sheet_id] = {
+            "id": sheet_id,
+            "name": name,
+            "mimeType": SHEET_MIME_TYPE,
+            "parents": [parent] if parent else [],
+            "trashed": False,
+        }
+        self.spreadsheets[sheet_id] = {"title": name, "worksheets": {worksheet: values}}
+        return sheet_id
+
+    def worksheet_values(self, sheet_id, worksheet="究極進化"):
+        return self.spreadsheets[sheet_id]["worksheets"][worksheet]
+
+    def fail_next(self, endpoint, count=1):
+        """Force the next `count` calls to `endpoint` to fail with a quota error."""
+        self._forced_errors[endpoint] += count
+
+    # --- clients ---
+    def gspread_client(self):
+        return FakeGspreadClient(self)
+
+    def drive_service(self):
+        return FakeDriveService(self)
+
+    def gsheets_client(self):
+        """Return a real `GSheetsClient` wired to this backend."""
+        return GSheetsClient(
+            gspread_client=self.gspread_client(), drive_factory=self.drive_service
+        )
+
+    # --- request plumbing ---
+    def request(self, endpoint, payload, handler):
+        """Run `handler()` as one simulated API request and return its result."""
+        with self._lock:
+            forced = self._forced_errors[endpoint] > 0
+            if forced:
+                self._forced_errors[endpoint] -= 1
+            fail = forced or (
+                self.quota_error_rate and self._rng.random() < self.quota_error_rate
+            )
+        sent = payload_size(payload)
+        if fail:
+            self.stats.record(endpoint, sent, 0)
+            self.stats.record_error(endpoint)
+            self._sleep(sent)
+            raise _quota_error(endpoint)
+        try:
+            with self._lock:
+                result = handler()
+        except Exception:
+            self.stats.record(endpoint, sent, 0)
+            self.stats.record_error(endpoint)
+            raise
+        received = payload_size(result)
+        self.stats.record(endpoint, sent, received)
+        self._sleep(sent + received)
+        return result
+
+    def _sleep(self, nbytes):
+        delay = self.latency + self.latency_per_kb * nbytes / 1024
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _quota_error(endpoint):
+    if endpoint.startswith("drive."):
+        resp = httplib2.Response({"status": 403, "reason": "Forbidden"})
+        content = json.dumps(
+            {
+                "error": {
+                    "code": 403,
+                    "message": "User rate limit exceeded.",
+                    "errors": [{"reason": "userRateLimitExceeded"}],
+                }
+            }
+        ).encode("utf-8")
+        return HttpError(resp, content, uri=f"fake://{endpoint}")
+    response = requests.Response()
+    response.status_code = 429
+    response._content = json.dumps(
+        {
+            "error": {
+                "code": 429,
+                "message": "Quota exceeded for quota metric 'Write requests'.",
+                "status": "RESOURCE_EXHAUSTED",
+            }
+        }
+    ).encode("utf-8")
+    return gspread.exceptions.APIError(response)
+
+
+# --- A1 notation helpers ---
+_A1_RE = re.compile(r"^([A-Z]*)(\d*)(?::([A-Z]*)(\d*))?$")
+
+
+def _col_number(letters):
+    n = 0
+    for ch in letters:
+        n = n * 26 + (ord(ch) - 64)
+    return n
+
+
+def _parse_range(a1):
+    """Parse 'A3:AE10', 'L:L' or 'A1' into 0-based (row0, col0, row1, col1); None = open."""
+    a1 = a1.split("!")[-1].replace("$", "").upper()
+    m = _A1_RE.match(a1)
+    if not m:
+        raise ValueError(f"Unsupported A1 range: {a1}")
+    c0, r0, c1, r1 = m.groups()
+    if m.group(3) is None and m.group(4) is None:
+        c1, r1 = c0, r0
+    return (
+        int(r0) - 1 if r0 else 0,
+        _col_number(c0) - 1 if c0 else 0,
+        int(r1) - 1 if r1 else None,
+        _col_number(c1) - 1 if c1 else None,
+    )
+
+
+class FakeWorksheet:
+    def __init__(self, backend, sheet_id, title):
+        self._backend = backend
+        self._sheet_id = sheet_id
+        self.title = title
+
+    @property
+    def _rows(self):
+        return self._backend.spreadsheets[self._sheet_id]["worksheets"][self.title]
+
+    def _trimmed(self):
+        rows = self._rows
+        last = len(rows)
+        while last and not any(c != "" for c in rows[last - 1]):
+            last -= 1
+        width = max((len(r) for r in rows[:last]), default=0)
+        return [list(r) + [""] * (width - len(r)) for r in rows[:last]]
+
+    def _read(self, a1):
+        r0, c0, r1, c1 = _parse_range(a1)
+        rows = self._trimmed()
+        r1 = len(rows) - 1 if r1 is None else min(r1, len(rows) - 1)
+        out = []
+        for r in range(r0, r1 + 1):
+            row = rows[r]
+            end = len(row) - 1 if c1 is None else c1
+            out.append(row[c0 : end + 1])
+        # the API drops trailing empty rows
+        while out and not any(c != "" for c in out[-1]):
+            out.pop()
+        return out
+
+    def _write(self, a1, values):
+        r0, c0, _, _ = _parse_range(a1)
+        rows = self._rows
+        for i, vals in enumerate(values):
+            r = r0 + i
+            while len(rows) <= r:
+                rows.append([])
+            row = rows[r]
+            needed = c0 + len(vals)
+            if len(row) < needed:
+                row.extend([""] * (needed - len(row)))
+            for j, v in enumerate(vals):
+                row[c0 + j] = "" if v is None else str(v)
+
+    # --- gspread Worksheet API subset ---
+    def get_all_values(self, **kwargs):
+        return self._backend.request(
+            "sheets.get_all_values", {"range": self.title}, lambda: self._trimmed()
+        )
+
+    def get_values(self, range_name=None, **kwargs):
+        a1 = range_name or "A1:ZZZ"
+        return self._backend.request(
+            "sheets.get_values", {"range": a1}, lambda: self._read(a1)
+        )
+
+    def row_values(self, row, **kwargs):
+        def handler():
+            rows = self._trimmed()
+            if row > len(rows):
+                return []
+            vals = list(rows[row - 1])
+            while vals and vals[-1] == "":
+                vals.pop()
+            return vals
+
+        return self._backend.request("sheets.row_values", {"row": row}, handler)
+
+    def col_values(self, col, **kwargs):
+        def handler():
+            vals = [r[col - 1] if len(r) >= col else "" for r in self._trimmed()]
+            while vals and vals[-1] == "":
+                vals.pop()
+            return vals
+
+        return self._backend.request("sheets.col_values", {"col": col}, handler)
+
+    def batch_get(self, ranges, **kwargs):
+        return self._backend.request(
+            "sheets.batch_get",
+            {"ranges": list(ranges)},
+            lambda: [self._read(a1) for a1 in ranges],
+        )
+
+    def update(self, values=None, range_name=None, **kwargs):
+        # accept the legacy gspread call order update(range_name, values)
+        if isinstance(values, str):
+            values, range_name = range_name, values
+        values = [list(v) for v in values]
+        a1 = range_name or "A1"
+
+        def handler():
+            self._write(a1, values)
+            return {"updatedRange": a1, "updatedRows": len(values)}
+
+        return self._backend.request(
+            "sheets.update", {"range": a1, "values": values}, handler
+        )
+
+    def batch_update(self, data, **kwargs):
+        data = [{"range": d["range"], "values": d["values"]} for d in data]
+
+        def handler():
+            for d in data:
+                self._write(d["range"], d["values"])
+            return {"totalUpdatedRanges": len(data)}
+
+        return self._backend.request("sheets.batch_update", {"data": data}, handler)
+
+
+class FakeSpreadsheet:
+    def __init__(self, backend, sheet_id):
+        self._backend = backend
+        self.id = sheet_id
+
+    @property
+    def title(self):
+        return self._backend.spreadsheets[self.id]["title"]
+
+    def worksheet(self, title):
+        def handler():
+            if title not in self._backend.spreadsheets[self.id]["worksheets"]:
+                raise gspread.exceptions.WorksheetNotFound(title)
+            return {"title": title}
+
+        self._backend.request("sheets.fetch_metadata", {"id": self.id}, handler)
+        return FakeWorksheet(self._backend, self.id, title)
+
+    def worksheets(self):
+        titles = self._backend.request(
+            "sheets.fetch_metadata",
+            {"id": self.id},
+            lambda: list(self._backend.spreadsheets[self.id]["worksheets"]),
+        )
+        return [FakeWorksheet(self._backend, self.id, t) for t in titles]
+
+    @property
+    def sheet1(self):
+        return self.worksheets()[0]
+
+
+class FakeGspreadClient:
+    def __init__(self, backend):
+        self._backend = backend
+
+    def open_by_key(self, key):
+        def handler():
+            if key not in self._backend.spreadsheets:
+                raise gspread.exceptions.SpreadsheetNotFound(key)
+            return {"id": key, "title": self._backend.spreadsheets[key]["title"]}
+
+        self._backend.request("sheets.open_by_key", {"key": key}, handler)
+        return FakeSpreadsheet(self._backend, key)
+
+
+# --- Drive v3 ---
+_QUERY_TOKEN_RE = re.compile(r"\s*(\(|\)|!=|=|'(?:\\.|[^'\\])*'|[A-Za-z_]+)")
+
+
+def _tokenize_query(q):
+    tokens = []
+    pos = 0
+    q = q.strip()
+    while pos < len(q):
+        m = _QUERY_TOKEN_RE.match(q, pos)
+        if not m:
+            raise ValueError(f"Unsupported Drive query near: {q[pos:]!r}")
+        tokens.append(m.group(1))
+        pos = m.end()
+    return tokens
+
+
+def _literal(tok):
+    if tok.startswith("'"):
+        return re.sub(r"\\(.)", r"\1", tok[1:-1])
+    return {"true": True, "false": False}.get(tok, tok)
+
+
+def _either(a, b):
+    return lambda f: a(f) or b(f)
+
+
+def _both(a, b):
+    return lambda f: a(f) and b(f)
+
+
+def compile_drive_query(q):
+    """Compile the subset of the Drive query language used by gsheets into a predicate.
+
+    Supports `and`/`or`/`not`, parentheses, `name = / != / contains`, `mimeType = / !=`,
+    `trashed = true|false` and `'<id>' in parents`.
+    """
+    tokens = _tokenize_query(q)
+    pos = 0
+
+    def peek():
+        return tokens[pos] if pos < len(tokens) else None
+
+    def take():
+        nonlocal pos
+        tok = tokens[pos]
+        pos += 1
+        return tok
+
+    def parse_or():
+        left = parse_and()
+        while peek() == "or":
+            take()
+            right = parse_and()
+            left = _either(left, right)
+        return left
+
+    def parse_and():
+        left = parse_term()
+        while peek() == "and":
+            take()
+            right = parse_term()
+            left = _both(left, right)
+        return left
+
+    def parse_term():
+        tok = take()
+        if tok == "(":
+            inner = parse_or()
+            take()  # ')'
+            return inner
+        if tok == "not":
+            inner = parse_term()
+            return lambda f: not inner(f)
+        if tok.startswith("'"):
+            value = _literal(tok)
+            take()  # 'in'
+            field = take()
+            return lambda f: value in f.get(field, [])
+        op = take()
+        value = _literal(take())
+        if op == "contains":
+            return lambda f: str(value) in str(f.get(tok, ""))
+        if op == "=":
+            return lambda f: f.get(tok) == value
+        if op == "!=":
+            return lambda f: f.get(tok) != value
+        raise ValueError(f"Unsupported Drive query operator: {op}")
+
+    predicate = parse_or()
+    if pos != len(tokens):
+        raise ValueError(f"Unsupported Drive query: {q}")
+    return predicate
+
+
+class FakeDriveRequest:
+    """Mimics googleapiclient's HttpRequest: nothing happens until execute()."""
+
+    def __init__(self, backend, endpoint, payload, handler):
+        self._backend = backend
+        self._endpoint = endpoint
+        self._handler = handler
+        self.uri = f"fake://drive/v3/{endpoint.split('.', 1)[1]}"
+        self.body = json.dumps(payload, ensure_ascii=False)
+        self._payload = payload
+
+    def execute(self, num_retries=0):
+        return self._backend.request(self._endpoint, self._payload, self._handler)
+
+
+class FakeDriveFiles:
+    def __init__(self, backend):
+        self._backend = backend
+
+    def _meta(self, f):
+        return {k: copy.deepcopy(v) for k, v in f.items() if k != "trashed"}
+
+    def list(self, q=None, pageSize=100, pageToken=None, **kwargs):
+        def handler():
+            predicate = compile_drive_query(q) if q else (lambda f: True)
+            matches = [
+                self._meta(f) for f in self._backend.files.values() if predicate(f)
+            ]
+            start = int(pageToken or 0)
+            page = matches[start : start + pageSize]
+            resp = {"files": page}
+            if start + pageSize < len(matches):
+                resp["nextPageToken"] = str(start + pageSize)
+            return resp
+
+        payload = {"q": q, "pageSize": pageSize, "pageToken": pageToken}
+        return FakeDriveRequest(self._backend, "drive.files.list", payload, handler)
+
+    def create(self, body=None, **kwargs):
+        def handler():
+            if body.get("mimeType") == FOLDER_MIME_TYPE:
+                parent = (body.get("parents") or [None])[0]
+                new_id = self._backend.add_folder(body["name"], parent=parent)
+            else:
+                new_id = self._backend._new_id("file")
+                self._backend.files[new_id] = {
+                    "id": new_id,
+                    "name": body.get("name", ""),
+                    "mimeType": body.get("mimeType", ""),
+                    "parents": list(body.get("parents") or []),
+                    "trashed": False,
+                }
+            return {"id": new_id, "name": body.get("name", "")}
+
+        return FakeDriveRequest(self._backend, "drive.files.create", body, handler)
+
+    def copy(self, fileId=None, body=None, **kwargs):
+        def handler():
+            if self._backend.storage_full:
+                resp = httplib2.Response({"status": 403, "reason": "Forbidden"})
+                content = b'{"error": {"errors": [{"reason": "storageQuotaExceeded"}], "code": 403, "message": "storageQuotaExceeded"}}'
+                raise HttpError(resp, content, uri="fake://drive/v3/files/copy")
+            src = self._backend.spreadsheets[fileId]
+            new_id = self._backend._new_id("sheet")
+            self._backend.files[new_id] = {
+                "id": new_id,
+                "name": body.get("name", src["title"]),
+                "mimeType": SHEET_MIME_TYPE,
+                "parents": list(body.get("parents") or []),
+                "trashed": False,
+            }
+            self._backend.spreadsheets[new_id] = {
+                "title": body.get("name", src["title"]),
+                "worksheets": copy.deepcopy(src["worksheets"]),
+            }
+            return {"id": new_id, "name": self._backend.files[new_id]["name"]}
+
+        payload = {"fileId": fileId, "body": body}
+        return FakeDriveRequest(self._backend, "drive.files.copy", payload, handler)
+
+    def get(self, fileId=None, **kwargs):
+        def handler():
+            meta = self._meta(self._backend.files[fileId])
+            meta.setdefault("owners", [{"emailAddress": "owner@example.com"}])
+            return meta
+
+        return FakeDriveRequest(
+            self._backend, "drive.files.get", {"fileId": fileId}, handler
+        )
+
+
+class FakeDriveService:
+    def __init__(self, backend):
+        self._backend = backend
+
+    def files(self):
+        return FakeDriveFiles(self._backend)
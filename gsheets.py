@@ -1,22 +1,51 @@
-import re
 import os
-from typing import Optional
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import gspread
+from google.auth.exceptions import GoogleAuthError
 from google.oauth2.service_account import Credentials
 
+from call_metrics import payload_size, record_call
+from dedup import product_key
+
 try:
     from googleapiclient.discovery import build
 except Exception:
     build = None
 
+# what a failed Sheets/Drive call raises (requests' connection errors are OSErrors)
+SHEET_ERRORS = (
+    gspread.exceptions.GSpreadException,
+    GoogleAuthError,
+    OSError,
+    ValueError,
+    RuntimeError,
+)
+if build is not None:
+    from googleapiclient.errors import HttpError
+
+    SHEET_ERRORS += (HttpError,)
+
 # Scope for Google Sheets and Drive
 SCOPES = [
     "https://www.googleapis.com/auth/spreadsheets",
     "https://www.googleapis.com/auth/drive",
 ]
 
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+SHEET_MIME_TYPE = "application/vnd.google-apps.spreadsheet"
+
+# Monthly spreadsheets are named like '究極進化-2025年03月結單'
+MONTH_SHEET_NAME_RE = re.compile(r"^究極進化-(\d{4})年(\d{2})月結單$")
+
+
+def month_sheet_name(year: int, month: int) -> str:
+    """Return the spreadsheet name used for a given month."""
+    return f"究極進化-{year}年{int(month):02d}月結單"
+
 
-def extract_sheet_id_from_url(url: str) -> Optional[str]:
+def extract_sheet_id_from_url(url: str) -> str | None:
     """Extracts the Google Sheet ID from various URL formats."""
     if not url:
         return None
@@ -29,12 +58,48 @@ def extract_sheet_id_from_url(url: str) -> Optional[str]:
     return None
 
 
+def col_letter(n):
+    """1 -> 'A', 27 -> 'AA'."""
+    s = ""
+    while n > 0:
+        n, rem = divmod(n - 1, 26)
+        s = chr(65 + rem) + s
+    return s
+
+
+def _rows_for_header(df, sheet_header):
+    """DataFrame rows as lists in the order of the sheet's header row."""
+    rows = []
+    for _, r in df.iterrows():
+        # Build row by mapping df values to each header column name
+        vals = [str(r.get(col_name, "")) for col_name in sheet_header]
+        rows.append(vals)
+    return rows
+
+
 class GSheetsClient:
-    def __init__(self, creds_json_path: str = None, creds_dict: dict = None):
+    def __init__(
+        self,
+        creds_json_path: str | None = None,
+        creds_dict: dict | None = None,
+        gspread_client=None,
+        drive_factory=None,
+        recorder=None,
+    ):
         """Initialize with either path to a service account JSON or the dict contents.
 
         Note: user must provide a service account JSON with proper permissions to edit the target sheet.
+
+        `gspread_client` and `drive_factory` (a callable returning a Drive v3 service) replace
+        the live Google backends, e.g. with the in-memory stand-in from `fake_google`.
+        When a `call_metrics.CallRecorder` is given, every Sheets/Drive call is recorded.
         """
+        self._drive_factory = drive_factory
+        self.recorder = recorder
+        if gspread_client is not None:
+            self.creds = None
+            self.client = gspread_client
+            return
         if creds_dict:
             # create Credentials from a dict (service account info)
             self.creds = Credentials.from_service_account_info(
@@ -52,6 +117,66 @@ class GSheetsClient:
         # gspread accepts google-auth credentials
         self.client = gspread.authorize(self.creds)
 
+    def _call(self, endpoint, fn, *args, source=None, **kwargs):
+        """Invoke one Sheets API call, recording it when a recorder is attached."""
+        return record_call(self.recorder, endpoint, fn, *args, source=source, **kwargs)
+
+    def _execute(self, endpoint, request, source=None):
+        """Execute a Drive request object, recording it when a recorder is attached."""
+        body = getattr(request, "body", None)
+        request_bytes = payload_size(body) + payload_size(getattr(request, "uri", ""))
+        return record_call(
+            self.recorder,
+            endpoint,
+            request.execute,
+            source=source,
+            request_bytes=request_bytes,
+        )
+
+    def _open_worksheet(self, sheet_id, logger):
+        """The worksheet of `sheet_id` that holds the ERP rows."""
+        sh = self._call(
+            "sheets.open_by_key", self.client.open_by_key, sheet_id, source=sheet_id
+        )
+
+        # Prefer a sheet named '究極進化' first (explicit user request)
+        worksheet = None
+        try:
+            worksheet = self._call(
+                "sheets.worksheet", sh.worksheet, "究極進化", source=sheet_id
+            )
+            logger("Selected worksheet '究極進化' by name.")
+        except gspread.exceptions.WorksheetNotFound:
+            # Try to choose the correct worksheet by header match, then name 'ERP', else first sheet
+            worksheets = self._call("sheets.worksheets", sh.worksheets, source=sheet_id)
+            logger(
+                f"Spreadsheet '{sh.title}' has sheets: {[ws.title for ws in worksheets]}"
+            )
+            for ws in worksheets:
+                vals = self._call(
+                    "sheets.get_all_values", ws.get_all_values, source=sheet_id
+                )
+                if not vals:
+                    continue
+                header = [c.strip() for c in vals[0]]
+                if len(header) >= 3 and header[0:3] == ["ERP", "GD", "平台前導"]:
+                    worksheet = ws
+                    logger(f"Auto-detected worksheet '{ws.title}' by header match.")
+                    break
+
+            if worksheet is None:
+                try:
+                    worksheet = self._call(
+                        "sheets.worksheet", sh.worksheet, "ERP", source=sheet_id
+                    )
+                    logger("Selected worksheet 'ERP' by name.")
+                except gspread.exceptions.WorksheetNotFound:
+                    worksheet = self._call(
+                        "sheets.worksheets", lambda: sh.sheet1, source=sheet_id
+                    )
+                    logger(f"Falling back to the first worksheet: '{worksheet.title}'.")
+        return worksheet
+
     def append_dataframe(self, sheet_id: str, df, logger):
         """Append rows from DataFrame to the first sheet of the spreadsheet specified by sheet_id.
 
@@ -63,41 +188,12 @@ class GSheetsClient:
         the appended rows, the validation will apply. The code here appends values only.
         """
         try:
-            sh = self.client.open_by_key(sheet_id)
-
-            # Prefer a sheet named '究極進化' first (explicit user request)
-            worksheet = None
-            try:
-                worksheet = sh.worksheet("究極進化")
-                logger("Selected worksheet '究極進化' by name.")
-            except Exception:
-                # Try to choose the correct worksheet by header match, then name 'ERP', else first sheet
-                worksheets = sh.worksheets()
-                logger(
-                    f"Spreadsheet '{sh.title}' has sheets: {[ws.title for ws in worksheets]}"
-                )
-                for ws in worksheets:
-                    vals = ws.get_all_values()
-                    if not vals:
-                        continue
-                    header = [c.strip() for c in vals[0]]
-                    if len(header) >= 3 and header[0:3] == ["ERP", "GD", "平台前導"]:
-                        worksheet = ws
-                        logger(f"Auto-detected worksheet '{ws.title}' by header match.")
-                        break
-
-                if worksheet is None:
-                    try:
-                        worksheet = sh.worksheet("ERP")
-                        logger("Selected worksheet 'ERP' by name.")
-                    except Exception:
-                        worksheet = sh.sheet1
-                        logger(
-                            f"Falling back to the first worksheet: '{worksheet.title}'."
-                        )
+            worksheet = self._open_worksheet(sheet_id, logger)
 
             # find first empty row by locating the last non-empty '條碼' cell (preferred)
-            values_before = worksheet.get_all_values()
+            values_before = self._call(
+                "sheets.get_all_values", worksheet.get_all_values, source=sheet_id
+            )
             start_row = 1
             last_row = 0
             barcode_col_index = None
@@ -141,34 +237,29 @@ class GSheetsClient:
                 # If header unavailable, fall back to DataFrame columns
                 sheet_header = list(df.columns)
             expected_cols = len(sheet_header)
-            rows = []
-            for _, r in df.iterrows():
-                # Build row by mapping df values to each header column name
-                vals = [str(r.get(col_name, "")) for col_name in sheet_header]
-                # ensure correct length
-                if len(vals) < expected_cols:
-                    vals = vals + [""] * (expected_cols - len(vals))
-                elif len(vals) > expected_cols:
-                    vals = vals[:expected_cols]
-                rows.append(vals)
+            rows = _rows_for_header(df, sheet_header)
 
             # write explicitly to the computed range
             end_row = start_row + len(rows) - 1
 
-            # compute end column letter dynamically
-            def col_letter(n):
-                s = ""
-                while n > 0:
-                    n, rem = divmod(n - 1, 26)
-                    s = chr(65 + rem) + s
-                return s
-
             end_col = col_letter(expected_cols)
             verify_range = f"A{start_row}:{end_col}{end_row}"
-            worksheet.update(verify_range, rows, value_input_option="USER_ENTERED")
+            self._call(
+                "sheets.update",
+                worksheet.update,
+                verify_range,
+                rows,
+                value_input_option="USER_ENTERED",
+                source=sheet_id,
+            )
 
             # read back to verify
-            written = worksheet.get_values(verify_range)
+            written = self._call(
+                "sheets.get_values",
+                worksheet.get_values,
+                verify_range,
+                source=sheet_id,
+            )
             if not written or all(all(cell == "" for cell in row) for row in written):
                 logger(
                     f"Warning: After write, the read-back range {verify_range} appears empty or blank. Please verify the target worksheet and permissions."
@@ -185,13 +276,153 @@ class GSheetsClient:
             logger(f"Error appending to Google Sheet: {e}\n{tb}")
             raise
 
+    def upsert_dataframe(self, sheet_id: str, df, logger, update_existing=False):
+        """Write rows from DataFrame without duplicating products already in the sheet.
+
+        Only the header row and the 條碼 / 貨號 columns are read; they are indexed by
+        `dedup.product_key`. Rows whose product is already in the sheet are skipped, or
+        with `update_existing` overwritten in place (one batch update); the others are
+        appended after the last row with a 條碼 or 貨號 (one update). Running
+        the same batch twice therefore adds nothing the second time. Sheets without a
+        '條碼' header column are appended to.
+        """
+        try:
+            worksheet = self._open_worksheet(sheet_id, logger)
+            header = [
+                c.strip()
+                for c in self._call(
+                    "sheets.row_values", worksheet.row_values, 1, source=sheet_id
+                )
+            ]
+            if "條碼" not in header:
+                logger("'條碼' column not found; appending without duplicate check.")
+                return self.append_dataframe(sheet_id, df, logger)
+
+            key_cols = [header.index("條碼")]
+            if "貨號" in header:
+                key_cols.append(header.index("貨號"))
+            ranges = [f"{col_letter(c + 1)}:{col_letter(c + 1)}" for c in key_cols]
+            columns = self._call(
+                "sheets.batch_get", worksheet.batch_get, ranges, source=sheet_id
+            )
+
+            def cell(column, idx):
+                if idx >= len(column) or not column[idx]:
+                    return ""
+                return str(column[idx][0]).strip()
+
+            barcodes = columns[0] if columns else []
+            skus = columns[1] if len(columns) > 1 else []
+            existing = {}  # product key -> sheet row number
+            last_row = 1
+            for idx in range(1, max(len(barcodes), len(skus))):
+                barcode, sku = cell(barcodes, idx), cell(skus, idx)
+                if barcode or sku:
+                    # rows with only a 貨號 count too, so they are not written over
+                    last_row = idx + 1
+                key = product_key({"國際條碼": barcode, "貨號": sku})
+                if key is not None:
+                    existing.setdefault(key, idx + 1)
+
+            rows = _rows_for_header(df, header)
+            barcode_col = header.index("條碼")
+            sku_col = header.index("貨號") if "貨號" in header else None
+            new_rows = []
+            new_keys = {}  # product key -> index in new_rows
+            updates = {}  # sheet row number -> values
+            skipped = 0
+            for vals in rows:
+                key = product_key(
+                    {
+                        "國際條碼": vals[barcode_col],
+                        "貨號": vals[sku_col] if sku_col is not None else None,
+                    }
+                )
+                if key is None:
+                    new_rows.append(vals)
+                elif key in existing:
+                    if update_existing:
+                        updates[existing[key]] = vals
+                    else:
+                        skipped += 1
+                elif key in new_keys:
+                    # the same product twice in this batch: keep one row
+                    if update_existing:
+                        new_rows[new_keys[key]] = vals
+                    else:
+                        skipped += 1
+                else:
+                    new_keys[key] = len(new_rows)
+                    new_rows.append(vals)
+
+            end_col = col_letter(len(header))
+            if updates:
+                self._call(
+                    "sheets.batch_update",
+                    worksheet.batch_update,
+                    [
+                        {"range": f"A{row}:{end_col}{row}", "values": [vals]}
+                        for row, vals in sorted(updates.items())
+                    ],
+                    value_input_option="USER_ENTERED",
+                    source=sheet_id,
+                )
+            if new_rows:
+                start_row = last_row + 1
+                self._call(
+                    "sheets.update",
+                    worksheet.update,
+                    f"A{start_row}:{end_col}{start_row + len(new_rows) - 1}",
+                    new_rows,
+                    value_input_option="USER_ENTERED",
+                    source=sheet_id,
+                )
+            logger(
+                f"Upsert to Google Sheet (ID: {sheet_id}, sheet '{worksheet.title}'): "
+                f"{len(new_rows)} appended, {len(updates)} updated, {skipped} already present and skipped."
+            )
+        except Exception as e:
+            import traceback
+
+            tb = traceback.format_exc()
+            logger(f"Error upserting to Google Sheet: {e}\n{tb}")
+            raise
+
+    def _drive_service(self):
+        """Build a Drive v3 service. Services are not thread-safe, so build one per worker."""
+        if self._drive_factory is not None:
+            return self._drive_factory()
+        if build is None:
+            raise RuntimeError("googleapiclient is required for Drive operations")
+        return build("drive", "v3", credentials=self.creds)
+
+    def _list_drive_files(self, drive, q, fields="files(id,name)"):
+        """Run a Drive files().list query and follow nextPageToken until exhausted."""
+        files = []
+        page_token = None
+        while True:
+            resp = self._execute(
+                "drive.files.list",
+                drive.files().list(
+                    q=q,
+                    spaces="drive",
+                    fields=f"nextPageToken, {fields}",
+                    pageSize=1000,
+                    pageToken=page_token,
+                ),
+            )
+            files.extend(resp.get("files", []))
+            page_token = resp.get("nextPageToken")
+            if not page_token:
+                return files
+
     def ensure_month_sheet(
         self,
         year: int,
         month: int,
         logger=None,
         base_folder_name: str = "究極進化版",
-        base_folder_id: str = None,
+        base_folder_id: str | None = None,
     ) -> str:
         """Ensure a monthly sheet exists and return its spreadsheet ID.
 
@@ -201,88 +432,125 @@ class GSheetsClient:
         - In the year folder, look for a spreadsheet named '究極進化-YYYY年MM月結單'. If found, return its id.
         - Otherwise, in the base folder look for a template file whose name contains '複製用範本-究極進化' and copy it, renaming to '究極進化-YYYY年MM月結單'. Return new id.
 
+        Single-month wrapper around `ensure_month_sheets`; copy failures are re-raised.
         Requires Drive API access (googleapiclient)."""
-        if build is None:
-            raise RuntimeError("googleapiclient is required for Drive operations")
+        resolved = self.ensure_month_sheets(
+            [(year, month)],
+            logger=logger,
+            base_folder_name=base_folder_name,
+            base_folder_id=base_folder_id,
+            raise_copy_errors=True,
+        )
+        return resolved.get((int(year), int(month)))
 
-        drive = build("drive", "v3", credentials=self.creds)
+    def ensure_month_sheets(
+        self,
+        months,
+        logger=None,
+        base_folder_name: str = "究極進化版",
+        base_folder_id: str | None = None,
+        max_workers: int = 4,
+        raise_copy_errors: bool = False,
+    ) -> dict:
+        """Resolve the monthly sheets for several (year, month) pairs at once.
+
+        All '究極進化-YYYY年MM月結單' spreadsheets under the relevant year folders are listed
+        with one paginated query and indexed by month. The template is only copied for
+        months that are missing, and those copies run concurrently.
+
+        Returns a dict {(year, month): spreadsheet_id}. Months that could not be resolved
+        are left out; with `raise_copy_errors` a failed copy is re-raised instead.
+        """
+        months = sorted({(int(y), int(m)) for y, m in months})
+        if not months:
+            return {}
 
-        target_name = f"究極進化-{year}年{int(month):02d}月結單"
+        drive = self._drive_service()
 
         # determine base folder id: use provided base_folder_id, otherwise find by name
-        if base_folder_id:
-            # assume provided id is valid
-            pass
-        else:
-            q = f"name='{base_folder_name}' and mimeType='application/vnd.google-apps.folder' and trashed=false"
-            resp = (
-                drive.files()
-                .list(q=q, spaces="drive", fields="files(id,name)", pageSize=10)
-                .execute()
+        if not base_folder_id:
+            q = f"name='{base_folder_name}' and mimeType='{FOLDER_MIME_TYPE}' and trashed=false"
+            resp = self._execute(
+                "drive.files.list",
+                drive.files().list(
+                    q=q, spaces="drive", fields="files(id,name)", pageSize=10
+                ),
             )
             files = resp.get("files", [])
             if not files:
                 if logger:
                     logger(f"Base folder '{base_folder_name}' not found on Drive.")
-                return None
+                return {}
             base_folder_id = files[0]["id"]
 
-        # find or create year folder under base folder
-        q_year = f"name='{year}' and mimeType='application/vnd.google-apps.folder' and '{base_folder_id}' in parents and trashed=false"
-        resp = (
-            drive.files()
-            .list(q=q_year, spaces="drive", fields="files(id,name)", pageSize=10)
-            .execute()
-        )
-        year_files = resp.get("files", [])
-        year_folder_id = year_files[0]["id"] if year_files else None
+        # find all needed year folders under the base folder with one query
+        years = sorted({y for y, _ in months})
+        names_clause = " or ".join(f"name='{y}'" for y in years)
+        q_years = f"({names_clause}) and mimeType='{FOLDER_MIME_TYPE}' and '{base_folder_id}' in parents and trashed=false"
+        year_folder_ids = {}
+        for f in self._list_drive_files(drive, q_years):
+            year_folder_ids.setdefault(f["name"], f["id"])
 
-        if year_folder_id:
-            if logger:
-                logger(f"Found year folder '{year}' (id: {year_folder_id}).")
-        else:
+        for year in years:
+            if str(year) in year_folder_ids:
+                if logger:
+                    logger(
+                        f"Found year folder '{year}' (id: {year_folder_ids[str(year)]})."
+                    )
+                continue
             # create the year folder under base_folder
             try:
                 folder_body = {
                     "name": str(year),
-                    "mimeType": "application/vnd.google-apps.folder",
+                    "mimeType": FOLDER_MIME_TYPE,
                     "parents": [base_folder_id],
                 }
-                created = (
-                    drive.files().create(body=folder_body, fields="id,name").execute()
+                created = self._execute(
+                    "drive.files.create",
+                    drive.files().create(body=folder_body, fields="id,name"),
                 )
-                year_folder_id = created.get("id")
+                year_folder_ids[str(year)] = created.get("id")
                 if logger:
                     logger(
-                        f"Created year folder '{year}' (id: {year_folder_id}) under base folder."
+                        f"Created year folder '{year}' (id: {created.get('id')}) under base folder."
                     )
             except Exception as e:
                 if logger:
                     logger(f"Failed to create year folder '{year}': {e}")
                 raise
 
-        # if year folder exists, search for target spreadsheet inside it
-        if year_folder_id:
-            q_sheet = f"name='{target_name}' and mimeType='application/vnd.google-apps.spreadsheet' and '{year_folder_id}' in parents and trashed=false"
-            resp = (
-                drive.files()
-                .list(q=q_sheet, spaces="drive", fields="files(id,name)", pageSize=5)
-                .execute()
-            )
-            found = resp.get("files", [])
-            if found:
+        # one listing of every monthly sheet inside those year folders
+        parents_clause = " or ".join(
+            f"'{fid}' in parents" for fid in year_folder_ids.values()
+        )
+        q_sheets = f"name contains '究極進化-' and mimeType='{SHEET_MIME_TYPE}' and ({parents_clause}) and trashed=false"
+        month_index = {}
+        for f in self._list_drive_files(drive, q_sheets):
+            m = MONTH_SHEET_NAME_RE.match(f.get("name", ""))
+            if m:
+                month_index.setdefault((int(m.group(1)), int(m.group(2))), f["id"])
+
+        resolved = {}
+        missing = []
+        for year, month in months:
+            if (year, month) in month_index:
+                resolved[(year, month)] = month_index[(year, month)]
                 if logger:
                     logger(
-                        f"Found existing monthly sheet '{target_name}' in folder '{year}'."
+                        f"Found existing monthly sheet '{month_sheet_name(year, month)}' in folder '{year}'."
                     )
-                return found[0]["id"]
-
-        # not found in year folder: look for template in base folder
-        q_template = f"name contains '複製用範本-究極進化' and mimeType='application/vnd.google-apps.spreadsheet' and '{base_folder_id}' in parents and trashed=false"
-        resp = (
-            drive.files()
-            .list(q=q_template, spaces="drive", fields="files(id,name)", pageSize=5)
-            .execute()
+            else:
+                missing.append((year, month))
+        if not missing:
+            return resolved
+
+        # not found in year folders: look for template in base folder
+        q_template = f"name contains '複製用範本-究極進化' and mimeType='{SHEET_MIME_TYPE}' and '{base_folder_id}' in parents and trashed=false"
+        resp = self._execute(
+            "drive.files.list",
+            drive.files().list(
+                q=q_template, spaces="drive", fields="files(id,name)", pageSize=5
+            ),
         )
         templates = resp.get("files", [])
         if not templates:
@@ -290,16 +558,43 @@ class GSheetsClient:
                 logger(
                     "No template spreadsheet named like '複製用範本-究極進化' found in base folder."
                 )
-            return None
+            return resolved
 
         template_id = templates[0]["id"]
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(max_workers, len(missing)))
+        ) as pool:
+            futures = {
+                pool.submit(
+                    self._copy_template,
+                    template_id,
+                    month_sheet_name(year, month),
+                    year_folder_ids.get(str(year)) or base_folder_id,
+                    logger,
+                ): (year, month)
+                for year, month in missing
+            }
+            for future in as_completed(futures):
+                try:
+                    resolved[futures[future]] = future.result()
+                except Exception:
+                    # _copy_template already logged the reason
+                    if raise_copy_errors:
+                        raise
+        return resolved
+
+    def _copy_template(self, template_id, target_name, parent_id, logger=None):
+        """Copy the monthly template into `parent_id` as `target_name` and return the new id."""
+        drive = self._drive_service()
         # copy template into year folder with new name
-        copy_body = {"name": target_name, "parents": [year_folder_id or base_folder_id]}
+        copy_body = {"name": target_name, "parents": [parent_id]}
         try:
-            new_file = (
-                drive.files()
-                .copy(fileId=template_id, body=copy_body, fields="id,name")
-                .execute()
+            new_file = self._execute(
+                "drive.files.copy",
+                drive.files().copy(
+                    fileId=template_id, body=copy_body, fields="id,name"
+                ),
+                source=target_name,
             )
             if logger:
                 logger(
@@ -314,10 +609,9 @@ class GSheetsClient:
             if isinstance(e, HttpError) and "storageQuotaExceeded" in err_str:
                 # try to fetch template owners to help identify whose Drive is full
                 try:
-                    meta = (
-                        drive.files()
-                        .get(fileId=template_id, fields="id,name,owners")
-                        .execute()
+                    meta = self._execute(
+                        "drive.files.get",
+                        drive.files().get(fileId=template_id, fields="id,name,owners"),
                     )
                     owners = meta.get("owners", [])
                     owner_emails = [
@@ -1,9 +1,12 @@
-import tkinter as tk
-from tkinter import messagebox, scrolledtext, filedialog
-import threading
-import os
 import json
+import os
+import threading
+import tkinter as tk
 from datetime import datetime
+from tkinter import filedialog, messagebox, scrolledtext
+
+from layout_cache import cache_path
+from preload import Preloader, profile_memory, resolve_base_dir, resolve_data_dir
 
 CONFIG_FILE = "config.json"
 
@@ -28,6 +31,15 @@ class App:
         self.sheet_entry = tk.Entry(self.root, width=80)
         self.sheet_entry.pack(pady=5)
 
+        # Batch API mode for large, non-urgent runs
+        self.batch_var = tk.BooleanVar(value=False)
+        self.batch_check = tk.Checkbutton(
+            self.root,
+            text="批次模式（Batch API：費用較低，但可能需數小時才完成）",
+            variable=self.batch_var,
+        )
+        self.batch_check.pack()
+
         # Buttons for import files and start processing
         btn_frame = tk.Frame(self.root)
         btn_frame.pack(pady=10)
@@ -56,6 +68,7 @@ class App:
         self.output_label.pack(fill=tk.X, padx=10)
 
         # internal state
+        self.config = {}  # contents of config.json
         self.input_files = []  # full paths
         self.output_file = None
 
@@ -71,6 +84,10 @@ class App:
 
         self.load_api_key()
 
+        # read the reference files and parse imported files while the user is busy
+        self.preloader = Preloader(resolve_base_dir())
+        self.root.after(100, self.preloader.start)
+
     def log(self, message):
         self.log_area.insert(
             tk.END, f"{datetime.now().strftime('%H:%M:%S')} - {message}\n"
@@ -84,6 +101,7 @@ class App:
             if os.path.exists(CONFIG_FILE):
                 with open(CONFIG_FILE, "r") as f:
                     config = json.load(f)
+                    self.config = config
                     api_key = config.get("OPENAI_API_KEY")
                     sheet = config.get("DRIVE_URL")
                     if api_key:
@@ -97,14 +115,16 @@ class App:
 
     def import_files(self):
         """Opens file dialog to let user select input Excel files and displays them (filenames only)."""
+        # batch mode has no 10-file limit (process_files_main checks it again)
+        batch_mode = self.get_batch_mode()
         files = filedialog.askopenfilenames(
-            title="請選擇 1 到 10 個訂單檔案",
+            title="請選擇訂單檔案" if batch_mode else "請選擇 1 到 10 個訂單檔案",
             filetypes=[("Excel files", "*.xlsx *.xls")],
         )
         if not files:
             self.log("未選擇任何檔案。")
             return
-        if len(files) > 10:
+        if len(files) > 10 and not batch_mode:
             messagebox.showerror("錯誤", "您選擇了超過 10 個檔案，請重新選擇。")
             return
         self.input_files = list(files)
@@ -112,6 +132,11 @@ class App:
         for f in self.input_files:
             self.input_files_listbox.insert(tk.END, os.path.basename(f))
         self.log(f"已匯入 {len(self.input_files)} 個檔案。")
+        self.preloader.parse_files(
+            self.input_files,
+            track_memory=profile_memory(self.get_config),
+            layout_cache=cache_path(self.get_config, resolve_data_dir()),
+        )
 
     def select_output_file(self):
         """Opens save-as dialog to let user choose output file and returns path."""
@@ -119,14 +144,25 @@ class App:
             title="請指定輸出檔案位置",
             defaultextension=".xlsx",
             initialfile="究極進化版用.xlsx",
-            filetypes=[("Excel file", "*.xlsx")],
+            filetypes=[
+                ("Excel file", "*.xlsx"),
+                ("CSV (UTF-8)", "*.csv"),
+                ("Parquet", "*.parquet"),
+            ],
         )
         return out
 
     def save_api_key(self, api_key):
-        """Saves API key and Drive URL to the config file."""
+        """Saves API key and Drive URL to the config file, keeping its other settings."""
         try:
-            cfg = {"OPENAI_API_KEY": api_key}
+            cfg = {}
+            if os.path.exists(CONFIG_FILE):
+                try:
+                    with open(CONFIG_FILE, "r") as f:
+                        cfg = json.load(f)
+                except (OSError, ValueError):
+                    cfg = {}
+            cfg["OPENAI_API_KEY"] = api_key
             try:
                 sheet = self.sheet_entry.get().strip()
                 if sheet:
@@ -135,10 +171,21 @@ class App:
                 pass
             with open(CONFIG_FILE, "w") as f:
                 json.dump(cfg, f)
+            self.config = cfg
             self.log("API Key 與 Google Drive 設定已儲存至 config.json 供下次使用。")
         except Exception as e:
             self.log(f"儲存設定檔時發生錯誤: {e}")
 
+    def get_config(self, key, default=None):
+        """A setting from config.json, e.g. OPENAI_BASE_URL."""
+        return self.config.get(key, default)
+
+    def get_batch_mode(self):
+        try:
+            return self.batch_var.get()
+        except tk.TclError:
+            return False
+
     def get_sheet_url(self):
         try:
             return self.sheet_entry.get().strip()
@@ -0,0 +1,137 @@
+"""Incremental parser for the enrichment response while it is being streamed.
+
+The model answers with one JSON object of the form
+{"global_info": {...}, "products": [{...}, {...}, ...]}. `EnrichmentStreamParser` is
+fed the text chunks as they arrive and hands back every product object as soon as its
+closing brace has been received, so products can be validated while the rest of the
+answer is still being generated. If the stream breaks off, everything completed up to
+that point has already been returned.
+
+`products_seen` counts every finished element of the products array, so it is the
+index in the request where a broken-off answer stopped; the indices of elements that
+were not valid JSON objects are listed in `failed`.
+"""
+
+import json
+
+
+class EnrichmentStreamParser:
+    def __init__(self, products_key="products", global_key="global_info"):
+        self.products_key = products_key
+        self.global_key = global_key
+        self.global_info = None
+        self.products_seen = 0  # finished product objects, malformed ones included
+        self.complete = False  # the top-level object was closed
+        self.failed = []  # indices of product objects that were not valid JSON
+        self._chunks = []
+        self._buf = ""
+        self._pos = 0  # next index of _buf to scan
+        self._depth = 0
+        self._in_str = False
+        self._escape = False
+        self._str_start = None
+        self._expect_key = False
+        self._last_key = None
+        self._key = None  # top-level key whose value is being read
+        self._value_start = None
+        self._value_kind = None
+        self._item_start = None
+
+    def text(self):
+        """Everything received so far."""
+        return "".join(self._chunks)
+
+    def feed(self, chunk):
+        """Add a chunk of text; returns the product dicts completed by it."""
+        if not chunk:
+            return []
+        self._chunks.append(chunk)
+        self._buf += chunk
+        products = []
+        buf = self._buf
+        i = self._pos
+        n = len(buf)
+        while i < n:
+            c = buf[i]
+            if self._in_str:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_str = False
+                    if self._depth == 1 and self._expect_key:
+                        self._last_key = self._loads(buf[self._str_start : i + 1])
+                i += 1
+                continue
+            if c == '"':
+                self._in_str = True
+                self._str_start = i
+            elif c in "{[":
+                if self._depth == 1:
+                    self._value_start = i
+                    self._value_kind = c
+                elif (
+                    self._depth == 2
+                    and c == "{"
+                    and self._key == self.products_key
+                    and self._value_kind == "["
+                ):
+                    self._item_start = i
+                self._depth += 1
+                if self._depth == 1:
+                    self._expect_key = True
+            elif c in "}]" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 2 and self._item_start is not None:
+                    product = self._loads(buf[self._item_start : i + 1])
+                    self._item_start = None
+                    if isinstance(product, dict):
+                        products.append(product)
+                    else:
+                        self.failed.append(self.products_seen)
+                    self.products_seen += 1
+                elif self._depth == 1:
+                    if self._key == self.global_key:
+                        value = self._loads(buf[self._value_start : i + 1])
+                        if isinstance(value, dict):
+                            self.global_info = value
+                    self._value_start = None
+                elif self._depth == 0:
+                    self.complete = True
+            elif self._depth == 1:
+                if c == ":":
+                    self._expect_key = False
+                    self._key = self._last_key
+                elif c == ",":
+                    self._expect_key = True
+                    self._key = None
+            i += 1
+        self._pos = i
+        self._trim()
+        return products
+
+    def _trim(self):
+        # keep only what an unfinished key, product or global_info may still need;
+        # the full text stays available in _chunks
+        if self._item_start is not None:
+            cut = self._item_start
+        elif self._value_start is not None and self._key == self.global_key:
+            cut = self._value_start
+        elif self._in_str and self._depth == 1:
+            cut = self._str_start
+        else:
+            cut = self._pos
+        if cut > 0:
+            self._buf = self._buf[cut:]
+            self._pos -= cut
+            for name in ("_str_start", "_value_start", "_item_start"):
+                value = getattr(self, name)
+                if value is not None:
+                    setattr(self, name, value - cut if value >= cut else None)
+
+    def _loads(self, text):
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            return None
@@ -0,0 +1,124 @@
+"""Registry of known vendor sheet layouts, so header detection can be skipped.
+
+Vendors send the same template every time. After `data_processor.locate_headers` has
+found the header cells of a sheet, the rows down to the last header (the header block)
+are fingerprinted and the header positions stored under that fingerprint. A later
+sheet whose top rows have a known fingerprint reuses the positions after checking that
+each cached cell still holds one of its header keywords; otherwise the full search
+runs as before and its result is stored.
+
+Digits are ignored in the fingerprint, so dates or order numbers in the title rows
+do not make a template look new. The registry is a small SQLite file next to the
+program (LAYOUT_CACHE false in config.json turns it off); worker processes open it
+themselves, which SQLite handles with its own locking.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from datetime import datetime
+
+CACHE_FILENAME = "layout_cache.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS layouts (
+    header_rows  INTEGER NOT NULL,
+    fingerprint  TEXT NOT NULL,
+    header_locs  TEXT NOT NULL,
+    updated_at   TEXT NOT NULL,
+    PRIMARY KEY (header_rows, fingerprint)
+)
+"""
+_DIGITS = re.compile(r"\d+")
+
+
+def cache_path(get_config, data_dir):
+    """Path of the registry, or None when LAYOUT_CACHE is turned off."""
+    if not get_config("LAYOUT_CACHE", True):
+        return None
+    return os.path.join(data_dir, CACHE_FILENAME)
+
+
+def _cell_text(value):
+    if value is None:
+        return ""
+    return _DIGITS.sub("#", str(value).strip().casefold())
+
+
+def fingerprint(df, header_rows):
+    """Hash of the first `header_rows` rows of `df`."""
+    rows = df.iloc[:header_rows].values.tolist()
+    text = "\x1e".join("\x1f".join(_cell_text(c) for c in row) for row in rows)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _cell_matches(df, loc, keywords):
+    row, col = loc
+    try:
+        cell = str(df.at[row, col]).casefold()
+    except (KeyError, IndexError, ValueError):
+        return False
+    return any(kw.casefold() in cell for kw in keywords)
+
+
+class LayoutRegistry:
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=10)
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+
+    def find(self, df, header_map):
+        """Cached header_locs for `df` if its top rows are known and still valid."""
+        heights = [
+            h
+            for (h,) in self._conn.execute(
+                "SELECT DISTINCT header_rows FROM layouts ORDER BY header_rows"
+            )
+            if h <= len(df)
+        ]
+        for height in heights:
+            row = self._conn.execute(
+                "SELECT header_locs FROM layouts WHERE header_rows = ? AND fingerprint = ?",
+                (height, fingerprint(df, height)),
+            ).fetchone()
+            if row is None:
+                continue
+            header_locs = {
+                key: tuple(loc) if loc else (None, None)
+                for key, loc in json.loads(row[0]).items()
+            }
+            valid = set(header_locs) == set(header_map) and all(
+                _cell_matches(df, loc, header_map[key])
+                for key, loc in header_locs.items()
+                if loc[0] is not None
+            )
+            if valid:
+                return header_locs
+        return None
+
+    def remember(self, df, header_locs):
+        """Store the layout of a sheet whose headers were found by a full search."""
+        rows = [r for r, _ in header_locs.values() if r is not None]
+        if not rows:
+            return
+        height = int(max(rows)) + 1
+        locs = {
+            key: [int(r), int(c)] if r is not None else None
+            for key, (r, c) in header_locs.items()
+        }
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO layouts VALUES (?, ?, ?, ?)",
+                (
+                    height,
+                    fingerprint(df, height),
+                    json.dumps(locs, ensure_ascii=False),
+                    datetime.now().isoformat(timespec="seconds"),
+                ),
+            )
+
+    def close(self):
+        self._conn.close()
@@ -1,36 +1,110 @@
-import os
-import sys
+import functools
 import json
-import pandas as pd
-import openai
-from tkinter import messagebox
+import multiprocessing
+import os
+import re
+import sqlite3
+import time
 import tkinter as tk
+from tkinter import messagebox
 
+from call_metrics import CallRecorder
+from debug_capture import DebugCapture
+from dedup import ProductDeduplicator
 from gui import App
-from ai_api import call_ai_for_enrichment
-from data_processor import (
-    extract_products_from_excel,
-    generate_erp_excel,
-    extract_order_date_from_filename,
-)
-from data_processor import build_final_df
+from layout_cache import cache_path
+from pipeline import ITEM_ERRORS, FilePipeline, PipelineError
+from preload import profile_memory, resolve_base_dir, resolve_data_dir
+from product_store import STORE_FILENAME, ProductStore, reference_version
+from records import OrderLine, ProductRecord
+from stage_profiler import StageProfiler, profile_stage
+from startup import timing_enabled, warm_up_imports
+
+
+def parse_sheet_target(sheet_url):
+    """Return (sheet_id, base_folder_id) from a Google Sheet/Drive URL or bare ID."""
+    sheet_id = None
+    base_folder_id = None
+    if sheet_url:
+        m = re.search(r"/d/([a-zA-Z0-9-_]+)", sheet_url)
+        if m:
+            sheet_id = m.group(1)
+        else:
+            m2 = re.search(r"/folders/([a-zA-Z0-9-_]+)", sheet_url)
+            if m2:
+                base_folder_id = m2.group(1)
+            elif re.match(r"^[a-zA-Z0-9-_]{20,}$", sheet_url):
+                # ambiguous ID: treat as sheet id by default
+                sheet_id = sheet_url
+    return sheet_id, base_folder_id
 
 
 def process_files_main(app, api_key, input_files, output_file):
-    # --- DEBUG FLAG ---
-    # Set to True to save the prompt and AI response for each file.
-    SAVE_DEBUG_FILES = True
-    # --- END DEBUG FLAG ---
+    # The heavy modules are imported here rather than at startup so the window shows
+    # right away; normally startup.warm_up_imports has already loaded them.
+    import openai
+
+    from ai_api import (
+        AI_MODEL,
+        build_enrichment_request,
+        save_debug_prompt,
+        stream_ai_for_enrichment,
+    )
+    from batch_enrichment import (
+        BATCH_POLL_INTERVAL_S,
+        LocalBatchClient,
+        run_enrichment_batch,
+    )
+    from business_calendar import BusinessCalendar
+    from data_processor import (
+        build_final_df,
+        extract_order_date_from_filename,
+        generate_erp_excel,
+        iter_erp_rows,
+        parse_vendor_file,
+    )
+    from excel_reader import READ_ERRORS
+    from output_sink import (
+        SHEETS_WRITE_MODES,
+        OutputSink,
+        partition_by_month,
+        route_partitions,
+    )
+    from reference_data import load_reference_data
+
     try:
-        client = openai.OpenAI(api_key=api_key)
+        # OPENAI_BASE_URL in config.json points the client at another endpoint, e.g. a
+        # local mock_openai_server.py for offline runs; otherwise the OPENAI_BASE_URL
+        # environment variable or the official endpoint is used
+        base_url = app.get_config("OPENAI_BASE_URL") or None
+        # retries are handled (and counted) in ai_api.create_chat_completion
+        client = openai.OpenAI(api_key=api_key, max_retries=0, base_url=base_url)
+        recorder = CallRecorder()
+        # tracemalloc slows parsing 3-4x, so peak memory is only measured on request
+        track_memory = profile_memory(app.get_config)
+        profiler = StageProfiler(track_memory=track_memory)
         app.log("OpenAI API Key 已設定。")
+        if base_url:
+            app.log(f"使用自訂的 OpenAI 端點: {base_url}")
         app.save_api_key(api_key)
         # input_files and output_file are provided by the GUI
         if not input_files:
             app.log("操作取消：未選擇任何檔案。")
             app.select_button.config(state=tk.NORMAL)
             return
-        if len(input_files) > 10:
+        batch_mode = bool(app.get_batch_mode())
+        if batch_mode:
+            # the local stand-in lets batch mode run without the real endpoint
+            if os.environ.get("VOP_LOCAL_BATCH"):
+                batch_client = LocalBatchClient(chat_client=client)
+                batch_poll_interval = 0.5
+            else:
+                batch_client = client
+                batch_poll_interval = BATCH_POLL_INTERVAL_S
+            app.log(
+                "批次模式：所有檔案會合併成一個 Batch API 工作送出，完成時間可能較長。"
+            )
+        elif len(input_files) > 10:
             messagebox.showerror("錯誤", "您選擇了超過 10 個檔案，請重新選擇。")
             app.log("錯誤：選擇的檔案超過 10 個。")
             app.select_button.config(state=tk.NORMAL)
@@ -44,140 +118,85 @@ def process_files_main(app, api_key, input_files, output_file):
         app.log(f"輸出檔案將儲存至: {output_file}")
 
         # Resolve base directory robustly so external files placed next to the exe are found
-        if getattr(sys, "frozen", False) and hasattr(sys, "_MEIPASS"):
-            # Running in a PyInstaller bundle (one-file or one-folder)
-            base_dir = sys._MEIPASS
-        else:
-            base_dir = os.path.dirname(os.path.abspath(__file__))
-
-        shipper_file = os.path.join(base_dir, "廠商名單.xlsx")
+        base_dir = resolve_base_dir()
         app.log(
             f"Using base directory: {base_dir} (looking for 廠商名單.xlsx, service_account.json, config.json here)"
         )
-        shipper_list = []
-        if os.path.exists(shipper_file):
-            try:
-                shipper_df = pd.read_excel(shipper_file)
-                # If explicit header exists, use it. Otherwise prefer column D (index 3) then C (index 2).
-                raw_list = []
-                if "寄件廠商" in shipper_df.columns:
-                    raw_list = shipper_df["寄件廠商"].dropna().astype(str).tolist()
-                else:
-                    for idx in (3, 2):
-                        try:
-                            col = shipper_df.iloc[:, idx].dropna().astype(str)
-                            if not col.empty:
-                                raw_list = col.tolist()
-                                app.log(
-                                    f"注意: 未找到 '寄件廠商' 標題，改從第 {idx + 1} 欄讀取。"
-                                )
-                                break
-                        except Exception:
-                            continue
-
-                # Expand comma-separated values in each cell into individual tokens
-                expanded = []
-                for cell in raw_list:
-                    for part in [p.strip() for p in str(cell).split(",")]:
-                        if part:
-                            expanded.append(part)
-
-                # Remove duplicates while preserving order
-                seen = set()
-                ordered = []
-                for v in expanded:
-                    if v not in seen:
-                        seen.add(v)
-                        ordered.append(v)
-
-                shipper_list = ordered
-                app.log(
-                    f"成功讀取 {len(shipper_list)} 個寄件廠商（已展開逗號分隔值）。"
-                )
-            except Exception as e:
-                app.log(f"讀取 '廠商名單.xlsx' 時發生錯誤: {e}")
-        else:
-            app.log("警告: '廠商名單.xlsx' 不存在。")
-
-        # Load brand map from '品牌對照資料查詢.xlsx' (Cols A, B, D)
-        brand_map = {}
-        brand_keywords = []
-        brand_ref_file = os.path.join(base_dir, "品牌對照資料查詢.xlsx")
-        if os.path.exists(brand_ref_file):
-            try:
-                # Use headers=None and iloc to be robust against missing headers
-                brand_df = pd.read_excel(brand_ref_file, sheet_name=0, header=None)
-                brand_keywords = brand_df.iloc[:, 0].dropna().astype(str).tolist()
-
-                for _, row in brand_df.iterrows():
-                    keyword = row.iloc[0]  # Column A
-                    code = row.iloc[1]  # Column B
-
-                    # Column D for display name, check if it exists
-                    display_name = None
-                    if brand_df.shape[1] > 3:
-                        display_name = row.iloc[3]
-
-                    if pd.notna(keyword) and pd.notna(code):
-                        brand_map[str(keyword).lower()] = {
-                            "code": str(code),
-                            "display_name": str(display_name)
-                            if pd.notna(display_name)
-                            else None,
-                        }
-                app.log(f"成功讀取 {len(brand_map)} 個品牌關鍵字與對照資料。")
-            except Exception as e:
-                app.log(f"讀取 '品牌對照資料查詢.xlsx' 時發生錯誤: {e}")
-        else:
-            app.log("警告: '品牌對照資料查詢.xlsx' 不存在，將無法自動偵測品牌。")
-
-        # Load category map from '類別1資料查詢.xlsx'
-        category1_map = {}
-        category1_keywords_sorted = []
-        category1_ref_file = os.path.join(base_dir, "類別1資料查詢.xlsx")
-        if os.path.exists(category1_ref_file):
-            try:
-                cat1_df = pd.read_excel(category1_ref_file, sheet_name=0, header=None)
-                # Sort keywords by length descending to match specific terms first
-                keywords = cat1_df.iloc[:, 0].dropna().astype(str).tolist()
-                category1_keywords_sorted = sorted(keywords, key=len, reverse=True)
-
-                for _, row in cat1_df.iterrows():
-                    keyword = row.iloc[0]
-                    cat1_val = row.iloc[1] if cat1_df.shape[1] > 1 else None
-                    suffix = row.iloc[3] if cat1_df.shape[1] > 3 else None
-                    command = row.iloc[5] if cat1_df.shape[1] > 5 else None  # Column F
-
-                    if pd.notna(keyword):
-                        category1_map[str(keyword)] = {
-                            "類1": str(cat1_val) if pd.notna(cat1_val) else "",
-                            "suffix": str(suffix) if pd.notna(suffix) else "",
-                            "command": str(command) if pd.notna(command) else "",
-                        }
-                app.log(f"成功讀取 {len(category1_map)} 個類別關鍵字與對照資料。")
-            except Exception as e:
-                app.log(f"讀取 '類別1資料查詢.xlsx' 時發生錯誤: {e}")
-        else:
-            app.log("警告: '類別1資料查詢.xlsx' 不存在，將無法自動處理類別與品名重構。")
+        # normally the GUI has loaded the reference files in the background already
+        preloader = getattr(app, "preloader", None)
+        with profile_stage(profiler, "reference_load"):
+            if preloader is not None:
+                references = preloader.reference_data()
+            else:
+                references = load_reference_data(base_dir)
+        for line in references.logs:
+            app.log(line)
+        shipper_list = references.shipper_list
+        brand_map = references.brand_map
+        brand_keywords = references.brand_keywords
+        category1_map = references.category1_map
+        category1_keywords_sorted = references.category1_keywords_sorted
+        # public holidays skipped by 內部結單日期 (holidays.txt next to the exe, or
+        # HOLIDAY_FILE); not in base_dir, which is the bundle's temp dir when frozen
+        calendar = BusinessCalendar.from_config(
+            app.get_config, resolve_data_dir(), logger=app.log
+        )
+        # OUTPUT_VALUE_MODE "resolved": write 品牌 / 廠商 codes instead of the volatile
+        # INDIRECT lookup formulas wherever the reference files have them
+        value_mode = app.get_config("OUTPUT_VALUE_MODE", "formula")
+        resolver = None
+        if value_mode == "resolved":
+            resolver = references.code_resolver()
+            app.log("輸出模式: 品牌與廠商代碼直接寫入數值（無法對照者保留公式）。")
 
         all_processed_products = []
-        output_dir = os.path.dirname(output_file)
+        # Products enriched in earlier runs (product_store.sqlite, next to the exe)
+        # or earlier in this run are not sent to the AI again
+        product_store = None
+        if app.get_config("PRODUCT_STORE", True):
+            try:
+                product_store = ProductStore(
+                    os.path.join(resolve_data_dir(), STORE_FILENAME),
+                    reference_version(
+                        AI_MODEL, brand_keywords, category1_keywords_sorted
+                    ),
+                )
+                app.log(f"商品資料庫中有 {len(product_store)} 個已分析過的商品。")
+            except (sqlite3.Error, OSError, ValueError) as e:
+                app.log(f"無法開啟商品資料庫，將不使用先前的分析結果: {e}")
+        dedup = ProductDeduplicator(store=product_store)
+        # header positions of known vendor templates (layout_cache.sqlite)
+        layout_cache = cache_path(app.get_config, resolve_data_dir())
+        # AI prompts/responses go into one <output>_debug.zip when DEBUG_CAPTURE is on
+        try:
+            debug = DebugCapture.from_config(
+                app.get_config,
+                os.path.splitext(output_file)[0] + "_debug.zip",
+                logger=app.log,
+            )
+        except (TypeError, ValueError) as e:
+            app.log(f"DEBUG_CAPTURE 設定有誤，不儲存除錯檔案: {e}")
+            debug = None
 
-        for i, file_path in enumerate(input_files):
+        def prepare_file(i, file_path, parsed):
+            """Brand override and debug paths for one parsed file; None if it has no products."""
             app.log(
                 f"\n--- 處理檔案 {i + 1}/{len(input_files)}: {os.path.basename(file_path)} ---"
             )
 
-            # STAGE 1: Reliable data extraction using Python
-            pre_extracted_products, full_csv_for_ai = extract_products_from_excel(
-                file_path, app.log
-            )
+            # STAGE 1 ran in the parse pool; replay its log and merge its timings
+            for line in parsed["logs"]:
+                app.log(line)
+            profiler.merge(parsed["stages"])
+            pre_extracted_products = parsed["products"]
+            full_csv_for_ai = parsed["csv"]
+            found_brands = parsed["brands"]
 
             if not pre_extracted_products:
                 app.log(
                     "在檔案中沒有找到有效的商品列 (基於東海成本/售價)，跳過此檔案。"
                 )
-                continue
+                return None
 
             # STAGE 2: AI-based enrichment
             app.log(
@@ -187,78 +206,90 @@ def process_files_main(app, api_key, input_files, output_file):
             # --- Begin new brand scanning logic ---
             file_brand_override = None
             single_brand = None  # Define single_brand here to have it in scope later
-            try:
-                raw_df = pd.read_excel(file_path, sheet_name=0, header=None).astype(str)
-                found_brands = set()
+            app.log(
+                f"在檔案中掃描到 {len(found_brands)} 個品牌: {found_brands if found_brands else '無'}"
+            )
 
-                all_cells = raw_df.unstack().dropna().astype(str).str.lower()
+            if len(found_brands) == 1:
+                single_brand = found_brands.pop()
+                brand_info = brand_map.get(single_brand.lower())
+                if brand_info:
+                    file_brand_override = brand_info.get("code")
+                    app.log(
+                        f"啟用單一品牌覆寫模式，將使用品牌代碼: {file_brand_override}"
+                    )
+            # --- End new brand scanning logic ---
 
-                for keyword in brand_keywords:
-                    if keyword and str(keyword).strip():
-                        if all_cells.str.contains(
-                            keyword.lower(), na=False, regex=False
-                        ).any():
-                            found_brands.add(keyword)
+            debug_name = None
+            base_name = os.path.splitext(os.path.basename(file_path))[0]
+            if debug is not None and debug.wants(base_name):
+                debug_name = f"{i + 1:02d}_{base_name}"
 
+            to_send, duplicates = dedup.split(pre_extracted_products)
+            if duplicates:
                 app.log(
-                    f"在檔案中掃描到 {len(found_brands)} 個品牌: {found_brands if found_brands else '無'}"
+                    f"{len(duplicates)} 個商品已分析過（商品資料庫、先前的檔案或本檔），將沿用其 AI 分析結果，不重複送出。"
                 )
-
-                if len(found_brands) == 1:
-                    single_brand = found_brands.pop()
-                    brand_info = brand_map.get(single_brand.lower())
-                    if brand_info:
-                        file_brand_override = brand_info.get("code")
-                        app.log(
-                            f"啟用單一品牌覆寫模式，將使用品牌代碼: {file_brand_override}"
-                        )
-
-            except Exception as e:
-                app.log(f"掃描檔案品牌時發生錯誤: {e}")
-            # --- End new brand scanning logic ---
-
-            debug_path_prefix = None
-            if SAVE_DEBUG_FILES:
-                base_name = os.path.splitext(os.path.basename(file_path))[0]
-                debug_path_prefix = os.path.normpath(
-                    os.path.join(output_dir, base_name)
+            filename_order_date, filename_shipper = filename_global_info(file_path)
+
+            return {
+                "index": i,
+                "file_path": file_path,
+                "products": pre_extracted_products,
+                "send": to_send,
+                "duplicates": duplicates,
+                "filename_order_date": filename_order_date,
+                "filename_shipper": filename_shipper,
+                "csv": full_csv_for_ai,
+                "single_brand": single_brand,
+                "file_brand_override": file_brand_override,
+                "debug_name": debug_name,
+            }
+
+        def accept_ai_product(job, p, pool):
+            """Price check and brand override for one AI product; None if filtered out."""
+            cost = p.get("起始進價")
+            sell_price = p.get("建議售價")
+            if not (cost and sell_price):
+                app.log(
+                    f"Info: AI product '{p.get('品名', 'N/A')}' was filtered out due to missing price."
                 )
-
-            # Using the new refactored AI call
-            ai_json_str = call_ai_for_enrichment(
-                client,
-                full_csv_for_ai,
-                pre_extracted_products,
-                shipper_list,
-                brand_keywords,
-                category1_keywords_sorted,
-                app.log,
-                debug_path_prefix=debug_path_prefix,
-            )
+                return None
+            record = ProductRecord(p, pool=pool)
+            # --- Apply file-level brand override ---
+            if job["file_brand_override"] and job["single_brand"]:
+                record["final_brand_info"] = {
+                    "name": job["single_brand"],
+                    "code": job["file_brand_override"],
+                }
+            return record
+
+        def log_brand_override(job):
+            if job["file_brand_override"] and job["single_brand"]:
+                app.log(f"套用檔案級別的品牌覆寫: {job['file_brand_override']}")
+
+        def save_ai_response(job, ai_json_str):
+            if job["debug_name"] and ai_json_str:
+                debug.add(f"{job['debug_name']}_enrichment_response.json", ai_json_str)
+
+        def finish_file(job, ai_json_str):
+            """Merge the AI response (or fall back to the extracted data) into order lines."""
+            pre_extracted_products = job["send"]
 
             enriched_products = []
             global_info = {}
 
-            if not ai_json_str:
-                app.log("AI 豐富化失敗，將僅使用 Python 提取的資料繼續處理。")
-                enriched_products = (
-                    pre_extracted_products  # Fallback to python-extracted data
+            if not needs_ai(job):
+                app.log(
+                    "本檔案的商品皆已分析過，寄件廠商與結單日期取自檔名，未呼叫 AI。"
                 )
+            elif not ai_json_str:
+                app.log("AI 豐富化失敗，將僅使用 Python 提取的資料繼續處理。")
+                enriched_products = list(
+                    pre_extracted_products
+                )  # Fallback to python-extracted data
             else:
-                if SAVE_DEBUG_FILES and debug_path_prefix:
-                    try:
-                        ai_response_filename = (
-                            f"{debug_path_prefix}_enrichment_response.json"
-                        )
-                        with open(ai_response_filename, "w", encoding="utf-8") as f:
-                            try:
-                                parsed = json.loads(ai_json_str)
-                                json.dump(parsed, f, ensure_ascii=False, indent=4)
-                            except json.JSONDecodeError:
-                                f.write(ai_json_str)
-                        app.log(f"AI 豐富化回應已儲存至: {ai_response_filename}")
-                    except Exception as e:
-                        app.log(f"儲存 AI 豐富化回應時發生錯誤: {e}")
+                save_ai_response(job, ai_json_str)
 
                 try:
                     ai_data = json.loads(ai_json_str)
@@ -266,25 +297,15 @@ def process_files_main(app, api_key, input_files, output_file):
                     ai_products = ai_data.get("products", [])
 
                     # Validate products from AI based on price
+                    pool = {}
                     validated_products = []
                     for p in ai_products:
-                        cost = p.get("起始進價")
-                        sell_price = p.get("建議售價")
-                        if cost and sell_price:
-                            validated_products.append(p)
-                        else:
-                            app.log(
-                                f"Info: AI product '{p.get('品名', 'N/A')}' was filtered out due to missing price."
-                            )
-
-                    # --- Apply file-level brand override ---
-                    if file_brand_override and single_brand:
-                        app.log(f"套用檔案級別的品牌覆寫: {file_brand_override}")
-                        for p in validated_products:
-                            p["final_brand_info"] = {
-                                "name": single_brand,
-                                "code": file_brand_override,
-                            }
+                        record = accept_ai_product(job, p, pool)
+                        # only answers that pass the price check are reused
+                        dedup.remember(p, accepted=record is not None)
+                        if record is not None:
+                            validated_products.append(record)
+                    log_brand_override(job)
 
                     enriched_products = validated_products
                     app.log("成功合併 AI 的分析結果。")
@@ -293,17 +314,32 @@ def process_files_main(app, api_key, input_files, output_file):
                     app.log(
                         "錯誤: AI 回傳的不是有效的 JSON。將僅使用 Python 提取的資料。"
                     )
-                    enriched_products = pre_extracted_products  # Fallback
-                    global_info = {}
-
-                except json.JSONDecodeError:
-                    app.log(
-                        "錯誤: AI 回傳的不是有效的 JSON。將僅使用 Python 提取的資料。"
-                    )
-                    enriched_products = pre_extracted_products
+                    enriched_products = list(pre_extracted_products)  # Fallback
                     global_info = {}
 
-            # --- STAGE 3: Merging and Final Processing ---
+            enriched_products.extend(fan_out_duplicates(job))
+            complete_global_info(job, global_info)
+            app.log(f"成功處理了 {len(enriched_products)} 個商品。")
+            # all lines of this file share the same global_info dict
+            return [OrderLine(global_info, p) for p in enriched_products]
+
+        def fan_out_duplicates(job):
+            """The file's duplicate products, with the AI fields of their first occurrence."""
+            products = []
+            pool = {}
+            for p in job["duplicates"]:
+                merged = dedup.fan_out(p)
+                if merged is None:
+                    # the first occurrence was not enriched; keep the extracted data
+                    products.append(p)
+                    continue
+                record = accept_ai_product(job, merged, pool)
+                if record is not None:
+                    products.append(record)
+            return products
+
+        def filename_global_info(file_path):
+            """(order date, shipper) found in the file name, either may be None."""
             filename_order_date = extract_order_date_from_filename(file_path, app.log)
 
             filename_based_shipper = None
@@ -314,6 +350,18 @@ def process_files_main(app, api_key, input_files, output_file):
                     if str(s).strip() and str(s).lower() in lowname:
                         filename_based_shipper = s
                         break
+            return filename_order_date, filename_based_shipper
+
+        def needs_ai(job):
+            """Whether the file has products to enrich or global info only the AI can find."""
+            if job["send"]:
+                return True
+            return not (job["filename_order_date"] and job["filename_shipper"])
+
+        def complete_global_info(job, global_info):
+            """STAGE 3: shipper and order date from the file name override the AI's."""
+            filename_order_date = job["filename_order_date"]
+            filename_based_shipper = job["filename_shipper"]
 
             if filename_based_shipper:
                 app.log(
@@ -327,172 +375,300 @@ def process_files_main(app, api_key, input_files, output_file):
                 global_info["結單日期"] = chosen_date
                 global_info["內部結單日期"] = chosen_date
 
-            # Append products to the master list for final processing
-            for p in enriched_products:
-                all_processed_products.append(
-                    {"global_info": global_info, "product_data": p}
+        def enrich_file(i, file_path, parsed):
+            """STAGE 2 and 3 for one parsed file; runs in the pipeline's I/O thread.
+
+            The answer is streamed: each product is validated and turned into an order
+            line as soon as it arrives. The lines share one global_info dict, which is
+            filled in once the model's global_info (and the file-name overrides) are known.
+            """
+            job = prepare_file(i, file_path, parsed)
+            if job is None:
+                return []
+            if not needs_ai(job):
+                return finish_file(job, None)
+            if not job["send"]:
+                app.log("本檔案的商品皆已分析過，僅向 AI 查詢寄件廠商與結單日期。")
+            global_info = {}
+            lines = []
+            pool = {}
+
+            def on_product(p):
+                record = accept_ai_product(job, p, pool)
+                dedup.remember(p, accepted=record is not None)
+                if record is not None:
+                    lines.append(OrderLine(global_info, record))
+
+            with profile_stage(profiler, "ai_enrichment", file_path):
+                stream = stream_ai_for_enrichment(
+                    client,
+                    job["csv"],
+                    job["send"],
+                    shipper_list,
+                    brand_keywords,
+                    category1_keywords_sorted,
+                    app.log,
+                    on_product,
+                    debug=debug,
+                    debug_name=job["debug_name"],
+                    recorder=recorder,
+                    source=os.path.basename(file_path),
                 )
+            if stream is None or not (stream.complete or stream.products_seen):
+                # nothing usable came back
+                return finish_file(job, None)
+            save_ai_response(job, stream.text())
+            # the model answers in input order; products it did not get to or sent
+            # back malformed fall back to the Python-extracted data
+            failed = [job["send"][i] for i in stream.failed if i < len(job["send"])]
+            if failed:
+                app.log(
+                    f"AI 回應中有 {len(failed)} 個商品格式錯誤，改用 Python 提取的資料。"
+                )
+                lines.extend(OrderLine(global_info, p) for p in failed)
+            if not stream.complete:
+                remaining = job["send"][stream.products_seen :]
+                app.log(
+                    "AI 回應不完整，保留已收到的 "
+                    f"{stream.products_seen - len(stream.failed)} 個商品，"
+                    f"其餘 {len(remaining)} 個商品僅使用 Python 提取的資料。"
+                )
+                lines.extend(OrderLine(global_info, p) for p in remaining)
+            else:
+                app.log("成功合併 AI 的分析結果。")
+            lines.extend(OrderLine(global_info, p) for p in fan_out_duplicates(job))
+            log_brand_override(job)
+            global_info.update(stream.global_info or {})
+            complete_global_info(job, global_info)
+            app.log(f"成功處理了 {len(lines)} 個商品。")
+            return lines
+
+        parse_file = functools.partial(
+            parse_vendor_file,
+            brand_keywords=list(brand_keywords),
+            track_memory=profiler.track_memory,
+            layout_cache=layout_cache,
+        )
 
-            app.log(f"成功處理了 {len(enriched_products)} 個商品。")
+        # files the GUI started parsing when they were imported
+        pre_parsed = {}
+        if preloader is not None:
+            pre_parsed = preloader.take_parsed(
+                input_files, brand_keywords, profiler.track_memory, layout_cache
+            )
+            if pre_parsed:
+                app.log(f"{len(pre_parsed)} 個檔案已在匯入時於背景開始解析。")
 
-        if all_processed_products:
-            # Build final DataFrame first
-            final_df = build_final_df(
-                all_processed_products,
-                brand_map,
-                category1_map,
-                category1_keywords_sorted,
-                app.log,
+        # a file that fails with one of these is skipped; other errors end the run
+        file_errors = (*ITEM_ERRORS, *READ_ERRORS, openai.OpenAIError)
+
+        def log_pipeline_error(file_path, error):
+            app.log(
+                f"處理檔案 {os.path.basename(file_path)} 時發生錯誤 ({error.stage}): {error.error}"
+            )
+
+        if batch_mode:
+            # parse everything first, then enrich all files in one Batch API job
+            jobs = []
+            for i, file_path, job in FilePipeline(
+                parse_file, prepare_file, logger=app.log, item_errors=file_errors
+            ).run(input_files, ready=pre_parsed):
+                if isinstance(job, PipelineError):
+                    log_pipeline_error(file_path, job)
+                elif job is not None:
+                    jobs.append(job)
+
+            requests = {}
+            for job in jobs:
+                custom_id = f"file-{job['index'] + 1}"
+                job["custom_id"] = custom_id
+                if not needs_ai(job):
+                    continue
+                requests[custom_id] = build_enrichment_request(
+                    job["csv"],
+                    job["send"],
+                    shipper_list,
+                    brand_keywords,
+                    category1_keywords_sorted,
+                )
+                if job["debug_name"]:
+                    save_debug_prompt(requests[custom_id], debug, job["debug_name"])
+
+            batch_results = {}
+            if requests:
+                with profile_stage(profiler, "ai_batch"):
+                    try:
+                        batch_results = run_enrichment_batch(
+                            batch_client,
+                            requests,
+                            app.log,
+                            poll_interval=batch_poll_interval,
+                            recorder=recorder,
+                            jsonl_path=os.path.splitext(output_file)[0]
+                            + "_batch.jsonl",
+                        )
+                    except (openai.OpenAIError, RuntimeError, OSError) as e:
+                        app.log(
+                            f"批次工作失敗: {e}。將僅使用 Python 提取的資料繼續處理。"
+                        )
+
+            for job in jobs:
+                app.log(f"\n--- 合併批次結果: {os.path.basename(job['file_path'])} ---")
+                all_processed_products.extend(
+                    finish_file(job, batch_results.get(job["custom_id"]))
+                )
+        else:
+            # Files are parsed in a process pool while earlier files wait on the AI;
+            # results come back in input order.
+            pipeline = FilePipeline(
+                parse_file, enrich_file, logger=app.log, item_errors=file_errors
             )
+            for i, file_path, result in pipeline.run(input_files, ready=pre_parsed):
+                if isinstance(result, PipelineError):
+                    log_pipeline_error(file_path, result)
+                    continue
+                # Append products to the master list for final processing
+                all_processed_products.extend(result)
 
+        if all_processed_products:
             # Check if GUI provided a Google Sheet/Drive URL
-            try:
-                sheet_url = app.get_sheet_url()
-            except Exception:
-                sheet_url = None
-
-            sheet_id = None
-            base_folder_id = None
-            if sheet_url:
-                # lightweight local extraction to avoid importing gsheets just for parsing
-                import re
-
-                m = re.search(r"/d/([a-zA-Z0-9-_]+)", sheet_url)
-                if m:
-                    sheet_id = m.group(1)
-                else:
-                    m2 = re.search(r"/folders/([a-zA-Z0-9-_]+)", sheet_url)
-                    if m2:
-                        base_folder_id = m2.group(1)
-                    elif re.match(r"^[a-zA-Z0-9-_]{20,}$", sheet_url):
-                        # ambiguous ID: treat as sheet id by default
-                        sheet_id = sheet_url
-
-            # If user provided either a sheet id/url or a Drive folder url/id, attempt Google upload
+            sheet_url = app.get_sheet_url()
+            sheet_id, base_folder_id = parse_sheet_target(sheet_url)
+
+            final_df = None
             if sheet_id or base_folder_id:
-                try:
-                    from gsheets import GSheetsClient
+                # the Sheets upload groups and slices the rows, so build the frame first
+                with profile_stage(profiler, "build_final_df"):
+                    final_df = build_final_df(
+                        all_processed_products,
+                        brand_map,
+                        category1_map,
+                        category1_keywords_sorted,
+                        app.log,
+                        calendar=calendar,
+                        resolver=resolver,
+                    )
 
-                    creds_path = os.path.join(base_dir, "service_account.json")
+            with profile_stage(profiler, "output"):
+                # If user provided either a sheet id/url or a Drive folder url/id, attempt Google upload
+                if sheet_id or base_folder_id:
+                    try:
+                        from gsheets import GSheetsClient
 
-                    if not os.path.exists(creds_path):
-                        app.log(
-                            f"Google Sheets append skipped: service_account.json not found at {creds_path}. Falling back to Excel output."
-                        )
-                        generate_erp_excel(all_processed_products, output_file, app.log)
-                    else:
-                        gs = GSheetsClient(creds_json_path=creds_path)
-                        # group rows by 內部結單日期 year-month（J 欄）
-                        final_df["__ym"] = (
-                            pd.to_datetime(final_df["內部結單日期"], errors="coerce")
-                            .dt.strftime("%Y-%m")
-                            .fillna("")
-                        )
+                        creds_path = os.path.join(base_dir, "service_account.json")
 
-                        groups = final_df.groupby("__ym")
-                        for ym, group in groups:
-                            subdf = group.drop(columns=["__ym"]).reset_index(drop=True)
-                            if not ym:
-                                # No 內部結單日期: if user provided a sheet_id, append there; otherwise fall back to Excel
-                                if sheet_id:
-                                    target_sheet_id = sheet_id
-                                else:
-                                    app.log(
-                                        "Rows without 內部結單日期 cannot be routed to a monthly sheet when only a Drive folder was provided. Writing these rows to Excel fallback."
-                                    )
-                                    group_out = (
-                                        os.path.splitext(output_file)[0]
-                                        + "_nogroup.xlsx"
-                                    )
-                                    try:
-                                        subdf = subdf.astype(str)
-                                        subdf.to_excel(
-                                            group_out, index=False, sheet_name="ERP"
-                                        )
-                                        app.log(
-                                            f"Rows without 內部結單日期 saved to Excel fallback: {group_out}"
-                                        )
-                                    except Exception as ee:
-                                        app.log(
-                                            f"Failed to write Excel fallback for rows without 內部結單日期: {ee}"
-                                        )
-                                    continue
-                            else:
-                                year, mon = ym.split("-")
+                        if not os.path.exists(creds_path):
+                            app.log(
+                                f"Google Sheets append skipped: service_account.json not found at {creds_path}. Falling back to Excel output."
+                            )
+                            generate_erp_excel(final_df, output_file, app.log)
+                        else:
+                            gs = GSheetsClient(
+                                creds_json_path=creds_path, recorder=recorder
+                            )
+                            # split by 內部結單日期 year-month（J 欄）once
+                            partitions = partition_by_month(final_df)
+
+                            # resolve every month's sheet up front with one Drive listing
+                            month_sheet_ids = {}
+                            months = [
+                                tuple(int(x) for x in ym.split("-"))
+                                for ym, _ in partitions
+                                if ym
+                            ]
+                            if months:
                                 try:
-                                    target_sheet_id = gs.ensure_month_sheet(
-                                        int(year),
-                                        int(mon),
+                                    month_sheet_ids = gs.ensure_month_sheets(
+                                        months,
                                         logger=app.log,
                                         base_folder_id=base_folder_id,
                                     )
-                                    if not target_sheet_id:
-                                        app.log(
-                                            f"Could not resolve monthly sheet for {ym}; falling back to main sheet if available."
-                                        )
-                                        target_sheet_id = sheet_id
                                 except Exception as e:
                                     app.log(
-                                        f"Error ensuring month sheet for {ym}: {e}; falling back to main sheet if available."
+                                        f"Error resolving monthly sheets: {e}; falling back to main sheet if available."
                                     )
-                                    target_sheet_id = sheet_id
 
-                            if target_sheet_id:
-                                try:
-                                    # Ensure reference sheets exist before appending
-                                    # gs.ensure_reference_sheet(target_sheet_id, '品牌對照資料查詢', brand_ref_path, ERP_COLUMNS.index('品牌'), app.log)
-                                    # gs.ensure_reference_sheet(target_sheet_id, '廠商基本資料', vendor_ref_path, ERP_COLUMNS.index('廠商'), app.log)
-                                    gs.append_dataframe(target_sheet_id, subdf, app.log)
-                                except Exception as e:
-                                    app.log(
-                                        f"Append to sheet {target_sheet_id} failed: {e}. Writing this group's data to Excel fallback."
-                                    )
-                                    group_out = (
-                                        os.path.splitext(output_file)[0]
-                                        + f"_{ym.replace('-', '')}.xlsx"
-                                    )
-                                    try:
-                                        subdf.to_excel(
-                                            group_out, index=False, sheet_name="ERP"
-                                        )
-                                        app.log(
-                                            f"Group data for {ym} saved to Excel fallback: {group_out}"
-                                        )
-                                    except Exception as ee:
-                                        app.log(
-                                            f"Failed to write Excel fallback for group {ym}: {ee}"
-                                        )
-                            else:
-                                # No target sheet resolved; write fallback
+                            # months are written concurrently; a failing sheet is
+                            # retried and then replaced by an <output>_YYYYMM file
+                            write_mode = app.get_config("SHEETS_WRITE_MODE", "append")
+                            if write_mode not in SHEETS_WRITE_MODES:
                                 app.log(
-                                    f"No target sheet resolved for group {ym}. Writing to Excel fallback."
+                                    f"未知的 SHEETS_WRITE_MODE '{write_mode}'，改用 append。"
                                 )
-                                group_out = (
-                                    os.path.splitext(output_file)[0]
-                                    + f"_{ym.replace('-', '')}.xlsx"
+                                write_mode = "append"
+                            elif write_mode != "append":
+                                app.log(
+                                    f"試算表寫入模式: {write_mode}（依條碼/貨號比對，已存在的商品不重複新增）。"
                                 )
-                                try:
-                                    subdf.to_excel(
-                                        group_out, index=False, sheet_name="ERP"
-                                    )
-                                    app.log(
-                                        f"Group data for {ym} saved to Excel fallback: {group_out}"
+                            sink = OutputSink(app.log)
+                            sink.log_summary(
+                                sink.write(
+                                    route_partitions(
+                                        partitions,
+                                        gs,
+                                        sheet_id,
+                                        month_sheet_ids,
+                                        output_file,
+                                        app.log,
+                                        write_mode=write_mode,
                                     )
-                                except Exception as ee:
-                                    app.log(
-                                        f"Failed to write Excel fallback for group {ym}: {ee}"
-                                    )
-                except Exception as e:
-                    # log and fall back to Excel output
-                    app.log(
-                        f"Google Sheets append failed or unavailable: {e}. Falling back to Excel output."
+                                )
+                            )
+                    except Exception as e:
+                        # log and fall back to Excel output
+                        app.log(
+                            f"Google Sheets append failed or unavailable: {e}. Falling back to Excel output."
+                        )
+                        generate_erp_excel(final_df, output_file, app.log)
+                else:
+                    # rows are streamed into the output file as they are built
+                    generate_erp_excel(
+                        iter_erp_rows(
+                            all_processed_products,
+                            brand_map,
+                            category1_map,
+                            category1_keywords_sorted,
+                            app.log,
+                            calendar=calendar,
+                            resolver=resolver,
+                        ),
+                        output_file,
+                        app.log,
                     )
-                    generate_erp_excel(final_df, output_file, app.log)
-            else:
-                generate_erp_excel(final_df, output_file, app.log)
         else:
             app.log("所有檔案處理完畢，但沒有找到任何有效的商品資料可供輸出。")
 
+        if dedup.total > dedup.sent:
+            app.log(
+                f"跨檔案去重: 共 {dedup.total} 個商品，送交 AI {dedup.sent} 個，"
+                f"{dedup.reused} 個重複商品沿用先前的分析結果"
+                f"（其中 {dedup.from_store} 個來自商品資料庫）。"
+            )
+        if product_store is not None:
+            try:
+                product_store.close()
+            except sqlite3.Error as e:
+                app.log(f"儲存商品資料庫時發生錯誤: {e}")
+        if debug is not None:
+            debug.close()
+        profiler.log_summary(app.log)
+        stages_report = os.path.splitext(output_file)[0] + "_stages.json"
+        try:
+            profiler.write_report(stages_report)
+            app.log(f"各階段耗時報告已儲存至: {stages_report}")
+        except OSError as e:
+            app.log(f"儲存各階段耗時報告時發生錯誤: {e}")
+        profiler.close()
+
+        recorder.log_summary(app.log)
+        if recorder.records:
+            calls_report = os.path.splitext(output_file)[0] + "_calls.json"
+            try:
+                recorder.export_json(calls_report)
+                app.log(f"外部呼叫統計已儲存至: {calls_report}")
+            except OSError as e:
+                app.log(f"儲存外部呼叫統計時發生錯誤: {e}")
+
         messagebox.showinfo("完成", "所有檔案處理完畢！")
 
     except Exception as e:
@@ -503,6 +679,16 @@ def process_files_main(app, api_key, input_files, output_file):
 
 
 if __name__ == "__main__":
+    # needed for the worksheet process pool in the PyInstaller (Windows) build
+    multiprocessing.freeze_support()
+    started = time.perf_counter()
     root = tk.Tk()
     app = App(root)
+    timing = timing_enabled()
+    if timing:
+        root.after_idle(
+            lambda: app.log(f"建立視窗耗時 {time.perf_counter() - started:.2f} 秒。")
+        )
+    # load pandas/openai/... while the user fills in the form
+    root.after(100, lambda: warm_up_imports(logger=app.log if timing else None))
     root.mainloop()
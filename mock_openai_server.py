@@ -0,0 +1,395 @@
+"""Local OpenAI-compatible chat-completions server for offline runs and load tests.
+
+It answers the enrichment prompt (see `ai_api.get_enrichment_prompt`) with
+schema-valid JSON derived from the prompt's own products: the release month is
+normalized to YYYY-MM, the brand and category are the first keywords of the prompt's
+lists found in the product name, and the shipper is the first valid shipper found in
+the file CSV. Other prompts get an empty enrichment object.
+
+Latency, token rate, rate limiting (HTTP 429) and truncated answers can be configured,
+and randomness is seeded so runs are repeatable. Both plain and streamed (SSE)
+responses are supported. Prompt caching is imitated: a prompt that shares a prefix of
+at least 1024 tokens with an earlier one reports that prefix as cached_tokens.
+
+Example:
+    with MockOpenAIServer(latency=0.2, tokens_per_second=200, rate_limit_rate=0.1) as srv:
+        client = openai.OpenAI(api_key="test", base_url=srv.base_url, max_retries=0)
+        ...
+        print(srv.stats.summary())
+
+or from the command line, then set OPENAI_BASE_URL in config.json to the printed URL:
+    python mock_openai_server.py --port 8765 --latency 0.5 --tokens-per-second 100
+"""
+
+import argparse
+import ast
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHARS_PER_TOKEN = 4
+CACHE_MIN_TOKENS = 1024
+CACHE_BLOCK_TOKENS = 128
+STREAM_CHUNK_CHARS = 32
+
+_PRODUCTS_RE = re.compile(
+    r"PRE-EXTRACTED PRODUCTS:\*\*\s*```json\s*(.*?)```", re.DOTALL
+)
+_CSV_RE = re.compile(r"```csv\s*(.*?)```", re.DOTALL)
+_MONTH_RE = re.compile(r"(\d{4})\s*[-./年]\s*(\d{1,2})")
+
+
+def _prompt_list(prompt, title):
+    """The Python-literal list printed after '**<title>:**' in the prompt."""
+    marker = f"**{title}:**"
+    start = prompt.find(marker)
+    if start < 0:
+        return []
+    line = prompt[start + len(marker) :].lstrip().split("\n", 1)[0]
+    try:
+        value = ast.literal_eval(line)
+    except (ValueError, SyntaxError):
+        return []
+    return [str(v) for v in value] if isinstance(value, (list, tuple)) else []
+
+
+def _first_match(text, keywords):
+    low = text.lower()
+    for keyword in keywords:
+        if keyword and keyword.lower() in low:
+            return keyword
+    return ""
+
+
+def _normalize_month(value):
+    match = _MONTH_RE.search(str(value or ""))
+    if not match:
+        return value
+    return f"{match.group(1)}-{int(match.group(2)):02d}"
+
+
+def enrichment_content(prompt):
+    """JSON text of a plausible enrichment answer for `prompt`."""
+    match = _PRODUCTS_RE.search(prompt)
+    try:
+        products = json.loads(match.group(1)) if match else []
+    except json.JSONDecodeError:
+        products = []
+    brands = _prompt_list(prompt, "Valid Brand Keyword List")
+    categories = _prompt_list(prompt, "Valid Category Keyword List")
+    shippers = _prompt_list(prompt, "Valid Shipper List")
+    csv_match = _CSV_RE.search(prompt)
+    csv_text = csv_match.group(1) if csv_match else ""
+
+    for p in products:
+        name = str(p.get("品名", ""))
+        p["預計發售月份"] = _normalize_month(p.get("預計發售月份"))
+        p["偵測到的品牌"] = _first_match(name, brands)
+        p["ai_matched_category_keyword"] = _first_match(name, categories)
+    shipper = next((s for s in shippers if s and s in csv_text), "")
+    return json.dumps(
+        {"global_info": {"寄件廠商": shipper, "結單日期": ""}, "products": products},
+        ensure_ascii=False,
+    )
+
+
+def _tokens(text):
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+class MockStats:
+    """Request counters, keyed by outcome ('ok', 'rate_limited', 'truncated', ...)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = Counter()
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+
+    def add(self, outcome, prompt_tokens=0, completion_tokens=0, cached_tokens=0):
+        with self._lock:
+            self.counts[outcome] += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.cached_tokens += cached_tokens
+
+    def summary(self):
+        with self._lock:
+            return {
+                "requests": sum(self.counts.values()),
+                "outcomes": dict(self.counts),
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "cached_tokens": self.cached_tokens,
+            }
+
+
+class MockOpenAIServer:
+    """OpenAI-compatible /v1/chat/completions on a local port (0 = pick a free one).
+
+    latency:            seconds before the first byte of every answer
+    tokens_per_second:  completion generation speed (None = instant)
+    rate_limit_rate:    probability of answering 429 instead
+    rate_limit_every:   answer every N-th request with 429 (0 = off)
+    truncate_rate:      probability of cutting the answer in half (streams are closed
+                        without [DONE], plain answers end with finish_reason 'length')
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        latency=0.0,
+        tokens_per_second=None,
+        rate_limit_rate=0.0,
+        rate_limit_every=0,
+        truncate_rate=0.0,
+        seed=0,
+    ):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.rate_limit_rate = rate_limit_rate
+        self.rate_limit_every = rate_limit_every
+        self.truncate_rate = truncate_rate
+        self.stats = MockStats()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._request_count = 0
+        self._prompts = []
+        self._thread = None
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def _decide(self):
+        """(rate_limited, truncated) for the next request."""
+        with self._lock:
+            self._request_count += 1
+            limited = bool(
+                self.rate_limit_every
+                and self._request_count % self.rate_limit_every == 0
+            ) or (self._random.random() < self.rate_limit_rate)
+            truncated = self._random.random() < self.truncate_rate
+        return limited, truncated
+
+    def _cached_tokens(self, prompt):
+        """Tokens of the longest prefix shared with an earlier prompt, in cache blocks."""
+        with self._lock:
+            best = max(
+                (len(os.path.commonprefix([prompt, p])) for p in self._prompts),
+                default=0,
+            )
+            self._prompts.append(prompt)
+            del self._prompts[:-32]
+        tokens = best // CHARS_PER_TOKEN
+        if tokens < CACHE_MIN_TOKENS:
+            return 0
+        return tokens // CACHE_BLOCK_TOKENS * CACHE_BLOCK_TOKENS
+
+    def _generation_delay(self, text):
+        if not self.tokens_per_second:
+            return 0.0
+        return _tokens(text) / self.tokens_per_second
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, payload, headers=None):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except json.JSONDecodeError:
+                    self._send_json(
+                        400, {"error": {"message": "invalid JSON", "type": "invalid"}}
+                    )
+                    return
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    server.stats.add("not_found")
+                    self._send_json(
+                        404, {"error": {"message": "not found", "type": "invalid"}}
+                    )
+                    return
+                server._serve_completion(self, body)
+
+        return Handler
+
+    def _serve_completion(self, handler, body):
+        limited, truncated = self._decide()
+        if self.latency:
+            time.sleep(self.latency)
+        if limited:
+            self.stats.add("rate_limited")
+            handler._send_json(
+                429,
+                {
+                    "error": {
+                        "message": "Rate limit reached (mock server)",
+                        "type": "requests",
+                        "code": "rate_limit_exceeded",
+                    }
+                },
+                headers={"Retry-After": "1"},
+            )
+            return
+
+        messages = body.get("messages") or []
+        prompt = messages[-1].get("content", "") if messages else ""
+        content = enrichment_content(prompt)
+        if truncated:
+            content = content[: len(content) // 2]
+        prompt_tokens = _tokens("".join(str(m.get("content", "")) for m in messages))
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": _tokens(content),
+            "total_tokens": prompt_tokens + _tokens(content),
+            "prompt_tokens_details": {"cached_tokens": self._cached_tokens(prompt)},
+        }
+        self.stats.add(
+            "truncated" if truncated else "ok",
+            usage["prompt_tokens"],
+            usage["completion_tokens"],
+            usage["prompt_tokens_details"]["cached_tokens"],
+        )
+        completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+        model = body.get("model", "")
+        if body.get("stream"):
+            self._stream(handler, completion_id, model, content, usage, truncated, body)
+            return
+
+        time.sleep(self._generation_delay(content))
+        handler._send_json(
+            200,
+            {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "length" if truncated else "stop",
+                    }
+                ],
+                "usage": usage,
+            },
+        )
+
+    def _stream(self, handler, completion_id, model, content, usage, truncated, body):
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Cache-Control", "no-cache")
+        handler.send_header("Connection", "close")
+        handler.end_headers()
+        handler.close_connection = True
+
+        def send(choices, usage=None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": choices,
+            }
+            if usage is not None:
+                chunk["usage"] = usage
+            data = json.dumps(chunk, ensure_ascii=False)
+            handler.wfile.write(f"data: {data}\n\n".encode())
+            handler.wfile.flush()
+
+        try:
+            for i in range(0, len(content), STREAM_CHUNK_CHARS):
+                piece = content[i : i + STREAM_CHUNK_CHARS]
+                time.sleep(self._generation_delay(piece))
+                send([{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+            if truncated:
+                # drop the connection mid-answer
+                return
+            send([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            if (body.get("stream_options") or {}).get("include_usage"):
+                send([], usage)
+            handler.wfile.write(b"data: [DONE]\n\n")
+            handler.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--tokens-per-second", type=float, default=None)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-every", type=int, default=0)
+    parser.add_argument("--truncate-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        rate_limit_rate=args.rate_limit_rate,
+        rate_limit_every=args.rate_limit_every,
+        truncate_rate=args.truncate_rate,
+        seed=args.seed,
+    )
+    print(f"Mock OpenAI server listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(server.stats.summary(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
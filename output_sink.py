@@ -0,0 +1,220 @@
+"""Partitioned output of the final ERP rows to Google Sheets and files.
+
+`final_df` is split once by the year-month of 內部結單日期. Every partition gets a list
+of targets: its monthly spreadsheet (or the main sheet), then a file next to the
+output (`<output>_YYYYMM.xlsx`, `<output>_nogroup.xlsx`, same extension as the output
+file). The partitions are written concurrently. A failing target is retried if writing
+it again cannot duplicate rows (files, and sheets in skip/upsert mode), then the next
+target is used, so one bad sheet delays only its own month. A failed append is not
+retried: the rows may have reached the sheet before the error, so it goes straight to
+the file. Writes to the same spreadsheet are serialized, because each one reads the
+sheet first.
+
+    sink = OutputSink(app.log)
+    results = sink.write(route_partitions(...))
+    sink.log_summary(results)
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from erp_writer import WRITE_ERRORS, write_erp_file
+from gsheets import SHEET_ERRORS
+
+MAX_WORKERS = 4
+TARGET_RETRIES = 1
+RETRY_DELAY_S = 2.0
+NO_GROUP = ""
+# SHEETS_WRITE_MODE in config.json: append every row, skip rows whose 條碼/貨號 is
+# already in the sheet, or update those rows in place
+SHEETS_WRITE_MODES = ("append", "skip", "upsert")
+
+
+def partition_by_month(final_df):
+    """[(YYYY-MM or NO_GROUP, rows)] split on 內部結單日期; months first, in order."""
+    months = (
+        pd.to_datetime(final_df["內部結單日期"], errors="coerce", format="mixed")
+        .dt.strftime("%Y-%m")
+        .fillna(NO_GROUP)
+    )
+    partitions = [
+        (ym, group.reset_index(drop=True))
+        for ym, group in final_df.groupby(months, sort=True)
+    ]
+    # rows without a date go last
+    return sorted(partitions, key=lambda p: p[0] == NO_GROUP)
+
+
+class SheetTarget:
+    """A spreadsheet; `mode` is one of SHEETS_WRITE_MODES."""
+
+    errors = SHEET_ERRORS  # a failed write; the next target is tried
+
+    def __init__(self, client, sheet_id, mode="append"):
+        self.client = client
+        self.sheet_id = sheet_id
+        self.mode = mode
+        self.lock_key = ("sheet", sheet_id)
+        # skip/upsert match rows by 條碼/貨號, so repeating them adds nothing twice
+        self.idempotent = mode != "append"
+
+    def __str__(self):
+        return f"試算表 {self.sheet_id}"
+
+    def write(self, df, logger):
+        if self.mode == "append":
+            self.client.append_dataframe(self.sheet_id, df, logger)
+        else:
+            self.client.upsert_dataframe(
+                self.sheet_id, df, logger, update_existing=self.mode == "upsert"
+            )
+
+
+class FileTarget:
+    idempotent = True  # the file is rewritten as a whole
+    errors = WRITE_ERRORS
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_key = ("file", os.path.abspath(path))
+
+    def __str__(self):
+        return f"檔案 {self.path}"
+
+    def write(self, df, logger):
+        if not write_erp_file(self.path, df):
+            logger(f"沒有資料，未寫入 {self.path}")
+            return
+        logger(f"已寫入 {len(df)} 列至 {self.path}")
+
+
+def fallback_path(output_file, ym):
+    base, ext = os.path.splitext(output_file)
+    suffix = ym.replace("-", "") if ym else "nogroup"
+    return f"{base}_{suffix}{ext}"
+
+
+def route_partitions(
+    partitions,
+    client,
+    sheet_id,
+    month_sheet_ids,
+    output_file,
+    logger,
+    write_mode="append",
+):
+    """[(ym, rows, targets)]: the sheet for each month, then its fallback file."""
+    routed = []
+    for ym, df in partitions:
+        if ym == NO_GROUP:
+            target_sheet_id = sheet_id
+            if not sheet_id:
+                logger(
+                    "Rows without 內部結單日期 cannot be routed to a monthly sheet when only a Drive folder was provided. Writing these rows to Excel fallback."
+                )
+        else:
+            year, mon = ym.split("-")
+            target_sheet_id = month_sheet_ids.get((int(year), int(mon)))
+            if not target_sheet_id:
+                logger(
+                    f"Could not resolve monthly sheet for {ym}; falling back to main sheet if available."
+                )
+                target_sheet_id = sheet_id
+            if not target_sheet_id:
+                logger(
+                    f"No target sheet resolved for group {ym}. Writing to Excel fallback."
+                )
+        targets = []
+        if target_sheet_id:
+            targets.append(SheetTarget(client, target_sheet_id, write_mode))
+        targets.append(FileTarget(fallback_path(output_file, ym)))
+        routed.append((ym, df, targets))
+    return routed
+
+
+class OutputSink:
+    def __init__(
+        self,
+        logger,
+        max_workers=MAX_WORKERS,
+        retries=TARGET_RETRIES,
+        retry_delay=RETRY_DELAY_S,
+    ):
+        self.logger = logger
+        self.max_workers = max_workers
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def _lock(self, key):
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def write(self, routed):
+        """Write every (ym, rows, targets) partition; returns one result dict each."""
+        if not routed:
+            return []
+        workers = max(1, min(self.max_workers, len(routed)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(lambda p: self._write_partition(*p), routed))
+
+    def _write_partition(self, ym, df, targets):
+        label = ym or "未分組"
+
+        def log(message):
+            self.logger(f"[{label}] {message}")
+
+        started = time.perf_counter()
+        result = {
+            "partition": label,
+            "rows": len(df),
+            "target": None,
+            "attempts": 0,
+            "fallback": False,
+            "error": None,
+        }
+        for position, target in enumerate(targets):
+            retries = self.retries if target.idempotent else 0
+            for attempt in range(retries + 1):
+                result["attempts"] += 1
+                try:
+                    with self._lock(target.lock_key):
+                        target.write(df, log)
+                except target.errors as e:
+                    result["error"] = e
+                    if attempt < retries:
+                        log(
+                            f"寫入 {target} 失敗 ({e})，{self.retry_delay:g} 秒後重試。"
+                        )
+                        time.sleep(self.retry_delay)
+                    else:
+                        log(f"寫入 {target} 失敗: {e}")
+                    continue
+                result.update(target=str(target), fallback=position > 0, error=None)
+                result["seconds"] = time.perf_counter() - started
+                return result
+        result["seconds"] = time.perf_counter() - started
+        return result
+
+    def log_summary(self, results):
+        if not results:
+            return
+        lines = []
+        for r in results:
+            if r["target"] is None:
+                status = f"失敗: {r['error']}"
+            else:
+                status = f"{r['target']}" + ("（備援）" if r["fallback"] else "")
+            retries = r["attempts"] - 1
+            lines.append(
+                f"  {r['partition']}: {r['rows']} 列 -> {status}"
+                f"（{r['seconds']:.1f} 秒"
+                + (f"，重試/改寫 {retries} 次" if retries else "")
+                + "）"
+            )
+        self.logger("輸出摘要:\n" + "\n".join(lines))
@@ -0,0 +1,179 @@
+"""Staged file pipeline: process-pool parsing overlapped with I/O-bound enrichment.
+
+    parse (process pool) --> bounded queue --> enrich (I/O thread) --> assembly (caller)
+
+While file N waits on the model, files N+1.. are parsed in worker processes. The queue
+bounds how far parsing can run ahead, so at most `queue_size` parsed files wait in
+memory. Results are handed back to the caller in input order.
+
+`parse_fn(item)` must be a picklable top-level function; `enrich_fn(index, item,
+parsed)` runs in the enrichment thread and may do network I/O. Items that were
+already parsed elsewhere (see `preload.Preloader`) can be passed in as Futures.
+
+An exception listed in `item_errors` fails only its own item (a PipelineError in its
+place); any other exception is a bug and is re-raised from `run`.
+"""
+
+import os
+import queue
+import threading
+from concurrent.futures import BrokenExecutor, Future, ProcessPoolExecutor
+
+_DONE = object()
+# what failing to parse or enrich one file typically raises
+ITEM_ERRORS = (OSError, ValueError, LookupError, RuntimeError)
+
+
+class PipelineError(Exception):
+    """Wraps an exception raised while parsing or enriching one item."""
+
+    def __init__(self, stage, item, error):
+        super().__init__(f"{stage} failed for {item}: {error}")
+        self.stage = stage
+        self.item = item
+        self.error = error
+
+
+def _completed(errors, fn, *args):
+    """Run fn inline and wrap the outcome (or one of `errors`) in a finished Future."""
+    future = Future()
+    try:
+        future.set_result(fn(*args))
+    except errors as e:
+        future.set_exception(e)
+    return future
+
+
+class FilePipeline:
+    def __init__(
+        self,
+        parse_fn,
+        enrich_fn,
+        max_workers=None,
+        queue_size=2,
+        logger=None,
+        item_errors=ITEM_ERRORS,
+    ):
+        self.parse_fn = parse_fn
+        self.item_errors = item_errors
+        self.enrich_fn = enrich_fn
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self.logger = logger
+
+    def _log(self, message):
+        if self.logger:
+            self.logger(message)
+
+    def _start_pool(self, n_items):
+        if n_items < 2:
+            # nothing to overlap with; skip the process start-up cost
+            return None
+        workers = max(1, min(n_items, self.max_workers or os.cpu_count() or 1))
+        try:
+            return ProcessPoolExecutor(max_workers=workers)
+        except (OSError, NotImplementedError) as e:
+            self._log(f"無法啟動解析行程池 ({e})，改為在同一行程中解析。")
+            return None
+
+    def run(self, items, ready=None):
+        """Yield (index, item, result) in input order; result may be a PipelineError.
+
+        `ready` maps items to Futures of their parse result; those are not parsed again.
+        """
+        items = list(items)
+        ready = ready or {}
+        pool = self._start_pool(sum(1 for item in items if item not in ready))
+        parsed_q = queue.Queue(maxsize=self.queue_size)
+        done_q = queue.Queue()
+        stop = threading.Event()
+        failure = []  # an unexpected exception of a stage thread, for the caller
+
+        def submit(item):
+            if item in ready:
+                return ready[item]
+            if pool is not None:
+                try:
+                    return pool.submit(self.parse_fn, item)
+                except RuntimeError as e:
+                    self._log(f"解析行程池無法使用 ({e})，改為在同一行程中解析。")
+            return _completed(self.item_errors, self.parse_fn, item)
+
+        def produce():
+            try:
+                for index, item in enumerate(items):
+                    if stop.is_set():
+                        break
+                    # blocks while `queue_size` parsed files are waiting for enrichment
+                    parsed_q.put((index, item, submit(item)))
+            except BaseException as e:
+                failure.append(e)
+                raise
+            finally:
+                parsed_q.put(_DONE)
+
+        def enrich():
+            try:
+                enrich_items()
+            except BaseException as e:
+                failure.append(e)
+                raise
+            finally:
+                done_q.put(_DONE)
+
+        def enrich_items():
+            while True:
+                entry = parsed_q.get()
+                if entry is _DONE:
+                    break
+                index, item, future = entry
+                try:
+                    try:
+                        parsed = future.result()
+                    except BrokenExecutor as e:
+                        # a worker process died; parse this item here instead
+                        self._log(f"解析行程中斷 ({e})，改為在同一行程中解析。")
+                        parsed = self.parse_fn(item)
+                except self.item_errors as e:
+                    done_q.put((index, item, PipelineError("parse", item, e)))
+                    continue
+                try:
+                    result = self.enrich_fn(index, item, parsed)
+                except self.item_errors as e:
+                    result = PipelineError("enrich", item, e)
+                done_q.put((index, item, result))
+
+        producer = threading.Thread(target=produce, daemon=True)
+        enricher = threading.Thread(target=enrich, daemon=True)
+        producer.start()
+        enricher.start()
+        try:
+            pending = {}
+            next_index = 0
+            while True:
+                entry = done_q.get()
+                if entry is _DONE:
+                    break
+                pending[entry[0]] = entry
+                while next_index in pending:
+                    yield pending.pop(next_index)
+                    next_index += 1
+            for index in sorted(pending):
+                yield pending[index]
+            if failure:
+                raise failure[0]
+        finally:
+            stop.set()
+            # unblock the producer if the caller stopped early
+            while producer.is_alive():
+                try:
+                    parsed_q.get_nowait()
+                except queue.Empty:
+                    producer.join(0.05)
+            try:
+                # the drain may have eaten the end marker the enricher waits for
+                parsed_q.put_nowait(_DONE)
+            except queue.Full:
+                pass
+            if pool is not None:
+                pool.shutdown(wait=True, cancel_futures=True)
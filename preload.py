@@ -0,0 +1,171 @@
+"""Background preloading while the user fills in the form.
+
+At launch `Preloader.start` reads the reference xlsx files (`reference_data`) in a
+thread, and `parse_files` starts parsing the vendor files in a process pool as soon as
+they are imported. `process_files_main` then takes the loaded reference data and the
+parse futures instead of doing the work itself; a file that was changed after it was
+imported, or a reference file changed since loading, is simply read again.
+
+This module stays light (no pandas) because gui.py imports it before the window shows.
+"""
+
+import os
+import sys
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+
+def resolve_base_dir():
+    """Directory of the reference files, service_account.json and config.json."""
+    if getattr(sys, "frozen", False) and hasattr(sys, "_MEIPASS"):
+        # Running in a PyInstaller bundle (one-file or one-folder)
+        return sys._MEIPASS
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def resolve_data_dir():
+    """Next to the exe when frozen: the files the program writes and holidays.txt."""
+    if getattr(sys, "frozen", False):
+        return os.path.dirname(sys.executable)
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def _file_stamp(path):
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+
+def profile_memory(get_config):
+    """PROFILE_MEMORY in config.json: parse under tracemalloc (off by default).
+
+    The GUI's background parse and `process_files_main` must agree on it, or the
+    pre-parsed files are not reused.
+    """
+    return bool(get_config("PROFILE_MEMORY", False))
+
+
+class Preloader:
+    def __init__(self, base_dir, max_workers=None):
+        self.base_dir = base_dir
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._references = None  # Future of a reference_data.ReferenceData
+        self._wanted = []  # files of the latest import still to be submitted
+        self._parsed = {}  # path -> (file stamp, parse options, Future)
+
+    def start(self):
+        """Start loading the reference data in a background thread."""
+        with self._lock:
+            if self._references is None:
+                self._references = self._load_in_thread()
+
+    def _load_in_thread(self):
+        def load():
+            from reference_data import load_reference_data
+
+            return load_reference_data(self.base_dir)
+
+        # the executor hands any exception of `load` to the Future
+        pool = ThreadPoolExecutor(max_workers=1)
+        try:
+            return pool.submit(load)
+        finally:
+            pool.shutdown(wait=False)
+
+    def reference_data(self):
+        """The loaded reference data; waits for the background load if still running."""
+        from reference_data import load_reference_data
+
+        self.start()
+        with self._lock:
+            future = self._references
+        try:
+            data = future.result()
+        except (ImportError, OSError):
+            # loaded again below, so the error reaches the caller
+            data = None
+        if data is None or data.is_stale():
+            data = load_reference_data(self.base_dir)
+            done = Future()
+            done.set_result(data)
+            with self._lock:
+                self._references = done
+        return data
+
+    def parse_files(self, paths, track_memory=False, layout_cache=None):
+        """Start parsing `paths` in the background, dropping earlier unused results."""
+        paths = list(paths)
+        with self._lock:
+            for path, (_, _, future) in list(self._parsed.items()):
+                if path not in paths:
+                    future.cancel()
+                    del self._parsed[path]
+            self._wanted = [p for p in paths if p not in self._parsed]
+            wanted = bool(self._wanted)
+        if wanted:
+            threading.Thread(
+                target=self._submit, args=(track_memory, layout_cache), daemon=True
+            ).start()
+
+    def _submit(self, track_memory, layout_cache):
+        # parsing needs the brand keywords, so wait for the reference data first
+        try:
+            brand_keywords = list(self.reference_data().brand_keywords)
+            from data_processor import parse_vendor_file
+        except ImportError:
+            return
+        options = (tuple(brand_keywords), track_memory, layout_cache)
+        with self._lock:
+            paths = list(self._wanted)
+            if not paths:
+                return
+            workers = max(1, min(len(paths), self.max_workers or os.cpu_count() or 1))
+            try:
+                pool = ProcessPoolExecutor(max_workers=workers)
+            except (OSError, NotImplementedError):
+                return
+            try:
+                for path in paths:
+                    if path not in self._wanted:
+                        continue
+                    future = pool.submit(
+                        parse_vendor_file,
+                        path,
+                        brand_keywords=brand_keywords,
+                        track_memory=track_memory,
+                        layout_cache=layout_cache,
+                    )
+                    self._parsed[path] = (_file_stamp(path), options, future)
+                self._wanted = []
+            finally:
+                # the workers exit once the submitted files are parsed
+                pool.shutdown(wait=False)
+
+    def take_parsed(self, paths, brand_keywords, track_memory=False, layout_cache=None):
+        """{path: Future} of the files parsed with these options and unchanged since.
+
+        Taken and unusable entries are forgotten, and files not submitted yet are no
+        longer submitted, since the caller now parses them itself.
+        """
+        options = (tuple(brand_keywords), track_memory, layout_cache)
+        ready = {}
+        with self._lock:
+            for path in paths:
+                entry = self._parsed.pop(path, None)
+                if entry is None:
+                    continue
+                stamp, parsed_with, future = entry
+                if (
+                    parsed_with == options
+                    and stamp is not None
+                    and stamp == _file_stamp(path)
+                    and not future.cancelled()
+                ):
+                    ready[path] = future
+                else:
+                    future.cancel()
+            self._wanted = [p for p in self._wanted if p not in paths]
+        return ready
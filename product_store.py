@@ -0,0 +1,111 @@
+"""Local SQLite store of AI enrichment results, keyed by barcode / SKU.
+
+The same products come back month after month. Once the model has enriched a product,
+its fields (see `dedup.ENRICHED_FIELDS`) are stored under the product key, together
+with the version of the reference data (brand / category lists and model) they were
+produced with and the raw 預計發售月份 they were normalized from. A later run with the
+same reference data reuses them, and the product is not sent to the AI again. A
+product whose release month text changed is sent again.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+STORE_FILENAME = "product_store.sqlite"
+FLUSH_EVERY = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    key_type     TEXT NOT NULL,
+    key          TEXT NOT NULL,
+    ref_version  TEXT NOT NULL,
+    raw_month    TEXT NOT NULL,
+    fields       TEXT NOT NULL,
+    product_name TEXT,
+    updated_at   TEXT NOT NULL,
+    PRIMARY KEY (key_type, key, ref_version)
+)
+"""
+
+
+def reference_version(*parts):
+    """Short hash of the reference data (keyword lists, model name, ...)."""
+    data = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()[:16]
+
+
+def month_text(value):
+    """The raw 預計發售月份 as compared and stored (stripped, "" for None)."""
+    return "" if value is None else str(value).strip()
+
+
+class ProductStore:
+    """Enrichment results for one reference-data version, backed by SQLite.
+
+    Entries of that version are loaded once on open; new ones are buffered and
+    written every FLUSH_EVERY puts and on flush() / close().
+    """
+
+    def __init__(self, path, ref_version):
+        self.path = path
+        self.ref_version = ref_version
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+        self._known = {}
+        self._pending = []
+        for key_type, key, raw_month, fields in self._conn.execute(
+            "SELECT key_type, key, raw_month, fields FROM products WHERE ref_version = ?",
+            (ref_version,),
+        ):
+            self._known[(key_type, key)] = (raw_month, json.loads(fields))
+
+    def __len__(self):
+        return len(self._known)
+
+    def get(self, key, raw_month):
+        """Stored fields for `key` if they were made from the same raw release month."""
+        entry = self._known.get(key)
+        if entry is None or entry[0] != month_text(raw_month):
+            return None
+        return dict(entry[1])
+
+    def put(self, key, raw_month, fields, product_name=None):
+        raw_month = month_text(raw_month)
+        with self._lock:
+            self._known[key] = (raw_month, dict(fields))
+            self._pending.append(
+                (
+                    key[0],
+                    key[1],
+                    self.ref_version,
+                    raw_month,
+                    json.dumps(fields, ensure_ascii=False),
+                    product_name,
+                    datetime.now().isoformat(timespec="seconds"),
+                )
+            )
+            if len(self._pending) >= FLUSH_EVERY:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._pending:
+            return
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?, ?, ?)",
+                self._pending,
+            )
+        self._pending = []
+
+    def close(self):
+        self.flush()
+        self._conn.close()
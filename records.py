@@ -0,0 +1,125 @@
+"""Compact record types for extracted products.
+
+A plain dict per product costs several hundred bytes before any values are stored, and
+every product used to be wrapped in another dict together with its file's global_info.
+`ProductRecord` keeps the known fields in __slots__ (other keys the AI may return go
+into a small overflow dict) and `OrderLine` pairs a product with the global_info dict
+of its file, which is shared by reference between all lines of that file.
+
+Parsed products in one file share a string pool, so repeated values such as the
+release month are only stored once.
+
+Both types keep the dict-style access the rest of the code uses (`p.get("品名")`,
+`p["final_brand_info"] = ...`, `line["product_data"]`).
+"""
+
+PRODUCT_FIELDS = (
+    "品名",
+    "貨號",
+    "國際條碼",
+    "預計發售月份",
+    "備註",
+    "起始進價",
+    "建議售價",
+    "偵測到的品牌",
+    "final_brand_info",
+    "來源工作表",
+)
+
+# worksheet a product was extracted from
+SHEET_SOURCE_KEY = "來源工作表"
+
+# Fields whose values repeat a lot within a file (months, notes, prices); with a pool,
+# equal strings are stored once per file instead of once per product.
+POOLED_FIELDS = frozenset(("預計發售月份", "備註", "起始進價", "建議售價"))
+
+_MISSING = object()
+
+
+class ProductRecord:
+    __slots__ = PRODUCT_FIELDS + ("_extra",)
+
+    def __init__(self, data=None, pool=None, **fields):
+        """`pool` is an optional dict used to share equal strings of POOLED_FIELDS."""
+        self._extra = None
+        for key, value in dict(data or {}, **fields).items():
+            if pool is not None and key in POOLED_FIELDS and isinstance(value, str):
+                value = pool.setdefault(value, value)
+            self[key] = value
+
+    @classmethod
+    def from_dict(cls, data):
+        return data if isinstance(data, cls) else cls(data)
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key in PRODUCT_FIELDS:
+            object.__setattr__(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def get(self, key, default=None):
+        if key in PRODUCT_FIELDS:
+            return getattr(self, key, default)
+        if self._extra is not None:
+            return self._extra.get(key, default)
+        return default
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def keys(self):
+        keys = [k for k in PRODUCT_FIELDS if hasattr(self, k)]
+        if self._extra:
+            keys.extend(self._extra)
+        return keys
+
+    def items(self):
+        return [(k, self[k]) for k in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, (ProductRecord, dict)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __repr__(self):
+        return f"ProductRecord({self.to_dict()!r})"
+
+
+class OrderLine:
+    """One product of one file; `global_info` is the file's shared dict."""
+
+    __slots__ = ("global_info", "product_data")
+
+    def __init__(self, global_info, product_data):
+        self.global_info = global_info
+        self.product_data = product_data
+
+    def __getitem__(self, key):
+        if key == "global_info":
+            return self.global_info
+        if key == "product_data":
+            return self.product_data
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
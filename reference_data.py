@@ -0,0 +1,213 @@
+"""Reference lists read from the xlsx files next to the program.
+
+    廠商名單.xlsx            shipper names offered to the AI (寄件廠商), 廠商代碼
+    品牌對照資料查詢.xlsx    brand keyword / name -> ERP code / display name
+    類別1資料查詢.xlsx       category keyword -> 類1, name suffix and command
+
+`load_reference_data` collects its log lines instead of writing them, so the data can
+be loaded in a background thread (see `preload.Preloader`) and the lines shown when a
+run uses it.
+"""
+
+import os
+
+import pandas as pd
+
+from excel_reader import READ_ERRORS
+
+REFERENCE_FILES = ("廠商名單.xlsx", "品牌對照資料查詢.xlsx", "類別1資料查詢.xlsx")
+
+
+def file_stamps(base_dir):
+    """(mtime, size) of each reference file, None for a missing one."""
+    stamps = {}
+    for name in REFERENCE_FILES:
+        try:
+            st = os.stat(os.path.join(base_dir, name))
+            stamps[name] = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            stamps[name] = None
+    return stamps
+
+
+class ReferenceData:
+    def __init__(self, base_dir):
+        self.base_dir = base_dir
+        self.stamps = file_stamps(base_dir)
+        self.shipper_list = []
+        self.brand_map = {}
+        self.brand_keywords = []
+        self.category1_map = {}
+        self.category1_keywords_sorted = []
+        self.vendor_codes = {}
+        self.brand_name_codes = {}
+        self.logs = []
+
+    def code_resolver(self):
+        return CodeResolver(self.vendor_codes, self.brand_name_codes)
+
+    def is_stale(self):
+        """Whether a reference file was changed, added or removed since loading."""
+        return file_stamps(self.base_dir) != self.stamps
+
+
+class CodeResolver:
+    """廠商 / 品牌 codes looked up here instead of by formulas in the output sheet.
+
+    Follows the output's lookup formulas: 廠商 is the 廠商代碼 of the row's 寄件廠商,
+    品牌 the code of the brand whose 品牌名稱 equals 品名 (the part before '|' if there
+    is one). Matching ignores case, like MATCH in the spreadsheet.
+    """
+
+    def __init__(self, vendor_codes, brand_name_codes):
+        self.vendor_codes = vendor_codes
+        self.brand_name_codes = brand_name_codes
+
+    def vendor_code(self, shipper):
+        if not shipper:
+            return None
+        return self.vendor_codes.get(str(shipper).strip().casefold())
+
+    def brand_code(self, product_name):
+        if not product_name:
+            return None
+        name = str(product_name)
+        if "|" in name:
+            name = name.split("|", 1)[0]
+        return self.brand_name_codes.get(name.strip().casefold())
+
+
+def load_shipper_list(path, logger):
+    """(shipper names, {casefolded name: 廠商代碼 from the first column})."""
+    shipper_df = pd.read_excel(path)
+    # If explicit header exists, use it. Otherwise prefer column D (index 3) then C (index 2).
+    names = None
+    if "寄件廠商" in shipper_df.columns:
+        names = shipper_df["寄件廠商"].dropna().astype(str)
+    else:
+        for idx in (3, 2):
+            try:
+                col = shipper_df.iloc[:, idx].dropna().astype(str)
+                if not col.empty:
+                    names = col
+                    logger(f"注意: 未找到 '寄件廠商' 標題，改從第 {idx + 1} 欄讀取。")
+                    break
+            except IndexError:
+                continue
+    if names is None:
+        return [], {}
+    codes = shipper_df.iloc[:, 0]
+
+    # Expand comma-separated values in each cell into individual tokens
+    expanded = []
+    vendor_codes = {}
+    for row, cell in names.items():
+        code = codes[row]
+        for part in [p.strip() for p in str(cell).split(",")]:
+            if part:
+                expanded.append(part)
+                if pd.notna(code) and str(code).strip():
+                    vendor_codes.setdefault(part.casefold(), str(code).strip())
+
+    # Remove duplicates while preserving order
+    seen = set()
+    ordered = []
+    for v in expanded:
+        if v not in seen:
+            seen.add(v)
+            ordered.append(v)
+    return ordered, vendor_codes
+
+
+def load_brand_map(path):
+    """(brand_map, brand_keywords, {casefolded 品牌名稱: code}) from columns A-D."""
+    brand_map = {}
+    brand_name_codes = {}
+    # Use headers=None and iloc to be robust against missing headers
+    brand_df = pd.read_excel(path, sheet_name=0, header=None)
+    brand_keywords = brand_df.iloc[:, 0].dropna().astype(str).tolist()
+
+    for _, row in brand_df.iterrows():
+        keyword = row.iloc[0]  # Column A
+        code = row.iloc[1]  # Column B
+
+        # Column D for display name, check if it exists
+        display_name = None
+        if brand_df.shape[1] > 3:
+            display_name = row.iloc[3]
+
+        if pd.notna(keyword) and pd.notna(code):
+            brand_map[str(keyword).lower()] = {
+                "code": str(code),
+                "display_name": str(display_name) if pd.notna(display_name) else None,
+            }
+        # Column C (brand name) is what the 品牌 lookup formula matches 品名 against
+        if brand_df.shape[1] > 2 and pd.notna(code) and pd.notna(row.iloc[2]):
+            name = str(row.iloc[2]).strip().casefold()
+            if name:
+                brand_name_codes.setdefault(name, str(code))
+    return brand_map, brand_keywords, brand_name_codes
+
+
+def load_category1_map(path):
+    """(category1_map, keywords sorted longest first)."""
+    category1_map = {}
+    cat1_df = pd.read_excel(path, sheet_name=0, header=None)
+    # Sort keywords by length descending to match specific terms first
+    keywords = cat1_df.iloc[:, 0].dropna().astype(str).tolist()
+    keywords_sorted = sorted(keywords, key=len, reverse=True)
+
+    for _, row in cat1_df.iterrows():
+        keyword = row.iloc[0]
+        cat1_val = row.iloc[1] if cat1_df.shape[1] > 1 else None
+        suffix = row.iloc[3] if cat1_df.shape[1] > 3 else None
+        command = row.iloc[5] if cat1_df.shape[1] > 5 else None  # Column F
+
+        if pd.notna(keyword):
+            category1_map[str(keyword)] = {
+                "類1": str(cat1_val) if pd.notna(cat1_val) else "",
+                "suffix": str(suffix) if pd.notna(suffix) else "",
+                "command": str(command) if pd.notna(command) else "",
+            }
+    return category1_map, keywords_sorted
+
+
+def load_reference_data(base_dir):
+    """Read the three reference files in `base_dir`; errors are logged, not raised."""
+    data = ReferenceData(base_dir)
+    log = data.logs.append
+
+    shipper_file = os.path.join(base_dir, "廠商名單.xlsx")
+    if os.path.exists(shipper_file):
+        try:
+            data.shipper_list, data.vendor_codes = load_shipper_list(shipper_file, log)
+            log(f"成功讀取 {len(data.shipper_list)} 個寄件廠商（已展開逗號分隔值）。")
+        except (*READ_ERRORS, IndexError) as e:
+            log(f"讀取 '廠商名單.xlsx' 時發生錯誤: {e}")
+    else:
+        log("警告: '廠商名單.xlsx' 不存在。")
+
+    brand_ref_file = os.path.join(base_dir, "品牌對照資料查詢.xlsx")
+    if os.path.exists(brand_ref_file):
+        try:
+            data.brand_map, data.brand_keywords, data.brand_name_codes = load_brand_map(
+                brand_ref_file
+            )
+            log(f"成功讀取 {len(data.brand_map)} 個品牌關鍵字與對照資料。")
+        except (*READ_ERRORS, IndexError) as e:
+            log(f"讀取 '品牌對照資料查詢.xlsx' 時發生錯誤: {e}")
+    else:
+        log("警告: '品牌對照資料查詢.xlsx' 不存在，將無法自動偵測品牌。")
+
+    category1_ref_file = os.path.join(base_dir, "類別1資料查詢.xlsx")
+    if os.path.exists(category1_ref_file):
+        try:
+            data.category1_map, data.category1_keywords_sorted = load_category1_map(
+                category1_ref_file
+            )
+            log(f"成功讀取 {len(data.category1_map)} 個類別關鍵字與對照資料。")
+        except (*READ_ERRORS, IndexError) as e:
+            log(f"讀取 '類別1資料查詢.xlsx' 時發生錯誤: {e}")
+    else:
+        log("警告: '類別1資料查詢.xlsx' 不存在，將無法自動處理類別與品名重構。")
+    return data
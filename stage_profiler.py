@@ -0,0 +1,164 @@
+"""Per-stage timing and peak-memory instrumentation for the processing pipeline.
+
+Usage:
+    profiler = StageProfiler()
+    with profiler.stage("excel_parse", file="0126結單.xlsx"):
+        ...
+    profiler.log_summary(logger)
+    profiler.write_report("out_stages.json")
+
+Each stage records wall time, CPU time of the running thread and the peak memory
+allocated above the level at stage entry (via tracemalloc, only with
+track_memory=True: tracing slows allocation-heavy stages such as Excel parsing several
+times over, so it is off by default). Stages may be nested; a parent's peak includes
+its children's. Memory figures are process-wide, so they are approximate while other
+threads allocate at the same time.
+"""
+
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+
+class StageProfiler:
+    def __init__(self, track_memory=False):
+        self.track_memory = track_memory
+        self.records = []
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._started_tracemalloc = False
+        if track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextmanager
+    def stage(self, name, file=None):
+        stack = self._stack()
+        memory = self.track_memory and tracemalloc.is_tracing()
+        frame = {"base": 0, "peak": 0}
+        if memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                # keep the parent's peak before resetting the counter for this stage
+                stack[-1]["peak"] = max(stack[-1]["peak"], peak)
+            tracemalloc.reset_peak()
+            frame["base"] = frame["peak"] = current
+        stack.append(frame)
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.thread_time() - cpu_start
+            stack.pop()
+            peak_bytes = 0
+            if memory:
+                _, peak = tracemalloc.get_traced_memory()
+                frame["peak"] = max(frame["peak"], peak)
+                peak_bytes = frame["peak"] - frame["base"]
+                if stack:
+                    stack[-1]["peak"] = max(stack[-1]["peak"], frame["peak"])
+            self.add_record(
+                {
+                    "stage": name,
+                    "file": os.path.basename(file) if file else None,
+                    "wall_s": wall,
+                    "cpu_s": cpu,
+                    "peak_alloc_bytes": peak_bytes,
+                }
+            )
+
+    def add_record(self, record):
+        with self._lock:
+            self.records.append(record)
+
+    def merge(self, records):
+        """Add records produced elsewhere (e.g. by a profiler in a worker process)."""
+        with self._lock:
+            self.records.extend(records)
+
+    def summary(self):
+        with self._lock:
+            records = list(self.records)
+
+        def aggregate(keyfunc):
+            groups = {}
+            for r in records:
+                g = groups.setdefault(
+                    keyfunc(r),
+                    {"count": 0, "wall_s": 0.0, "cpu_s": 0.0, "peak_alloc_bytes": 0},
+                )
+                g["count"] += 1
+                g["wall_s"] += r["wall_s"]
+                g["cpu_s"] += r["cpu_s"]
+                g["peak_alloc_bytes"] = max(
+                    g["peak_alloc_bytes"], r["peak_alloc_bytes"]
+                )
+            return groups
+
+        by_file = {}
+        for r in records:
+            if r["file"]:
+                stages = by_file.setdefault(r["file"], {})
+                s = stages.setdefault(
+                    r["stage"], {"wall_s": 0.0, "cpu_s": 0.0, "peak_alloc_bytes": 0}
+                )
+                s["wall_s"] += r["wall_s"]
+                s["cpu_s"] += r["cpu_s"]
+                s["peak_alloc_bytes"] = max(
+                    s["peak_alloc_bytes"], r["peak_alloc_bytes"]
+                )
+        return {
+            "started_at": self.started_at,
+            "elapsed_s": time.time() - self.started_at,
+            "memory_tracked": self.track_memory,
+            "by_stage": aggregate(lambda r: r["stage"]),
+            "by_file": by_file,
+        }
+
+    def log_summary(self, logger):
+        summary = self.summary()
+        if not summary["by_stage"]:
+            return
+        logger(f"各階段耗時 (總計 {summary['elapsed_s']:.1f} 秒):")
+        for stage, s in sorted(
+            summary["by_stage"].items(), key=lambda kv: kv[1]["wall_s"], reverse=True
+        ):
+            line = f"  {stage}: {s['wall_s']:.2f}s (CPU {s['cpu_s']:.2f}s)"
+            if summary["memory_tracked"]:
+                line += f", 峰值記憶體 {s['peak_alloc_bytes'] / 1024 / 1024:.1f} MB"
+            logger(line)
+
+    def write_report(self, path):
+        with self._lock:
+            records = list(self.records)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"summary": self.summary(), "stages": records},
+                f,
+                ensure_ascii=False,
+                indent=2,
+            )
+
+    def close(self):
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+
+def profile_stage(profiler, name, file=None):
+    """`profiler.stage(...)`, or a no-op context when no profiler is given."""
+    if profiler is None:
+        return nullcontext()
+    return profiler.stage(name, file=file)
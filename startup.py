@@ -0,0 +1,134 @@
+"""Cold-start helpers: background warm-up of the heavy modules and import timing.
+
+main.py only imports tkinter and the GUI before the window is shown. pandas, openai,
+openpyxl and the processing modules are imported by `process_files_main` when a run
+starts, and `warm_up_imports` loads them in a background thread right after the window
+appears so that the first run does not wait for them either.
+
+With VOP_IMPORT_TIMING=1 the app logs how long it took until the window was shown and
+how long each warm-up import took. To catch regressions from the command line, each
+module is imported in a fresh interpreter:
+
+    python startup.py --repeat 3 --json imports.json
+    python startup.py --baseline imports.json   # fail if >20% slower
+"""
+
+import argparse
+import importlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+# in the order process_files_main needs them; the GUI modules come first for the CLI
+GUI_MODULES = ("tkinter", "gui", "main")
+WARMUP_MODULES = (
+    "pandas",
+    "openpyxl",
+    "openai",
+    "data_processor",
+    "erp_writer",
+    "ai_api",
+    "batch_enrichment",
+)
+TIMING_ENV = "VOP_IMPORT_TIMING"
+
+
+def timing_enabled():
+    return os.environ.get(TIMING_ENV, "") not in ("", "0")
+
+
+def warm_up_imports(modules=WARMUP_MODULES, logger=None):
+    """Import `modules` in a daemon thread; returns (thread, {module: seconds})."""
+    timings = {}
+
+    def run():
+        for name in modules:
+            start = time.perf_counter()
+            try:
+                importlib.import_module(name)
+            except ImportError as e:
+                if logger:
+                    logger(f"預先載入模組 {name} 失敗: {e}")
+                continue
+            timings[name] = time.perf_counter() - start
+        if logger:
+            total = sum(timings.values())
+            details = ", ".join(f"{k} {v:.2f}s" for k, v in timings.items())
+            logger(f"背景預先載入模組完成，共 {total:.2f} 秒 ({details})。")
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread, timings
+
+
+def cold_import_time(module):
+    """Seconds to import `module` in a fresh interpreter."""
+    code = (
+        "import time; t = time.perf_counter(); "
+        f"import {module}; print(time.perf_counter() - t)"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def measure_imports(modules, repeat):
+    results = []
+    for module in modules:
+        times = [cold_import_time(module) for _ in range(repeat)]
+        result = {"module": module, "median_s": statistics.median(times)}
+        results.append(result)
+        print(f"{module:20s} {result['median_s']:.3f}s")
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Return the imports that got slower than baseline * (1 + tolerance)."""
+    previous = {r["module"]: r for r in baseline}
+    regressions = []
+    for r in results:
+        old = previous.get(r["module"])
+        if old and r["median_s"] > old["median_s"] * (1 + tolerance):
+            regressions.append((r, old))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold import times.")
+    parser.add_argument("--modules", nargs="+", default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", dest="json_out", help="write results to this file")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    modules = args.modules or list(GUI_MODULES + WARMUP_MODULES)
+    results = measure_imports(modules, args.repeat)
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for r, old in regressions:
+            print(
+                f"REGRESSION import {r['module']}: "
+                f"{old['median_s']:.3f}s -> {r['median_s']:.3f}s"
+            )
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
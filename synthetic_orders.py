@@ -0,0 +1,221 @@
+"""Generator for synthetic vendor order workbooks.
+
+The workbooks look like the price lists vendors send: a merged title row, a 結單日 line,
+header wording picked from `data_processor.HEADER_MAP` (sometimes split over two rows),
+extra columns the parser should ignore, Japanese/Chinese product names with brand
+mentions, and section/note rows without prices that must be filtered out.
+
+    python synthetic_orders.py out.xlsx --rows 10000 --seed 1
+"""
+
+import argparse
+import random
+
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import PatternFill
+from openpyxl.worksheet.cell_range import CellRange
+
+from data_processor import HEADER_MAP
+
+DEFAULT_BRANDS = [
+    "Good Smile Company",
+    "FREEing",
+    "MegaHouse",
+    "BANDAI SPIRITS",
+    "Kotobukiya",
+    "ALTER",
+    "Max Factory",
+    "COSPA",
+    "Square Enix",
+    "APEX",
+]
+
+# Header wording per key; only wordings the parser can find unambiguously.
+HEADER_CHOICES = {
+    "品名": ["品名", "商品名", "中文品名", "品項"],
+    "貨號": ["SKU", "貨號", "商品貨號"],
+    "國際條碼": ["國際條碼", "JAN CODE", "JanCode", "條碼"],
+    "預計發售月份": ["發售日", "預定到貨", "預計上市日", "發貨日"],
+    "備註": ["備註", "備考", "附註"],
+    "起始進價": ["東海成本"],
+    "建議售價": ["東海售價"],
+}
+assert set(HEADER_CHOICES) == set(HEADER_MAP)
+
+EXTRA_HEADERS = ["定價", "入數", "箱入數", "尺寸", "材質", "圖片"]
+
+SERIES = [
+    "ねんどろいど",
+    "figma",
+    "POP UP PARADE",
+    "1/7 比例模型",
+    "S.H.Figuarts",
+    "ARTFX J",
+    "一番賞",
+    "景品",
+    "G.E.M.系列",
+    "黏土人",
+]
+CHARACTERS = [
+    "初音ミク",
+    "竈門炭治郎",
+    "孫悟空",
+    "アーニャ・フォージャー",
+    "五條悟",
+    "蒙其·D·魯夫",
+    "レム",
+    "綾波レイ",
+    "雷姆",
+    "芙莉蓮",
+]
+VARIANTS = ["", "DX版", "再販", "限定版", "Ver.2", "通常版", "特典付き", "豪華版"]
+RELEASE_FORMATS = ["{y}年{m}月", "{y}年{m}月底", "{y}-{m:02d}-01 00:00:00", "{y}.{m}"]
+
+
+def _product_name(rng, brand):
+    parts = [rng.choice(SERIES), rng.choice(CHARACTERS), rng.choice(VARIANTS)]
+    if rng.random() < 0.6:
+        parts.insert(0, brand)
+    return " ".join(p for p in parts if p)
+
+
+def _formatted_blank(ws):
+    cell = WriteOnlyCell(ws)
+    cell.fill = PatternFill("solid", fgColor="FFFFCC")
+    return cell
+
+
+def generate_vendor_workbook(
+    path,
+    n_rows,
+    seed=0,
+    brands=None,
+    vendor_title="萬榮玩具 預購訂單",
+    split_header=None,
+    note_row_ratio=0.03,
+    inflate_rows=0,
+    inflate_cols=0,
+):
+    """Write a vendor order workbook with `n_rows` product rows to `path`.
+
+    `inflate_rows` / `inflate_cols` append that many empty but formatted rows/columns,
+    the way vendor sheets often end up with a used range far beyond their data.
+
+    Returns metadata: the header wording used, the header rows and the number of rows
+    that carry both prices (i.e. what `extract_products_from_excel` should return).
+    """
+    rng = random.Random(seed)
+    brands = list(brands or DEFAULT_BRANDS)
+    if split_header is None:
+        split_header = rng.random() < 0.5
+
+    headers = {key: rng.choice(choices) for key, choices in HEADER_CHOICES.items()}
+    columns = list(headers) + rng.sample(EXTRA_HEADERS, k=rng.randint(1, 3))
+    rng.shuffle(columns)
+    width = len(columns)
+
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("訂單")
+    rows_written = 0
+
+    def append(values):
+        nonlocal rows_written
+        ws.append(values)
+        rows_written += 1
+
+    # title block: merged title, order deadline, a blank spacer or two
+    ws.merged_cells.add(CellRange(min_col=1, min_row=1, max_col=width, max_row=1))
+    append([vendor_title] + [None] * (width - 1))
+    append([f"結單日: {rng.randint(1, 12)}/{rng.randint(1, 28)}"])
+    for _ in range(rng.randint(0, 2)):
+        append([])
+
+    # header rows; when split, the two price columns sit one row below the others
+    header_row = rows_written
+    price_keys = {"起始進價", "建議售價"}
+    if split_header:
+        append([headers.get(c, c) if c not in price_keys else "東海" for c in columns])
+        append([headers[c] if c in price_keys else None for c in columns])
+    else:
+        append([headers.get(c, c) for c in columns])
+
+    valid = 0
+    for i in range(n_rows):
+        if rng.random() < note_row_ratio:
+            # section / note rows have no prices and must be skipped by the parser
+            append([f"※ {rng.choice(SERIES)} 系列 — 數量有限，售完為止"])
+            continue
+        brand = rng.choice(brands)
+        year = rng.choice([2025, 2026, 2027])
+        month = rng.randint(1, 12)
+        cost = rng.randint(200, 20000)
+        values = {
+            "品名": _product_name(rng, brand),
+            "貨號": f"{brand[:3].upper()}-{seed:02d}{i:06d}",
+            "國際條碼": f"45{rng.randint(10**10, 10**11 - 1)}",
+            "預計發售月份": rng.choice(RELEASE_FORMATS).format(y=year, m=month),
+            "備註": rng.choice(["", "", "", "預購特典", f"{brand} 官方授權", "限量"]),
+            "起始進價": cost,
+            "建議售價": int(cost * rng.uniform(1.2, 1.8)),
+        }
+        if rng.random() < 0.02:
+            # occasionally a price is missing; those rows are not products
+            values["建議售價"] = None
+        else:
+            valid += 1
+        row = []
+        for c in columns:
+            if c in values:
+                row.append(values[c])
+            elif c in EXTRA_HEADERS:
+                row.append(rng.choice(["", "12", "1/7", "PVC", "ABS"]))
+        if inflate_cols:
+            row = row + [_formatted_blank(ws)] * inflate_cols
+        append(row)
+
+    for _ in range(inflate_rows):
+        append([_formatted_blank(ws)] * (width + inflate_cols))
+
+    wb.save(path)
+    return {
+        "path": path,
+        "rows": n_rows,
+        "valid_products": valid,
+        "headers": headers,
+        "columns": columns,
+        "header_row": header_row,
+        "split_header": split_header,
+        "brands": brands,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic vendor order workbook."
+    )
+    parser.add_argument("output", help="path of the .xlsx file to write")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--inflate-rows", type=int, default=0, help="trailing formatted empty rows"
+    )
+    parser.add_argument(
+        "--inflate-cols", type=int, default=0, help="trailing formatted empty columns"
+    )
+    args = parser.parse_args()
+    meta = generate_vendor_workbook(
+        args.output,
+        args.rows,
+        seed=args.seed,
+        inflate_rows=args.inflate_rows,
+        inflate_cols=args.inflate_cols,
+    )
+    print(
+        f"Wrote {args.output}: {meta['rows']} rows, {meta['valid_products']} valid products, "
+        f"header row {meta['header_row']} ({'split' if meta['split_header'] else 'single'})."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""dedup.ProductDeduplicator across the files of one run."""
+
+from dedup import ProductDeduplicator
+
+
+def _product(jan, month, price="1000"):
+    return {"國際條碼": jan, "品名": "figure", "預計發售月份": month, "起始進價": price}
+
+
+def _answer(product, month):
+    """What the model returns for `product`: the month normalized, AI fields added."""
+    return {**product, "預計發售月份": month, "偵測到的品牌": "萬代"}
+
+
+def test_same_jan_with_another_month_is_sent_again():
+    dedup = ProductDeduplicator()
+    first_file = [_product("4549660123456", "2026年3月")]
+    second_file = [
+        _product("4549660123456", "2026年5月"),
+        _product("4549660123456", "2026年3月", price="1100"),
+    ]
+
+    to_send, duplicates = dedup.split(first_file)
+    assert (to_send, duplicates) == (first_file, [])
+    dedup.remember(_answer(first_file[0], "2026-03"))
+
+    to_send, duplicates = dedup.split(second_file)
+    assert to_send == second_file[:1]
+    assert duplicates == second_file[1:]
+    dedup.remember(_answer(second_file[0], "2026-05"))
+
+    merged = dedup.fan_out(second_file[1])
+    assert merged["預計發售月份"] == "2026-03"
+    assert merged["起始進價"] == "1100"
+
+
+def test_rejected_answer_is_not_reused_for_the_next_month():
+    dedup = ProductDeduplicator()
+    products = [
+        _product("4549660123456", "2026年3月"),
+        _product("4549660123456", "2026年5月"),
+        _product("4549660123456", "2026年3月"),
+    ]
+
+    to_send, duplicates = dedup.split(products)
+    assert to_send == products[:2]
+    dedup.remember(_answer(products[0], "2026-03"), accepted=False)
+    dedup.remember(_answer(products[1], "2026-05"))
+
+    assert dedup.fan_out(duplicates[0]) is None
+    assert dedup.fan_out(products[1])["預計發售月份"] == "2026-05"
@@ -0,0 +1,228 @@
+"""gsheets.GSheetsClient against the in-memory fake_google backend."""
+
+import pandas as pd
+import pytest
+
+from data_processor import ERP_COLUMNS
+from fake_google import FakeGoogleBackend
+from gsheets import month_sheet_name
+
+
+def _log(message):
+    pass
+
+
+def _rows(*products):
+    """ERP rows with the given (條碼, 貨號, 品名) and all other columns empty."""
+    return pd.DataFrame(
+        [
+            {**dict.fromkeys(ERP_COLUMNS, ""), "條碼": bc, "貨號": sku, "品名": name}
+            for bc, sku, name in products
+        ],
+        columns=ERP_COLUMNS,
+    )
+
+
+def _column(values, name):
+    index = values[0].index(name)
+    return [row[index] if len(row) > index else "" for row in values[1:]]
+
+
+@pytest.fixture
+def drive():
+    backend = FakeGoogleBackend()
+    base = backend.add_folder("究極進化版")
+    template = backend.add_spreadsheet(
+        "複製用範本-究極進化", parent=base, header=ERP_COLUMNS
+    )
+    return backend, base, template
+
+
+def test_ensure_month_sheets_copies_missing_months_once(drive):
+    backend, base, _ = drive
+    gs = backend.gsheets_client()
+    months = [(2025, 3), (2025, 4), (2026, 1)]
+
+    first = gs.ensure_month_sheets(months, logger=_log, base_folder_id=base)
+    assert sorted(first) == months
+    assert backend.stats.requests["drive.files.copy"] == 3
+    names = {backend.spreadsheets[sid]["title"] for sid in first.values()}
+    assert names == {month_sheet_name(y, m) for y, m in months}
+
+    second = gs.ensure_month_sheets(months, logger=_log, base_folder_id=base)
+    assert second == first
+    assert backend.stats.requests["drive.files.copy"] == 3
+
+
+def test_ensure_month_sheets_lists_drive_once_per_run(drive):
+    backend, base, _ = drive
+    gs = backend.gsheets_client()
+    gs.ensure_month_sheets(
+        [(2025, m) for m in range(1, 13)], logger=_log, base_folder_id=base
+    )
+
+    for months in ([(2025, 1)], [(2025, m) for m in range(1, 13)]):
+        before = backend.stats.requests["drive.files.list"]
+        gs.ensure_month_sheets(months, logger=_log, base_folder_id=base)
+        # year folders + monthly sheets, however many existing months are asked for
+        assert backend.stats.requests["drive.files.list"] - before == 2
+
+
+def test_ensure_month_sheet_finds_base_folder_by_name(drive):
+    backend, _, _ = drive
+    gs = backend.gsheets_client()
+    sheet_id = gs.ensure_month_sheet(2025, 3, logger=_log)
+    assert backend.spreadsheets[sheet_id]["title"] == month_sheet_name(2025, 3)
+    assert gs.ensure_month_sheet(2025, 3, logger=_log) == sheet_id
+
+
+def test_append_dataframe_writes_after_last_barcode_row():
+    backend = FakeGoogleBackend()
+    existing = [
+        [
+            "待匯" if c == "ERP" else "4900000000001" if c == "條碼" else ""
+            for c in ERP_COLUMNS
+        ],
+        [
+            "待匯" if c == "ERP" else "4900000000002" if c == "條碼" else ""
+            for c in ERP_COLUMNS
+        ],
+        # a row with notes only; the next append starts after the last 條碼
+        ["" if c != "備註" else "memo" for c in ERP_COLUMNS],
+    ]
+    sheet_id = backend.add_spreadsheet("m", header=ERP_COLUMNS, rows=existing)
+    gs = backend.gsheets_client()
+
+    gs.append_dataframe(sheet_id, _rows(("4900000000003", "", "new")), _log)
+
+    values = backend.worksheet_values(sheet_id)
+    assert _column(values, "條碼")[:3] == [
+        "4900000000001",
+        "4900000000002",
+        "4900000000003",
+    ]
+    assert _column(values, "品名")[2] == "new"
+
+
+def test_append_dataframe_follows_sheet_header_order():
+    backend = FakeGoogleBackend()
+    header = ["ERP", "GD", "平台前導", "品名", "條碼"]
+    sheet_id = backend.add_spreadsheet("m", header=header)
+    gs = backend.gsheets_client()
+
+    gs.append_dataframe(sheet_id, _rows(("4900000000001", "A-1", "figure")), _log)
+
+    assert backend.worksheet_values(sheet_id)[1] == [
+        "",
+        "",
+        "",
+        "figure",
+        "4900000000001",
+    ]
+
+
+def _sheet_row(barcode, sku, name):
+    return [
+        {"ERP": "待匯", "條碼": barcode, "貨號": sku, "品名": name}.get(c, "")
+        for c in ERP_COLUMNS
+    ]
+
+
+@pytest.fixture
+def stocked_sheet():
+    """A sheet holding products A and B."""
+    backend = FakeGoogleBackend()
+    sheet_id = backend.add_spreadsheet(
+        "m",
+        header=ERP_COLUMNS,
+        rows=[
+            _sheet_row("4900000000001", "A-1", "old A"),
+            _sheet_row("4900000000002", "B-1", "old B"),
+        ],
+    )
+    return backend, sheet_id
+
+
+def test_skip_leaves_existing_rows_untouched(stocked_sheet):
+    backend, sheet_id = stocked_sheet
+    gs = backend.gsheets_client()
+    batch = _rows(
+        ("4900000000001", "A-1", "new A"),
+        ("4900000000003", "C-1", "new C"),
+    )
+
+    gs.upsert_dataframe(sheet_id, batch, _log)
+    gs.upsert_dataframe(sheet_id, batch, _log)
+
+    values = backend.worksheet_values(sheet_id)
+    assert _column(values, "條碼") == [
+        "4900000000001",
+        "4900000000002",
+        "4900000000003",
+    ]
+    assert _column(values, "品名") == ["old A", "old B", "new C"]
+
+
+def test_upsert_rewrites_matched_row_in_place(stocked_sheet):
+    backend, sheet_id = stocked_sheet
+    gs = backend.gsheets_client()
+
+    gs.upsert_dataframe(
+        sheet_id,
+        _rows(("4900000000002", "B-1", "new B"), ("4900000000003", "C-1", "new C")),
+        _log,
+        update_existing=True,
+    )
+
+    values = backend.worksheet_values(sheet_id)
+    assert _column(values, "條碼") == [
+        "4900000000001",
+        "4900000000002",
+        "4900000000003",
+    ]
+    assert _column(values, "品名") == ["old A", "new B", "new C"]
+
+
+@pytest.mark.parametrize(
+    ("update_existing", "kept"), [(False, "first"), (True, "second")]
+)
+def test_same_product_twice_in_one_batch_is_written_once(
+    stocked_sheet, update_existing, kept
+):
+    backend, sheet_id = stocked_sheet
+    gs = backend.gsheets_client()
+
+    gs.upsert_dataframe(
+        sheet_id,
+        _rows(("4900000000003", "C-1", "first"), ("4900000000003", "C-1", "second")),
+        _log,
+        update_existing=update_existing,
+    )
+
+    values = backend.worksheet_values(sheet_id)
+    assert _column(values, "條碼") == [
+        "4900000000001",
+        "4900000000002",
+        "4900000000003",
+    ]
+    assert _column(values, "品名")[2] == kept
+
+
+@pytest.mark.parametrize("update_existing", [False, True])
+def test_rows_without_barcode_or_sku_are_always_appended(
+    stocked_sheet, update_existing
+):
+    backend, sheet_id = stocked_sheet
+    gs = backend.gsheets_client()
+
+    gs.upsert_dataframe(
+        sheet_id,
+        _rows(("", "", "loose 1"), ("4900000000001", "A-1", "A"), ("", "", "loose 2")),
+        _log,
+        update_existing=update_existing,
+    )
+
+    values = backend.worksheet_values(sheet_id)
+    names = _column(values, "品名")
+    assert names[2:] == ["loose 1", "loose 2"]
+    assert _column(values, "條碼") == ["4900000000001", "4900000000002", "", ""]
@@ -0,0 +1,89 @@
+"""json_stream.EnrichmentStreamParser fed an answer in arbitrary chunks."""
+
+import json
+import random
+
+import pytest
+
+from json_stream import EnrichmentStreamParser
+
+GLOBAL_INFO = {"寄件廠商": "萬榮", "結單日期": "2026-11-20"}
+
+
+def _answer(products):
+    """An enrichment answer; `products` items that are str are inserted verbatim."""
+    items = [
+        p if isinstance(p, str) else json.dumps(p, ensure_ascii=False) for p in products
+    ]
+    return (
+        '{"global_info": '
+        + json.dumps(GLOBAL_INFO, ensure_ascii=False)
+        + ', "products": ['
+        + ", ".join(items)
+        + "]}"
+    )
+
+
+def _feed(parser, text, rng):
+    """Feed `text` in random-sized chunks; returns the products handed back."""
+    products = []
+    i = 0
+    while i < len(text):
+        size = rng.randint(1, 12)
+        products.extend(parser.feed(text[i : i + size]))
+        i += size
+    return products
+
+
+def _products(n):
+    return [
+        {"品名": f'商品 {i} {{"括號"}}', "條碼": f"4580{i:09d}", "備註": "a]b}c\\"}
+        for i in range(n)
+    ]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_chunks_return_every_product(seed):
+    products = _products(8)
+    parser = EnrichmentStreamParser()
+
+    received = _feed(parser, _answer(products), random.Random(seed))
+
+    assert received == products
+    assert parser.products_seen == 8
+    assert parser.failed == []
+    assert parser.global_info == GLOBAL_INFO
+    assert parser.complete
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_malformed_product_counts_towards_position(seed):
+    products = _products(6)
+    # element 2 is an object the JSON decoder rejects (trailing comma)
+    items = products[:2] + ['{"品名": "壞掉的", }'] + products[2:]
+    parser = EnrichmentStreamParser()
+
+    received = _feed(parser, _answer(items), random.Random(seed))
+
+    assert received == products
+    assert parser.products_seen == 7
+    assert parser.failed == [2]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_broken_off_answer_reports_where_it_stopped(seed):
+    products = _products(6)
+    items = products[:1] + ["{bad}"] + products[1:]
+    text = _answer(items)
+    # cut inside the fifth element
+    cut = text.index(json.dumps(products[3], ensure_ascii=False)) + 5
+    parser = EnrichmentStreamParser()
+
+    received = _feed(parser, text[:cut], random.Random(seed))
+
+    assert received == products[:3]
+    assert parser.products_seen == 4
+    assert parser.failed == [1]
+    assert not parser.complete
+    # the tail main.py falls back on is exactly the unanswered part of the request
+    assert items[parser.products_seen :] == products[3:]
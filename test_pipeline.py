@@ -0,0 +1,42 @@
+"""pipeline.FilePipeline: per-item failures vs unexpected errors."""
+
+import pytest
+
+from pipeline import FilePipeline, PipelineError
+
+
+def _parse(item):
+    if item == "unreadable":
+        raise OSError("cannot open")
+    return item.upper()
+
+
+def _enrich(index, item, parsed):
+    if item == "bad answer":
+        raise ValueError("malformed")
+    if item == "bug":
+        raise AttributeError("oops")
+    return parsed
+
+
+def _run(items):
+    return list(FilePipeline(_parse, _enrich, max_workers=1).run(items))
+
+
+def test_item_errors_fail_only_their_item():
+    results = _run(["a", "unreadable", "bad answer", "b"])
+
+    assert [r[1] for r in results] == ["a", "unreadable", "bad answer", "b"]
+    assert results[0][2] == "A"
+    assert isinstance(results[1][2], PipelineError)
+    assert results[1][2].stage == "parse"
+    assert isinstance(results[2][2], PipelineError)
+    assert results[2][2].stage == "enrich"
+    assert results[3][2] == "B"
+
+
+# the failing stage thread also reports the error through threading.excepthook
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_unexpected_error_is_raised_to_the_caller():
+    with pytest.raises(AttributeError):
+        _run(["a", "bug", "b"])
@@ -0,0 +1,36 @@
+"""preload.Preloader: files parsed on import are reused by the run."""
+
+import time
+from types import SimpleNamespace
+
+from preload import Preloader, profile_memory
+
+
+def _wait_for_submit(preloader, path, timeout=30):
+    deadline = time.monotonic() + timeout
+    while path not in preloader._parsed:
+        assert time.monotonic() < deadline, "the background parse was never submitted"
+        time.sleep(0.01)
+
+
+def test_default_config_reuses_the_import_parse(tmp_path, monkeypatch):
+    path = str(tmp_path / "訂單.xlsx")
+    (tmp_path / "訂單.xlsx").write_bytes(b"")
+    references = SimpleNamespace(brand_keywords=["萬代"])
+    monkeypatch.setattr(Preloader, "reference_data", lambda self: references)
+    config = {}  # no PROFILE_MEMORY
+    layout_cache = str(tmp_path / "layout_cache.sqlite")
+    preloader = Preloader(str(tmp_path), max_workers=1)
+
+    # what App.import_files does
+    preloader.parse_files(
+        [path], track_memory=profile_memory(config.get), layout_cache=layout_cache
+    )
+    _wait_for_submit(preloader, path)
+    submitted = preloader._parsed[path][2]
+    # what process_files_main does
+    ready = preloader.take_parsed(
+        [path], references.brand_keywords, profile_memory(config.get), layout_cache
+    )
+
+    assert ready == {path: submitted}
@@ -10,11 +10,13 @@ a = Analysis(
         ('品牌對照資料查詢.xlsx', '.'),
         ('類別1資料查詢.xlsx', '.')
     ],
-    hiddenimports=['gspread', 'google.oauth2.credentials'],
+    hiddenimports=['gspread', 'google.oauth2.credentials', 'python_calamine', 'xlsxwriter'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    # optional extras pandas/openpyxl would pull in if they are installed in the build
+    # environment; leaving them out keeps the one-file exe smaller and faster to unpack
+    excludes=['matplotlib', 'IPython', 'jedi', 'notebook', 'pytest', 'scipy', 'sqlalchemy', 'tables', 'PyQt5', 'PySide6'],
     noarchive=False,
     optimize=0,
 )